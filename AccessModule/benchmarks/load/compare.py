@@ -0,0 +1,93 @@
+"""
+compare.py
+
+Compares the results of two runs of the load benchmark (run.py), workload by workload: the
+throughput, the p50, p95 and p99 latencies and the peak RSS, with their relative change. The
+exit status is 1 if any workload regressed by more than `--threshold` (a lower throughput, or a
+higher p95 latency or peak RSS), so the comparison can gate a change in CI.
+
+    python compare.py baseline.json results.json [--threshold 0.1]
+"""
+
+import argparse
+import json
+import sys
+from typing import List, Optional
+
+# Metric, path in the results of a workload, and whether higher is better
+METRICS = [
+    ("req/s", ("throughput_rps",), True),
+    ("p50 ms", ("latency_ms", "p50"), False),
+    ("p95 ms", ("latency_ms", "p95"), False),
+    ("p99 ms", ("latency_ms", "p99"), False),
+    ("RSS MiB", ("peak_rss_bytes",), False),
+]
+# Metrics that fail the comparison when they regress
+GATED = ("req/s", "p95 ms", "RSS MiB")
+
+
+def _get(result: dict, path: tuple) -> Optional[float]:
+    for key in path:
+        result = result.get(key) if isinstance(result, dict) else None
+    return result
+
+
+def _format(metric: str, value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    if metric == "RSS MiB":
+        value = value / 2 ** 20
+    return f"{value:.1f}"
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> List[str]:
+    """
+    Print the comparison table of two runs.
+
+    Returns:
+        List[str]: The regressions beyond the threshold.
+    """
+    regressions = []
+    rows = [["workload"] + [f"{metric} (change)" for metric, _, _ in METRICS]]
+    for name, result in current["workloads"].items():
+        previous = baseline["workloads"].get(name)
+        row = [name]
+        for metric, path, higher_is_better in METRICS:
+            value = _get(result, path)
+            before = _get(previous, path) if previous else None
+            if value is None or not before:
+                row.append(_format(metric, value))
+                continue
+            change = (value - before) / before
+            row.append(f"{_format(metric, value)} ({change:+.1%})")
+            if metric in GATED and (-change if higher_is_better else change) > threshold:
+                regressions.append(f"{name}: {metric} {_format(metric, before)} -> {_format(metric, value)} ({change:+.1%})")
+        if result.get("errors"):
+            regressions.append(f"{name}: {result['errors']} errors {result.get('errors_by_status')}")
+        rows.append(row)
+
+    widths = [max(len(row[column]) for row in rows) for column in range(len(rows[0]))]
+    for row in rows:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)))
+    for name in baseline["workloads"].keys() - current["workloads"].keys():
+        print(f"{name}: not run")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two runs of the load benchmark")
+    parser.add_argument("baseline", help="Results of the reference run (JSON)")
+    parser.add_argument("current", help="Results of the run to check (JSON)")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative change considered a regression")
+    arguments = parser.parse_args()
+
+    with open(arguments.baseline) as buffer:
+        baseline = json.load(buffer)
+    with open(arguments.current) as buffer:
+        current = json.load(buffer)
+    if baseline["meta"]["arguments"] != current["meta"]["arguments"]:
+        print("Warning: the runs were made with different arguments", file=sys.stderr)
+    regressions = compare(baseline, current, arguments.threshold)
+    if regressions:
+        print("\nRegressions:\n" + "\n".join(regressions))
+        sys.exit(1)
@@ -0,0 +1,523 @@
+"""
+run.py
+
+End-to-end load benchmark of the AccessModule. It starts the in-memory Orion and QuantumLeap
+stand-in (standin.py) and the AccessModule under gunicorn (with the worker settings of the
+Docker image), in a temporary directory, and drives these workloads with concurrent clients:
+
+- timeseries_insert: `POST /insert/timeseries` with batches of `--batch-size` observations.
+- generic_insert: `POST /insert/generic`, one entity per request.
+- table_upload_{rows}: `POST /insert/table` with a CSV of each of the `--table-rows` sizes.
+- file_upload_{size} and file_download_{size}: `POST /insert/file` and `GET /download` of a
+  file of each of the `--file-sizes` sizes.
+- catalog_page: `POST /datacatalog/page` over `--catalogs` catalogs.
+- query_{json,csv}: `POST /query/` of a generic catalog of `--query-entities` entities, the
+  same query every time (answered from the results cache after the first one).
+- query_{json,csv}_uncached: The same query with a different `limit` (above the number of
+  entities) every time, so the cache is missed and every request reads Orion.
+- query_timeseries_csv: `POST /query/` of the time series inserted by timeseries_insert.
+
+The heavier sizes run fewer requests: `--requests` for 100 table rows and 64 KiB files,
+scaled down in proportion to the size (20 requests at least).
+
+For each workload the results report the throughput, the latency percentiles (p50, p95, p99),
+the errors and the peak RSS of the server processes (the sum over the gunicorn master and its
+workers, sampled every 100 ms from /proc, so only on Linux). The payloads are generated from
+`--seed`, so two runs with the same arguments send the same requests.
+
+    python run.py --output results.json [--workloads query_csv,query_json] [--latency 0.002]
+    python compare.py baseline.json results.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+BENCHMARK_PATH = os.path.dirname(os.path.abspath(__file__))
+SOURCE_PATH = os.path.join(BENCHMARK_PATH, "..", "..", "src")
+CONTEXT_PATH = os.path.join(BENCHMARK_PATH, "..", "..", "context")
+USERNAME = "bench"
+PASSWORD = "bench-password"
+RSS_INTERVAL = 0.1
+MIN_REQUESTS = 20
+PERCENTILES = (50, 95, 99)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(url: str, process: subprocess.Popen, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args[0]} exited with status {process.returncode}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} not ready after {timeout} seconds")
+
+
+def _stop(process: subprocess.Popen):
+    if process.poll() is None:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def _process_tree(pid: int) -> List[int]:
+    parents: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat:
+                # The command name may contain spaces, the fields after it don't
+                ppid = int(stat.read().rpartition(")")[2].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        parents.setdefault(ppid, []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(parents.get(current, []))
+    return tree
+
+
+def _rss(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+class RssMonitor(threading.Thread):
+    """Samples the RSS of a process and its descendants, keeping the peak since the last reset."""
+
+    def __init__(self, pid: int):
+        super().__init__(name="rss-monitor", daemon=True)
+        self.pid = pid
+        self.peak = 0
+        self.available = os.path.exists(f"/proc/{pid}/status")
+        self._stopped = threading.Event()
+
+    def sample(self) -> int:
+        rss = sum(_rss(pid) for pid in _process_tree(self.pid))
+        self.peak = max(self.peak, rss)
+        return rss
+
+    def reset(self) -> Optional[int]:
+        """The peak RSS since the last reset, None if it can't be measured."""
+        if not self.available:
+            return None
+        self.sample()
+        peak, self.peak = self.peak, 0
+        return peak
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def run(self):
+        while self.available and not self._stopped.wait(RSS_INTERVAL):
+            self.sample()
+
+
+class Workload:
+    """A named request, sent `count` times by concurrent clients. `send` receives the session and the request index."""
+
+    def __init__(self, name: str, count: int, send: Callable[[requests.Session, int], requests.Response],
+                 description: str):
+        self.name = name
+        self.count = count
+        self.send = send
+        self.description = description
+
+
+def _percentile(latencies: List[float], percentile: float) -> float:
+    # Nearest-rank percentile, the latencies are sorted
+    rank = max(1, -(-len(latencies) * percentile // 100))
+    return latencies[int(rank) - 1]
+
+
+def run_workload(workload: Workload, concurrency: int, session_headers: Dict[str, str], monitor: RssMonitor) -> dict:
+    """
+    Send the requests of a workload with `concurrency` clients, each with its own session.
+
+    Returns:
+        dict: The throughput, latency, errors, transferred bytes and peak server RSS of the workload.
+    """
+    counter = itertools.count()
+    local = threading.local()
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    transferred = {"sent": 0, "received": 0}
+    lock = threading.Lock()
+
+    def client():
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+            session.headers.update(session_headers)
+        while True:
+            index = next(counter)
+            if index >= workload.count:
+                return
+            started = time.perf_counter()
+            try:
+                response = workload.send(session, index)
+                error = None if response.ok else str(response.status_code)
+                sent, received = len(response.request.body or b""), len(response.content)
+            except requests.RequestException as ex:
+                error, sent, received = type(ex).__name__, 0, 0
+            latency = time.perf_counter() - started
+            with lock:
+                latencies.append(latency)
+                transferred["sent"] += sent
+                transferred["received"] += received
+                if error:
+                    errors[error] = errors.get(error, 0) + 1
+
+    monitor.reset()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="client") as executor:
+        for future in [executor.submit(client) for _ in range(concurrency)]:
+            future.result()
+    duration = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "description": workload.description,
+        "requests": len(latencies),
+        "errors": sum(errors.values()),
+        "errors_by_status": errors,
+        "duration_s": round(duration, 4),
+        "throughput_rps": round(len(latencies) / duration, 3) if duration else None,
+        "bytes_sent": transferred["sent"],
+        "bytes_received": transferred["received"],
+        "latency_ms": {
+            "mean": round(1000 * sum(latencies) / len(latencies), 3),
+            **{f"p{percentile}": round(1000 * _percentile(latencies, percentile), 3) for percentile in PERCENTILES},
+            "max": round(1000 * latencies[-1], 3),
+        },
+        "peak_rss_bytes": monitor.reset(),
+    }
+
+
+def _csv_table(rows: int, seed: int) -> bytes:
+    generator = random.Random(seed)
+    lines = ["x,y,z"] + [f"{row},{generator.uniform(-1000, 1000):.6f},label-{generator.randrange(1000)}" for row in range(rows)]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def _catalog(name: str, catalog_type: str, attributes: List[tuple]) -> dict:
+    return {
+        "name": name,
+        "description": f"Benchmark {catalog_type.lower()} catalog",
+        "is_public": False,
+        "type": catalog_type,
+        "tags": ["benchmark"],
+        "catalog_context": [{"context_key": "site", "context_description": "Site", "context_value": "benchmark"}],
+        "entities_context": [
+            {"context_key": key, "context_description": key, "context_type": context_type}
+            for key, context_type in attributes
+        ],
+    }
+
+
+class Benchmark:
+    """Creates the catalogs and the data the workloads need, and builds the workloads."""
+
+    def __init__(self, url: str, arguments: argparse.Namespace):
+        self.url = url
+        self.arguments = arguments
+        self.headers: Dict[str, str] = {}
+
+    def _check(self, response: requests.Response) -> requests.Response:
+        if not response.ok:
+            raise RuntimeError(f"{response.request.method} {response.url}: {response.status_code} {response.text[:500]}")
+        return response
+
+    def setup(self):
+        response = self._check(requests.post(f"{self.url}/auth/register", json={
+            "username": USERNAME, "password": PASSWORD, "company": "benchmark"
+        }))
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        catalogs = [
+            _catalog("generic", "GENERIC", [("a", "INTEGER"), ("b", "DOUBLE"), ("c", "STRING")]),
+            _catalog("query", "GENERIC", [("a", "INTEGER"), ("b", "DOUBLE"), ("c", "STRING")]),
+            _catalog("timeseries", "TIMESERIES", [("temp", "DOUBLE"), ("hum", "DOUBLE")]),
+            _catalog("table", "TABLE", [("x", "INTEGER"), ("y", "DOUBLE"), ("z", "STRING")]),
+            _catalog("files", "FILE", []),
+        ]
+        # The catalogs listed by the paging workload, besides the ones above
+        catalogs += [
+            _catalog(f"catalog{index:04d}", "GENERIC", [("a", "INTEGER")])
+            for index in range(max(0, self.arguments.catalogs - len(catalogs)))
+        ]
+        for catalog in catalogs:
+            self._check(requests.post(f"{self.url}/datacatalog/", json=catalog, headers=self.headers))
+
+        # The entities of the query catalog are inserted through the AccessModule, without being measured
+        generator = random.Random(self.arguments.seed)
+        entities = [
+            {"datacatalog_id": f"{USERNAME}:query", "id": f"entity{index:06d}", "tags": ["benchmark"],
+             "a": index, "b": generator.uniform(-1000, 1000), "c": f"label-{generator.randrange(1000)}"}
+            for index in range(self.arguments.query_entities)
+        ]
+        seed = Workload("seed_query", len(entities), lambda session, index: session.post(
+            f"{self.url}/insert/generic", json=entities[index]), "")
+        result = run_workload(seed, self.arguments.concurrency, self.headers, _NullMonitor())
+        if result["errors"]:
+            raise RuntimeError(f"Failed to insert the query entities: {result['errors_by_status']}")
+
+    def _scaled(self, size: int, base: int) -> int:
+        return max(MIN_REQUESTS, self.arguments.requests * base // max(size, base))
+
+    def workloads(self) -> List[Workload]:
+        arguments = self.arguments
+        url = self.url
+        generator = random.Random(arguments.seed)
+        workloads = []
+
+        series = [
+            {
+                "datacatalog_id": f"{USERNAME}:timeseries",
+                "values": [
+                    {"id": f"sensor{row % arguments.sensors:04d}", "timestamp": 1700000000 + 60 * (index * arguments.batch_size + row),
+                     "temp": round(generator.uniform(-20, 40), 3), "hum": round(generator.uniform(0, 100), 3), "tags": []}
+                    for row in range(arguments.batch_size)
+                ],
+            }
+            for index in range(arguments.requests)
+        ]
+        workloads.append(Workload(
+            "timeseries_insert", len(series),
+            lambda session, index: session.post(f"{url}/insert/timeseries", json=series[index]),
+            f"POST /insert/timeseries, {arguments.batch_size} observations of {arguments.sensors} sensors per request"
+        ))
+
+        generic = [
+            {"datacatalog_id": f"{USERNAME}:generic", "id": f"entity{index:06d}", "tags": ["benchmark"],
+             "a": index, "b": generator.uniform(-1000, 1000), "c": f"label-{generator.randrange(1000)}"}
+            for index in range(arguments.requests)
+        ]
+        workloads.append(Workload(
+            "generic_insert", len(generic),
+            lambda session, index: session.post(f"{url}/insert/generic", json=generic[index]),
+            "POST /insert/generic, one entity per request"
+        ))
+
+        for rows in arguments.table_rows:
+            table = _csv_table(rows, arguments.seed)
+            workloads.append(Workload(
+                f"table_upload_{rows}", self._scaled(rows, 100),
+                lambda session, index, rows=rows, table=table: session.post(
+                    f"{url}/insert/table",
+                    data={"datacatalog": f"{USERNAME}:table", "entity": f"table{rows}-{index:06d}", "tags": ["benchmark"]},
+                    files={"file": (f"table{rows}.csv", table, "text/csv")}
+                ),
+                f"POST /insert/table, a CSV of {rows} rows and 3 columns per request"
+            ))
+
+        for size in arguments.file_sizes:
+            content = random.Random(arguments.seed).randbytes(size)
+            count = self._scaled(size, 64 * 1024)
+            workloads.append(Workload(
+                f"file_upload_{size}", count,
+                lambda session, index, size=size, content=content: session.post(
+                    f"{url}/insert/file",
+                    data={"datacatalog": f"{USERNAME}:files", "entity": f"file{size}-{index:06d}",
+                          "metadata": json.dumps({"size": size}), "tags": ["benchmark"]},
+                    files={"file": (f"file{size}.bin", content, "application/octet-stream")}
+                ),
+                f"POST /insert/file, a file of {size} bytes per request"
+            ))
+            # Downloads the files uploaded by the previous workload
+            workloads.append(Workload(
+                f"file_download_{size}", count,
+                lambda session, index, size=size, count=count: session.get(
+                    f"{url}/download/{USERNAME}:files/{USERNAME}/file{size}-{index % count:06d}"
+                ),
+                f"GET /download of a file of {size} bytes"
+            ))
+
+        workloads.append(Workload(
+            "catalog_page", arguments.requests,
+            lambda session, index: session.post(f"{url}/datacatalog/page", json={
+                "limit": 20, "page": index % 5,
+                "filter": {"name": None, "id": None, "owner": None, "type": None, "tags": []}
+            }),
+            f"POST /datacatalog/page over {arguments.catalogs} catalogs"
+        ))
+
+        for output in ("JSON", "CSV"):
+            query = {"catalog_id": f"{USERNAME}:query", "entities": [], "fields": [], "output": output}
+            workloads.append(Workload(
+                f"query_{output.lower()}", arguments.requests,
+                lambda session, index, query=query: session.post(f"{url}/query/", json=query),
+                f"POST /query/ {output} of {arguments.query_entities} entities, repeated (cached)"
+            ))
+            workloads.append(Workload(
+                f"query_{output.lower()}_uncached", arguments.requests,
+                lambda session, index, query=query: session.post(f"{url}/query/", json={
+                    **query, "limit": arguments.query_entities + index + 1
+                }),
+                f"POST /query/ {output} of {arguments.query_entities} entities, a different query every time"
+            ))
+
+        workloads.append(Workload(
+            "query_timeseries_csv", arguments.requests,
+            lambda session, index: session.post(f"{url}/query/", json={
+                "catalog_id": f"{USERNAME}:timeseries", "entities": [f"sensor{index % arguments.sensors:04d}"],
+                "fields": [], "output": "CSV"
+            }),
+            "POST /query/ CSV of the series of one sensor"
+        ))
+        return workloads
+
+
+class _NullMonitor:
+    def reset(self) -> Optional[int]:
+        return None
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BENCHMARK_PATH, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _sizes(value: str) -> List[int]:
+    return [int(size) for size in value.split(",") if size]
+
+
+def main(arguments: argparse.Namespace) -> dict:
+    workdir = tempfile.mkdtemp(prefix="ods-benchmark-")
+    standin_port, server_port = _free_port(), _free_port()
+    backend_url = f"http://127.0.0.1:{standin_port}"
+    server_url = f"http://127.0.0.1:{server_port}"
+    env = {
+        **os.environ,
+        "ORION_URL": backend_url,
+        "ORION_CONTEXT": f"{backend_url}/context.json",
+        "QUANTUMLEAP_URL": backend_url,
+        "QUANTUMLEAD_NOTIFY": f"{backend_url}/v2/notify",
+        "FIWARE_CONTEXT_PATH": os.path.abspath(CONTEXT_PATH),
+        "FIWARE_FILES_PATH": os.path.join(workdir, "files"),
+        "ODS_DATA_PATH": os.path.join(workdir, "data"),
+        "HOSTNAME": server_url,
+        "PROMETHEUS_MULTIPROC_DIR": os.path.join(workdir, "data", "metrics"),
+    }
+    env.pop("ACCESSMODULE_NOTIFY_URL", None)
+    os.makedirs(env["FIWARE_FILES_PATH"])
+
+    log = open(os.path.join(workdir, "server.log"), "wb")
+    standin = subprocess.Popen(
+        [sys.executable, os.path.join(BENCHMARK_PATH, "standin.py"), "--port", str(standin_port),
+         "--latency", str(arguments.latency)],
+        stdout=log, stderr=subprocess.STDOUT
+    )
+    server = None
+    monitor = None
+    try:
+        _wait_ready(f"{backend_url}/ngsi-ld/v1/entities?type=ready", standin, 30)
+        server = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "main:app", "--bind", f"127.0.0.1:{server_port}",
+             "--worker-class", "uvicorn.workers.UvicornWorker", "--workers", str(arguments.workers), "--timeout", "300"],
+            cwd=SOURCE_PATH, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+        _wait_ready(f"{server_url}/openapi.json", server, 60)
+        monitor = RssMonitor(server.pid)
+        monitor.start()
+
+        benchmark = Benchmark(server_url, arguments)
+        benchmark.setup()
+        results = {}
+        for workload in benchmark.workloads():
+            if arguments.workloads and workload.name not in arguments.workloads:
+                continue
+            print(f"{workload.name}: {workload.count} requests", file=sys.stderr, flush=True)
+            results[workload.name] = run_workload(workload, arguments.concurrency, benchmark.headers, monitor)
+            print(f"  {results[workload.name]['throughput_rps']} req/s, p95 {results[workload.name]['latency_ms']['p95']} ms, "
+                  f"{results[workload.name]['errors']} errors", file=sys.stderr, flush=True)
+        peak_rss = max((result["peak_rss_bytes"] or 0 for result in results.values()), default=0)
+        return {
+            "meta": {
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "git_commit": _git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "arguments": {key: value for key, value in vars(arguments).items() if key != "output"},
+            },
+            "server": {"peak_rss_bytes": peak_rss if monitor.available else None},
+            "workloads": results,
+        }
+    finally:
+        if monitor:
+            monitor.stop()
+        if server:
+            _stop(server)
+        _stop(standin)
+        log.close()
+        if arguments.keep:
+            print(f"Data and server log kept in {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end load benchmark of the AccessModule")
+    parser.add_argument("--output", help="File to write the results to (JSON), stdout by default")
+    parser.add_argument("--workloads", type=lambda value: value.split(","), help="Comma-separated workloads to run (all by default)")
+    parser.add_argument("--workers", type=int, default=4, help="Gunicorn worker processes")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per workload (before scaling by size)")
+    parser.add_argument("--batch-size", type=int, default=100, help="Observations per time series insert")
+    parser.add_argument("--sensors", type=int, default=20, help="Entities of the time series catalog")
+    parser.add_argument("--table-rows", type=_sizes, default=[100, 1000, 10000], help="Rows of the uploaded tables")
+    parser.add_argument("--file-sizes", type=_sizes, default=[64 * 1024, 1024 * 1024, 16 * 1024 * 1024],
+                        help="Bytes of the uploaded files")
+    parser.add_argument("--catalogs", type=int, default=50, help="Catalogs listed by the paging workload")
+    parser.add_argument("--query-entities", type=int, default=1000, help="Entities of the queried catalog")
+    parser.add_argument("--latency", type=float, default=0.0, help="Delay of every Orion and QuantumLeap request, in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated payloads")
+    parser.add_argument("--keep", action="store_true", help="Keep the data and the server log")
+    arguments = parser.parse_args()
+
+    report = json.dumps(main(arguments), indent=2)
+    if arguments.output:
+        with open(arguments.output, "w") as output:
+            output.write(report + "\n")
+    else:
+        print(report)
@@ -0,0 +1,221 @@
+"""
+standin.py
+
+In-memory stand-in for Orion (NGSI-LD) and QuantumLeap, so the load benchmarks run without
+the FIWARE stack. It answers the requests the AccessModule sends, with the same formats:
+
+- POST /ngsi-ld/v1/entityOperations/upsert: Entities are stored in normalized form. The
+  attributes with `observedAt` are also appended to the time series of their entity, as
+  QuantumLeap does with the notifications of Orion.
+- GET /ngsi-ld/v1/entities: `type`, `options=keyValues`, `attrs`, `q` (`attr~=regex` conditions
+  joined by `&` and `|`), `idPattern`, `limit` (20 by default), `offset` and `count`.
+- GET /ngsi-ld/v1/entities/{id}, DELETE /v1/contextEntities/{id}, POST /ngsi-ld/v1/subscriptions.
+- GET /v2/entities/{id}/attrs: `attrs`, `fromDate`, `toDate`, `lastN`, `offset` and `limit`.
+
+Geo-queries are not supported. Every request can be delayed by `--latency` seconds, to account
+for the network and the processing time of the real services.
+
+    python standin.py --port 1026 [--latency 0.002]
+"""
+
+import argparse
+import bisect
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+DEFAULT_LIMIT = 20
+QL_DEFAULT_LIMIT = 10000
+
+_ENTITY_PATH = re.compile(r"/ngsi-ld/v1/entities/(?P<id>[^/]+)")
+_DELETE_PATH = re.compile(r"/v1/contextEntities/(?P<id>[^/]+)")
+_QL_PATH = re.compile(r"/v2/entities/(?P<id>[^/]+)/attrs")
+_CONDITION = re.compile(r"(?P<attr>[\w.]+)~=(?P<pattern>.*)")
+
+
+class Store:
+    """Entities by ID, and the time series of each entity (rows sorted by their index)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entities: Dict[str, Dict[str, Any]] = {}
+        self.series: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+
+    def upsert(self, entities: List[Dict[str, Any]]):
+        with self.lock:
+            for entity in entities:
+                entity = {key: value for key, value in entity.items() if key != "@context"}
+                self.entities[entity["id"]] = {**self.entities.get(entity["id"], {}), **entity}
+                observed = {
+                    key: value for key, value in entity.items()
+                    if isinstance(value, dict) and value.get("observedAt")
+                }
+                if observed:
+                    index = next(iter(observed.values()))["observedAt"]
+                    row = (index, {key: _get_value(value) for key, value in observed.items()})
+                    bisect.insort(self.series.setdefault(entity["id"], []), row, key=lambda item: item[0])
+
+    def delete(self, entity_id: str) -> bool:
+        with self.lock:
+            self.series.pop(entity_id, None)
+            return self.entities.pop(entity_id, None) is not None
+
+
+def _get_value(attribute: Any) -> Any:
+    if isinstance(attribute, dict) and "type" in attribute:
+        return attribute.get("value", attribute.get("object"))
+    return attribute
+
+
+def _key_values(entity: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: _get_value(value) for key, value in entity.items()}
+
+
+def _parse_q(query: str):
+    # (a~=x)&(b~=y|c~=z): the conditions of each group are alternatives
+    groups = []
+    for group in query.strip("()").split(")&("):
+        conditions = []
+        for condition in group.strip("()").split("|"):
+            match = _CONDITION.fullmatch(condition.strip("()"))
+            if match:
+                conditions.append((match["attr"], re.compile(match["pattern"])))
+        groups.append(conditions)
+    return groups
+
+
+def _matches_q(entity: Dict[str, Any], groups) -> bool:
+    for conditions in groups:
+        if not any(
+            pattern.search(str(entity.get("id") if attr == "id" else _get_value(entity.get(attr, ""))))
+            for attr, pattern in conditions
+        ):
+            return False
+    return True
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "StandInServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: Any = None, headers: Optional[Dict[str, str]] = None):
+        content = b"" if body is None else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _read_json(self) -> Any:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def _route(self, method: str):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        url = urlsplit(self.path)
+        params = parse_qsl(url.query, keep_blank_values=True)
+        store = self.server.store
+
+        if method == "POST" and url.path == "/ngsi-ld/v1/entityOperations/upsert":
+            entities = self._read_json() or []
+            store.upsert(entities)
+            return self._send(201, [entity["id"] for entity in entities])
+        if method == "POST" and url.path == "/ngsi-ld/v1/subscriptions":
+            self._read_json()
+            subscription_id = f"urn:ngsi-ld:Subscription:{uuid.uuid4()}"
+            return self._send(201, headers={"Location": f"/ngsi-ld/v1/subscriptions/{subscription_id}"})
+        if method == "GET" and url.path == "/ngsi-ld/v1/entities":
+            return self._query(dict(params))
+        match = _ENTITY_PATH.fullmatch(url.path)
+        if method == "GET" and match:
+            entity = store.entities.get(unquote(match["id"]))
+            return self._send(200, entity) if entity else self._send(404, {"title": "Entity not found"})
+        match = _DELETE_PATH.fullmatch(url.path)
+        if method == "DELETE" and match:
+            return self._send(204 if store.delete(unquote(match["id"])) else 404)
+        match = _QL_PATH.fullmatch(url.path)
+        if method == "GET" and match:
+            return self._series(unquote(match["id"]), dict(params))
+        self._send(404, {"title": f"Not supported by the stand-in: {method} {url.path}"})
+
+    def _query(self, params: Dict[str, str]):
+        with self.server.store.lock:
+            entities = [entity for entity in self.server.store.entities.values() if entity.get("type") == params.get("type")]
+        if params.get("idPattern"):
+            pattern = re.compile(params["idPattern"])
+            entities = [entity for entity in entities if pattern.search(entity["id"])]
+        if params.get("q"):
+            groups = _parse_q(params["q"])
+            entities = [entity for entity in entities if _matches_q(entity, groups)]
+        if params.get("attrs"):
+            attrs = set(params["attrs"].split(",")) | {"id", "type"}
+            entities = [{key: value for key, value in entity.items() if key in attrs} for entity in entities]
+        if params.get("options") == "keyValues":
+            entities = [_key_values(entity) for entity in entities]
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or DEFAULT_LIMIT)
+        headers = {"NGSILD-Results-Count": str(len(entities))} if params.get("count") == "true" else None
+        self._send(200, entities[offset:offset + limit], headers)
+
+    def _series(self, entity_id: str, params: Dict[str, str]):
+        with self.server.store.lock:
+            rows = list(self.server.store.series.get(entity_id, []))
+        if params.get("fromDate"):
+            rows = rows[bisect.bisect_left(rows, params["fromDate"], key=lambda item: item[0]):]
+        if params.get("toDate"):
+            rows = rows[:bisect.bisect_right(rows, params["toDate"], key=lambda item: item[0])]
+        if params.get("lastN"):
+            rows = rows[-int(params["lastN"]):]
+        offset = int(params.get("offset") or 0)
+        rows = rows[offset:offset + int(params.get("limit") or QL_DEFAULT_LIMIT)]
+        if not rows:
+            return self._send(404, {"error": "Not Found", "description": "No records were found for such query."})
+        attrs = params["attrs"].split(",") if params.get("attrs") else sorted({key for _, values in rows for key in values})
+        self._send(200, {
+            "entityId": entity_id,
+            "index": [index for index, _ in rows],
+            "attributes": [{"attrName": attr, "values": [values.get(attr) for _, values in rows]} for attr in attrs],
+        })
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], latency: float = 0.0):
+        super().__init__(address, Handler)
+        self.store = Store()
+        self.latency = latency
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="In-memory stand-in for Orion and QuantumLeap")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1026)
+    parser.add_argument("--latency", type=float, default=0.0, help="Delay of every request, in seconds")
+    arguments = parser.parse_args()
+    server = StandInServer((arguments.host, arguments.port), arguments.latency)
+    print(f"Stand-in listening on {arguments.host}:{server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,270 @@
+"""
+micro.py
+
+Microbenchmarks of the serialization and conversion functions the ingestion and query paths
+spend their CPU time in, run in isolation (without Orion or the server):
+
+- fiware_property: `FiwareProperty.to_fiware` of a Property, an observed Property and a GeoProperty.
+- fiware_entity: `FiwareEntity.to_fiware` of entities with `--attributes` attributes, and of
+  table entities with `--rows` rows per column.
+- catalog_to_fiware and catalog_from_fiware: `DataCatalogCreate.datacatalog_to_fiware` and
+  `DataCatalogCreate.from_fiware` of catalogs with `--attributes` entity attributes.
+- json_to_csv: `utils.json_to_csv` of `--entities` entities with 5 and `--attributes` attributes.
+- table_to_csv: `utils.table_to_csv` of a table entity with `--rows` rows.
+- ids: The ID helpers of utils.py.
+
+The inputs are synthetic, generated from `--seed`, and built before the timing. Each case is
+timed with timeit (repeated `--repeat` times, the number of calls of a repetition picked to
+last at least 0.2 seconds) and then run once under tracemalloc, for the peak memory allocated
+during a call and the memory it keeps allocated (its result).
+
+    python micro.py [--filter json_to_csv] [--output results.json] [--baseline baseline.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+BENCHMARK_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_PATH, "..", "src"))
+
+import utils  # noqa: E402
+from schemas import (ContextDefinition, ContextValue, DataCatalogCreate, FiwareEntity,  # noqa: E402
+                     FiwareProperty, TypeAttribute, TypeCatalog)
+
+CATALOG_ID = "owner:catalog"
+OBSERVED_AT = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+class Case:
+    """A function to time, called without arguments, and the number of items (entities, rows...) it processes."""
+
+    def __init__(self, name: str, function: Callable[[], Any], items: int = 1):
+        self.name = name
+        self.function = function
+        self.items = items
+
+
+def _value(generator: random.Random, attribute_type: TypeAttribute) -> Any:
+    if attribute_type == TypeAttribute.INTEGER:
+        return generator.randrange(1000000)
+    if attribute_type == TypeAttribute.DOUBLE:
+        return generator.uniform(-1000, 1000)
+    if attribute_type == TypeAttribute.COORDINATE:
+        return [generator.uniform(-180, 180), generator.uniform(-90, 90)]
+    return f"label-{generator.randrange(1000000)}"
+
+
+def _attribute_types(count: int) -> List[TypeAttribute]:
+    types = [TypeAttribute.INTEGER, TypeAttribute.DOUBLE, TypeAttribute.STRING]
+    return [types[index % len(types)] for index in range(count)]
+
+
+def _entity(generator: random.Random, attributes: int, rows: Optional[int] = None) -> FiwareEntity:
+    # A table entity (rows) holds a list of values per column
+    return FiwareEntity(
+        id=utils.get_entity_id(CATALOG_ID, "owner", f"entity{generator.randrange(1000000)}"),
+        type=CATALOG_ID,
+        tags=["benchmark"],
+        entity_values=[
+            FiwareProperty(
+                property_key=f"attribute{index}",
+                property_value=_value(generator, attribute_type) if rows is None
+                else [_value(generator, attribute_type) for _ in range(rows)]
+            )
+            for index, attribute_type in enumerate(_attribute_types(attributes))
+        ]
+    )
+
+
+def _catalog(attributes: int) -> DataCatalogCreate:
+    return DataCatalogCreate(
+        id=CATALOG_ID,
+        owner="owner",
+        name="catalog",
+        description="Benchmark catalog",
+        is_public=True,
+        type=TypeCatalog.GENERIC,
+        tags=["benchmark", "micro"],
+        catalog_context=[
+            ContextValue(context_key=f"context{index}", context_description="Context", context_value=f"value{index}")
+            for index in range(5)
+        ],
+        entities_context=[
+            ContextDefinition(context_key=f"attribute{index}", context_description="Attribute", context_type=attribute_type)
+            for index, attribute_type in enumerate(_attribute_types(attributes))
+        ]
+    )
+
+
+def _key_values(generator: random.Random, entities: int, attributes: int) -> List[Dict[str, Any]]:
+    # Entities as returned by Orion with options=keyValues
+    types = _attribute_types(attributes)
+    return [
+        {"id": utils.get_entity_id(CATALOG_ID, "owner", f"entity{index}"), "type": CATALOG_ID,
+         **{f"attribute{column}": _value(generator, attribute_type) for column, attribute_type in enumerate(types)}}
+        for index in range(entities)
+    ]
+
+
+def _table(generator: random.Random, rows: int, columns: int = 5) -> List[Dict[str, Any]]:
+    # A normalized table entity, its columns are Properties with a list of values
+    return [{
+        "id": utils.get_entity_id(CATALOG_ID, "owner", "table"), "type": CATALOG_ID,
+        **{f"column{column}": {"type": "Property", "value": [_value(generator, attribute_type) for _ in range(rows)]}
+           for column, attribute_type in enumerate(_attribute_types(columns))}
+    }]
+
+
+def get_cases(arguments: argparse.Namespace) -> List[Case]:
+    generator = random.Random(arguments.seed)
+    cases = [
+        Case("fiware_property/property", FiwareProperty(property_key="value", property_value=1.5).to_fiware),
+        Case("fiware_property/observed", FiwareProperty(
+            property_key="value", property_value=1.5, observed_at=OBSERVED_AT).to_fiware),
+        Case("fiware_property/geoproperty", FiwareProperty(
+            property_key="location", property_value="2.17,41.38", property_type="GeoProperty").to_fiware),
+    ]
+    for attributes in arguments.attributes:
+        entity = _entity(generator, attributes)
+        cases.append(Case(f"fiware_entity/attributes={attributes}", entity.to_fiware, attributes))
+    for rows in arguments.rows:
+        entity = _entity(generator, 5, rows)
+        cases.append(Case(f"fiware_entity/table_rows={rows}", entity.to_fiware, 5))
+
+    for attributes in arguments.attributes:
+        catalog = _catalog(attributes)
+        fiware_catalog = json.loads(json.dumps(catalog.datacatalog_to_fiware()))
+        cases.append(Case(f"catalog_to_fiware/attributes={attributes}", catalog.datacatalog_to_fiware, attributes))
+        cases.append(Case(f"catalog_from_fiware/attributes={attributes}",
+                          lambda fiware_catalog=fiware_catalog: DataCatalogCreate.from_fiware(fiware_catalog), attributes))
+
+    for entities in arguments.entities:
+        for attributes in sorted({5, *arguments.attributes}):
+            page = _key_values(generator, entities, attributes)
+            cases.append(Case(f"json_to_csv/entities={entities},attributes={attributes}",
+                              lambda page=page: utils.json_to_csv(page), entities))
+    for rows in arguments.rows:
+        table = _table(generator, rows)
+        cases.append(Case(f"table_to_csv/rows={rows}", lambda table=table: utils.table_to_csv(table), rows))
+
+    entity_id = utils.get_entity_id(CATALOG_ID, "owner", "entity")
+    catalog_fiware_id = utils.get_full_catalog_id(CATALOG_ID)
+    cases += [
+        Case("ids/get_entity_id", lambda: utils.get_entity_id(CATALOG_ID, "owner", "entity")),
+        Case("ids/get_full_catalog_id", lambda: utils.get_full_catalog_id(CATALOG_ID)),
+        Case("ids/get_internal_catalog_id", lambda: utils.get_internal_catalog_id("catalog", "owner")),
+        Case("ids/get_id_from_fiware_id", lambda: utils.get_id_from_fiware_id(catalog_fiware_id)),
+        Case("ids/get_owner_from_fiware_id", lambda: utils.get_owner_from_fiware_id(catalog_fiware_id)),
+        Case("ids/get_internal_entity_id", lambda: utils.get_internal_entity_id(entity_id)),
+        Case("ids/get_entity_and_catalog_from_fiware_id",
+             lambda: utils.get_entity_and_catalog_from_fiware_id(entity_id)),
+        Case("ids/get_entity_id_pattern/entities=1", lambda: utils.get_entity_id_pattern(CATALOG_ID, ["entity"])),
+        Case("ids/get_entity_id_pattern/entities=20",
+             lambda: utils.get_entity_id_pattern(CATALOG_ID, [f"entity{index}" for index in range(20)])),
+    ]
+    return cases
+
+
+def _measure_memory(function: Callable[[], Any]) -> Dict[str, int]:
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = function()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return {"peak_bytes": peak - before, "retained_bytes": current - before}
+
+
+def run_case(case: Case, repeat: int) -> dict:
+    """
+    Time a case and measure its memory allocations.
+
+    Returns:
+        dict: The time per call (minimum and median of the repetitions), the calls and items
+        per second, and the peak and retained memory of a call.
+    """
+    timer = timeit.Timer(case.function)
+    # As many calls per repetition as last 0.2 seconds
+    number, _ = timer.autorange()
+    times = [elapsed / number for elapsed in timer.repeat(repeat=repeat, number=number)]
+    best = min(times)
+    return {
+        "items": case.items,
+        "calls": number,
+        "min_us": round(best * 1e6, 3),
+        "median_us": round(statistics.median(times) * 1e6, 3),
+        "calls_per_s": round(1 / best, 1),
+        "items_per_s": round(case.items / best, 1),
+        **_measure_memory(case.function),
+    }
+
+
+def _sizes(value: str) -> List[int]:
+    return [int(size) for size in value.split(",") if size]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BENCHMARK_PATH, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _change(current: Optional[float], before: Optional[float]) -> str:
+    return f"{(current - before) / before:+.1%}" if current is not None and before else "-"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the serialization and conversion functions")
+    parser.add_argument("--filter", help="Only run the cases whose name contains this text")
+    parser.add_argument("--entities", type=_sizes, default=[100, 1000, 10000], help="Entities of the CSV conversions")
+    parser.add_argument("--attributes", type=_sizes, default=[5, 50, 500], help="Attributes of the entities and catalogs")
+    parser.add_argument("--rows", type=_sizes, default=[100, 10000, 100000], help="Rows of the table entities")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed repetitions of each case")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated inputs")
+    parser.add_argument("--output", help="File to write the results to (JSON)")
+    parser.add_argument("--baseline", help="Results of a previous run (JSON) to compare with")
+    arguments = parser.parse_args()
+
+    baseline = {}
+    if arguments.baseline:
+        with open(arguments.baseline) as buffer:
+            baseline = json.load(buffer)["cases"]
+
+    results = {}
+    print(f"{'case':<58} {'median us':>12} {'items/s':>14} {'peak KiB':>10} {'change':>8}")
+    for case in get_cases(arguments):
+        if arguments.filter and arguments.filter not in case.name:
+            continue
+        result = results[case.name] = run_case(case, arguments.repeat)
+        change = _change(result["median_us"], baseline.get(case.name, {}).get("median_us"))
+        print(f"{case.name:<58} {result['median_us']:>12.3f} {result['items_per_s']:>14.1f} "
+              f"{result['peak_bytes'] / 1024:>10.1f} {change:>8}", flush=True)
+
+    if arguments.output:
+        with open(arguments.output, "w") as output:
+            json.dump({
+                "meta": {
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "git_commit": _git_commit(),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "arguments": {key: value for key, value in vars(arguments).items() if key not in ("output", "baseline")},
+                },
+                "cases": results,
+            }, output, indent=2)
+            output.write("\n")
@@ -1,4 +1,6 @@
 from config.database import *
 from config.fastapi import *
 from config.fiware import *
-from config.messages import *
\ No newline at end of file
+from config.limits import *
+from config.messages import *
+from config.storage import *
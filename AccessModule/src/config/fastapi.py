@@ -6,4 +6,8 @@ REST API to interact with the Open Data Space that support Impetus project data
 VERSION = "[alpha] 0.2.0"
 
 CONTEXT_PATH = os.getenv("FIWARE_CONTEXT_PATH")
-HOSTMANE = os.getenv("HOSTNAME")
\ No newline at end of file
+HOSTMANE = os.getenv("HOSTNAME")
+# Users allowed to profile requests and retrieve the profiles (comma separated)
+ADMIN_USERS = [user for user in os.getenv("ODS_ADMIN_USERS", "").split(",") if user]
+# Header with the cursor of the next page of a paginated query, in the formats other than JSON
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
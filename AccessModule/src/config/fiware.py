@@ -12,6 +12,15 @@ ORION_PATH_QUERY = "/v2/op/query"
 ORION_ENTITY_PREFIX = "urn:ngsi-ld"
 QL_NOTIFY = os.getenv("QUANTUMLEAD_NOTIFY")
 QL_NAME = "quantumlead"
+QL_URL = os.getenv("QUANTUMLEAP_URL")
+QL_PATH_ENTITY_ATTRS = "/v2/entities/{}/attrs"
+# Endpoint where Orion notifies the AccessModule of the changes in the catalogs
+ODS_NOTIFY_URL = os.getenv("ACCESSMODULE_NOTIFY_URL")
+# Shared secret Orion sends in the notifications of the internal subscriptions, the notifications
+# without it are rejected
+ODS_NOTIFY_TOKEN = os.getenv("ACCESSMODULE_NOTIFY_TOKEN")
+ODS_NOTIFY_TOKEN_HEADER = "X-ODS-Notify-Token"
+ODS_NAME = "accessmodule"
 
 CATALOG_ENTITY = "datacatalog"
 USER_ENTITY = "users"
@@ -22,4 +31,5 @@ FIWARE_FILE_PATH = os.getenv("FIWARE_FILES_PATH")
 FIWARE_FILE_URL_FORMAT = "{}/download/{}/{}/{}"
 FIWARE_FILE_FORMAT = "{}/{}/{}/"
 FIWARE_FILE_PROPERTY ="file_url"
-FIWARE_FILENAME_PROPERTY ="filename"
\ No newline at end of file
+FIWARE_FILENAME_PROPERTY ="filename"
+FIWARE_CODEC_PROPERTY = "file_codec"
\ No newline at end of file
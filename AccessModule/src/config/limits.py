@@ -0,0 +1,65 @@
+import os
+# Asynchronous ingestion
+INGESTION_BATCH_SIZE = int(os.getenv("INGESTION_BATCH_SIZE", "500"))
+INGESTION_BATCH_MAX_BYTES = int(os.getenv("INGESTION_BATCH_MAX_BYTES", str(8 * 1024 * 1024)))
+INGESTION_MAX_JOBS_PER_BATCH = int(os.getenv("INGESTION_MAX_JOBS_PER_BATCH", "50"))
+INGESTION_POLL_INTERVAL = float(os.getenv("INGESTION_POLL_INTERVAL", "1.0"))
+INGESTION_RETRY_INTERVAL = float(os.getenv("INGESTION_RETRY_INTERVAL", "5.0"))
+INGESTION_JOB_RETENTION = int(os.getenv("INGESTION_JOB_RETENTION", str(7 * 24 * 3600)))
+
+# Orion and QuantumLeap queries
+ORION_PAGE_SIZE = int(os.getenv("ORION_PAGE_SIZE", "1000"))
+QL_PAGE_SIZE = int(os.getenv("QL_PAGE_SIZE", "10000"))
+QL_MAX_CONCURRENCY = int(os.getenv("QL_MAX_CONCURRENCY", "8"))
+
+# Multi-catalog queries
+MULTI_QUERY_MAX_CATALOGS = int(os.getenv("MULTI_QUERY_MAX_CATALOGS", "50"))
+MULTI_QUERY_MAX_CONCURRENCY = int(os.getenv("MULTI_QUERY_MAX_CONCURRENCY", "4"))
+
+# Export snapshots
+SNAPSHOT_DELAY = float(os.getenv("SNAPSHOT_DELAY", "30"))
+
+# Local spatial index of the catalogs queried with geo filters
+GEOINDEX_CELL_SIZE = float(os.getenv("GEOINDEX_CELL_SIZE", "0.1"))
+GEOINDEX_MAX_ENTITIES = int(os.getenv("GEOINDEX_MAX_ENTITIES", "100000"))
+GEOINDEX_MAX_CATALOGS = int(os.getenv("GEOINDEX_MAX_CATALOGS", "8"))
+# Catalogs remembered as not indexable, so they are not scanned again until they change
+GEOINDEX_MAX_UNINDEXABLE = int(os.getenv("GEOINDEX_MAX_UNINDEXABLE", "1024"))
+
+# Time series resampling
+RESAMPLE_MAX_POINTS = int(os.getenv("RESAMPLE_MAX_POINTS", "1000000"))
+
+# Query output
+COLUMNAR_ROW_GROUP_SIZE = int(os.getenv("COLUMNAR_ROW_GROUP_SIZE", "65536"))
+
+# Query results cache (per server process)
+# Age after which the data of a catalog is assumed to have changed. Changes made directly in Orion
+# (or persisted later by QuantumLeap) are only notified with ACCESSMODULE_NOTIFY_URL, so without it
+# the cached results, validators, snapshots and indexes expire sooner
+CHANGES_MAX_AGE = float(os.getenv("CHANGES_MAX_AGE", "3600" if os.getenv("ACCESSMODULE_NOTIFY_URL") else "60"))
+QUERY_CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+QUERY_CACHE_MAX_ENTRY_BYTES = int(os.getenv("QUERY_CACHE_MAX_ENTRY_BYTES", str(8 * 1024 * 1024)))
+
+# File downloads
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(1024 * 1024)))
+DOWNLOAD_MAX_RANGES = int(os.getenv("DOWNLOAD_MAX_RANGES", "16"))
+
+# Notification fan-out to the subscribers
+NOTIFY_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", "100"))
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "10000"))
+NOTIFY_MIN_INTERVAL = float(os.getenv("NOTIFY_MIN_INTERVAL", "1.0"))
+NOTIFY_MAX_CONCURRENCY = int(os.getenv("NOTIFY_MAX_CONCURRENCY", "8"))
+NOTIFY_TIMEOUT = float(os.getenv("NOTIFY_TIMEOUT", "10"))
+NOTIFY_RETRY_INTERVAL = float(os.getenv("NOTIFY_RETRY_INTERVAL", "1.0"))
+NOTIFY_RETRY_MAX_INTERVAL = float(os.getenv("NOTIFY_RETRY_MAX_INTERVAL", "60"))
+NOTIFY_MAX_RETRIES = int(os.getenv("NOTIFY_MAX_RETRIES", "5"))
+
+# Live stream of the catalog changes
+EVENTS_LOG_MAX_BYTES = int(os.getenv("EVENTS_LOG_MAX_BYTES", str(16 * 1024 * 1024)))
+EVENTS_POLL_INTERVAL = float(os.getenv("EVENTS_POLL_INTERVAL", "0.2"))
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", "15"))
+
+# On-demand profiling of single requests
+PROFILING_INTERVAL = float(os.getenv("PROFILING_INTERVAL", "0.005"))
+PROFILING_MAX_SECONDS = float(os.getenv("PROFILING_MAX_SECONDS", "300"))
+PROFILES_MAX = int(os.getenv("PROFILES_MAX", "100"))
@@ -1,8 +1,39 @@
 INTERNAL_QL_SUBSCRIPTION_DESC = "Subscription at QL for timeseries datacatalog {}"
+INTERNAL_ODS_SUBSCRIPTION_DESC = "Subscription at the AccessModule for changes in datacatalog {}"
 
 C404_DATACATALOG_NOT_FOUND = "DATACATALOG {} not found"
 C400_DATACATALOG_ALREADY_EXISTS = "DATACATALOG {} already exists"
 C400_DATACATALOG_TYPE_CHANGED = "The datacatalog type can't be changed. Current: {}, specified: {}"
 C401_DATACATALOG_OWNER_ERROR = "You don't have permissions to edit this datacatalog"
+C403_DATACATALOG_ACCESS_ERROR = "You don't have permissions to access this datacatalog"
 
-F404_FILE_NOT_FOUND = "File not found!"
\ No newline at end of file
+S403_INVALID_NOTIFY_TOKEN = "Invalid notification token"
+S400_UNKNOWN_CATALOG = "Notified entity {} does not belong to a known datacatalog"
+
+F404_FILE_NOT_FOUND = "File not found!"
+F400_NOT_FILE_CATALOG = "Data catalog {} is not a FILE catalog"
+
+Q400_NO_DATA = "Query data does not match any available data"
+Q400_FORMAT_NOT_AVAILABLE = "Output format {} is not available in this server"
+Q400_MULTI_FORMAT_NOT_AVAILABLE = "Output format {} is not available for multi-catalog queries"
+Q400_TOO_MANY_CATALOGS = "A multi-catalog query can include up to {} catalogs"
+Q400_INVALID_CURSOR = "Invalid cursor for this query"
+Q400_NO_COORDINATE = "Data catalog {} has no COORDINATE attribute {}"
+Q400_INVALID_COORDINATES = "Invalid geo filter: {}"
+Q400_INVALID_BBOX = "Invalid bbox {}, the minimum longitude and latitude can't exceed the maximum ones"
+Q400_RESAMPLE_NOT_TIMESERIES = "Data catalog {} is not a time series catalog, it can't be resampled"
+Q400_RESAMPLE_NOT_NUMERIC = "Attribute {} can't be resampled, only INTEGER and DOUBLE attributes can"
+Q400_RESAMPLE_TOO_LARGE = "The resampled time series would have {} values, the maximum is {}"
+Q400_UNKNOWN_COLUMN = "Column {} is not defined in the data catalog"
+Q400_INVALID_PREDICATE = "Invalid value for the predicate {} {}"
+Q502_PAGE_FAILED = "Orion failed to return the entities {} to {} of the query"
+Q502_SERIES_FAILED = "QuantumLeap failed to return the series of {}: HTTP {}"
+
+A403_NOT_ADMIN = "Only admin users can access this resource"
+A404_PROFILE_NOT_FOUND = "Profile {} not found"
+
+I404_JOB_NOT_FOUND = "Ingestion job {} not found"
+I403_JOB_OWNER_ERROR = "You don't have permissions to access this ingestion job"
+I502_BATCH_REJECTED = "Orion rejected the batch upsert"
+
+M404_METRICS_NOT_AVAILABLE = "Metrics are not available in this server"
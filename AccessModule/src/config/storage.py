@@ -0,0 +1,41 @@
+import os
+# Local working directory of the AccessModule (spools, caches, snapshots...)
+DATA_PATH = os.getenv("ODS_DATA_PATH", "data")
+
+INGESTION_SPOOL_PATH = os.getenv("INGESTION_SPOOL_PATH", os.path.join(DATA_PATH, "spool"))
+
+# Materialized full exports of the data catalogs
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", os.path.join(DATA_PATH, "snapshots"))
+
+# Change counters of the data catalogs, shared by all the server processes
+CHANGES_PATH = os.getenv("CHANGES_PATH", os.path.join(DATA_PATH, "changes"))
+
+# Internal location of a reverse proxy (e.g. Nginx) serving FIWARE_FILES_PATH. When set, downloads
+# are delegated to the proxy with an X-Accel-Redirect header, so it sends the files with sendfile
+DOWNLOAD_ACCEL_REDIRECT = os.getenv("DOWNLOAD_ACCEL_REDIRECT")
+
+# Local index of the stored files (SQLite)
+FILE_INDEX_PATH = os.getenv("FILE_INDEX_PATH", os.path.join(os.getenv("FIWARE_FILES_PATH", DATA_PATH), ".index.sqlite"))
+
+# Compression at rest of the uploaded files ("none" or "zstd"), only for the compressible extensions
+FILE_COMPRESSION = os.getenv("FILE_COMPRESSION", "none")
+FILE_COMPRESSION_LEVEL = int(os.getenv("FILE_COMPRESSION_LEVEL", "3"))
+FILE_COMPRESSIBLE_EXTENSIONS = os.getenv(
+    "FILE_COMPRESSIBLE_EXTENSIONS", ".csv,.tsv,.txt,.log,.json,.jsonl,.ndjson,.geojson,.xml,.yaml,.yml,.md,.html"
+).split(",")
+
+# Layout of the file store: "sharded" (hash-prefixed subdirectories) or "flat" (one directory per owner)
+FILE_LAYOUT = os.getenv("FILE_LAYOUT", "sharded")
+
+# Subscribers of the notification fan-out (SQLite), shared by all the server processes
+NOTIFY_SUBSCRIBERS_PATH = os.getenv("NOTIFY_SUBSCRIBERS_PATH", os.path.join(DATA_PATH, "subscribers.sqlite"))
+
+# Event logs of the catalog changes, followed by the live streams of all the server processes
+EVENTS_PATH = os.getenv("EVENTS_PATH", os.path.join(DATA_PATH, "events"))
+
+# Directory shared by the server processes to aggregate the Prometheus metrics (multiprocess mode),
+# it must be cleared when the server starts (gunicorn.conf.py does it)
+METRICS_MULTIPROC_PATH = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Profiles of the requests profiled on demand
+PROFILES_PATH = os.getenv("PROFILES_PATH", os.path.join(DATA_PATH, "profiles"))
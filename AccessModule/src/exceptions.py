@@ -10,3 +10,5 @@ class DataCatalogNotFound(ODSException):
     pass
 class DataCatalogUpdateError(ODSException):
     pass
+class JobNotFound(ODSException):
+    pass
@@ -0,0 +1,24 @@
+"""
+gunicorn.conf.py
+
+Settings of the gunicorn server, loaded from the working directory. With several worker
+processes, the Prometheus metrics are aggregated through `PROMETHEUS_MULTIPROC_DIR`: the
+directory is cleared when the server starts, and the live metrics of each worker are
+discarded when it exits.
+"""
+
+import os
+import shutil
+
+
+def on_starting(server):
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        # Metrics left by a previous run would be added to the new ones
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    import metrics
+    metrics.mark_process_dead(worker.pid)
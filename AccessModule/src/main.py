@@ -2,7 +2,12 @@ from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 
 import config
+import metrics
+import profiling
 from routers import api_router
+import services.ingestion as service_ingestion
+import services.snapshots as service_snapshots
+import services.notifications as service_notifications
 
 app = FastAPI(    
     title=config.TITLE,
@@ -12,6 +17,18 @@ app = FastAPI(
 @app.on_event("startup")
 async def setup():
     app.description = config.DESCRIPTION
+    service_ingestion.start_worker()
+    service_snapshots.start_worker()
+    service_notifications.start_hub()
+
+@app.on_event("shutdown")
+async def teardown():
+    service_ingestion.stop_worker()
+    service_snapshots.stop_worker()
+    service_notifications.stop_hub()
+
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(profiling.ProfilingMiddleware)
 
 app.include_router(api_router)
 
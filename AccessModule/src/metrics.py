@@ -0,0 +1,190 @@
+"""
+metrics.py
+
+This module provides the Prometheus metrics of the AccessModule, exposed on `/metrics`:
+
+- HTTP requests: count, latency (until the last byte of the response is sent) and size of the
+  request and response bodies, per route template.
+- Orion and QuantumLeap requests: latency per operation, and failures per operation and status.
+- CPU-bound stages (password hashing, catalog parsing): latency per stage.
+- Ingestion: entities and rows inserted per catalog type and mode (sync or async).
+- Query results cache and snapshots: lookups per result (hit or miss).
+
+Under gunicorn each worker process keeps its own metrics. They are aggregated across the
+workers with the multiprocess mode of `prometheus_client`, enabled by setting
+`PROMETHEUS_MULTIPROC_DIR` to a directory cleared when the server starts (see gunicorn.conf.py).
+
+The metrics are only available when `prometheus_client` is installed.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:
+    prometheus_client = None
+
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+import config
+
+UNMATCHED_ROUTE = "<unmatched>"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+# From 256 bytes to 1 GB, multiplying by 4
+SIZE_BUCKETS = tuple(4 ** exponent for exponent in range(4, 16))
+
+if prometheus_client:
+    HTTP_REQUESTS = prometheus_client.Counter(
+        "ods_http_requests_total", "HTTP requests answered", ["method", "route", "status"]
+    )
+    HTTP_LATENCY = prometheus_client.Histogram(
+        "ods_http_request_duration_seconds", "Time to answer an HTTP request, until its last byte is sent",
+        ["method", "route"], buckets=LATENCY_BUCKETS
+    )
+    HTTP_REQUEST_SIZE = prometheus_client.Histogram(
+        "ods_http_request_size_bytes", "Size of the HTTP request bodies", ["method", "route"], buckets=SIZE_BUCKETS
+    )
+    HTTP_RESPONSE_SIZE = prometheus_client.Histogram(
+        "ods_http_response_size_bytes", "Size of the HTTP response bodies", ["method", "route"], buckets=SIZE_BUCKETS
+    )
+    BACKEND_LATENCY = prometheus_client.Histogram(
+        "ods_backend_request_duration_seconds", "Time of the requests to Orion and QuantumLeap",
+        ["backend", "operation"], buckets=LATENCY_BUCKETS
+    )
+    BACKEND_ERRORS = prometheus_client.Counter(
+        "ods_backend_errors_total", "Failed requests to Orion and QuantumLeap (status 0 if there was no response)",
+        ["backend", "operation", "status"]
+    )
+    STAGE_LATENCY = prometheus_client.Histogram(
+        "ods_stage_duration_seconds", "Time spent in CPU-bound stages", ["stage"], buckets=LATENCY_BUCKETS
+    )
+    INGESTED_ENTITIES = prometheus_client.Counter(
+        "ods_ingested_entities_total", "Entities inserted (or queued in async mode)", ["catalog_type", "mode"]
+    )
+    INGESTED_ROWS = prometheus_client.Counter(
+        "ods_ingested_rows_total", "Rows inserted (or queued in async mode), table rows count one by one",
+        ["catalog_type", "mode"]
+    )
+    CACHE_LOOKUPS = prometheus_client.Counter(
+        "ods_cache_lookups_total", "Lookups of query results in the cache and the snapshots", ["cache", "result"]
+    )
+
+
+def is_available() -> bool:
+    return prometheus_client is not None
+
+
+def observe_backend(backend: str, operation: str, started: float, status: Optional[int]):
+    """Record a request to Orion or QuantumLeap, started at `started` (`time.perf_counter`)."""
+    if not prometheus_client:
+        return
+    BACKEND_LATENCY.labels(backend, operation).observe(time.perf_counter() - started)
+    if status is None or status >= 400:
+        BACKEND_ERRORS.labels(backend, operation, str(status or 0)).inc()
+
+
+@contextmanager
+def timed(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if prometheus_client:
+            STAGE_LATENCY.labels(stage).observe(time.perf_counter() - started)
+
+
+def count_ingested(catalog_type: str, mode: str, entities: int = 1, rows: Optional[int] = None):
+    if not prometheus_client:
+        return
+    # Catalog types are enums
+    catalog_type = getattr(catalog_type, "value", catalog_type)
+    INGESTED_ENTITIES.labels(catalog_type, mode).inc(entities)
+    INGESTED_ROWS.labels(catalog_type, mode).inc(entities if rows is None else rows)
+
+
+def count_lookup(cache: str, hit: bool):
+    if prometheus_client:
+        CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def render() -> Tuple[bytes, str]:
+    """
+    Render the metrics in the Prometheus text format. In multiprocess mode, the metrics of all
+    the worker processes are aggregated.
+
+    Returns:
+        Tuple[bytes, str]: The rendered metrics and their media type.
+    """
+    registry = prometheus_client.REGISTRY
+    if config.METRICS_MULTIPROC_PATH:
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=config.METRICS_MULTIPROC_PATH)
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int):
+    """Discard the live metrics of a worker process that exited (its counters are kept)."""
+    if prometheus_client and config.METRICS_MULTIPROC_PATH:
+        multiprocess.mark_process_dead(pid, config.METRICS_MULTIPROC_PATH)
+
+
+def _get_route(scope: Scope) -> str:
+    # The route template, rather than the path, so the IDs in the paths don't multiply the series.
+    # As in the router, a route matching the path but not the method is only used if none matches both
+    partial = UNMATCHED_ROUTE
+    for route in getattr(scope.get("app"), "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial == UNMATCHED_ROUTE:
+            partial = route.path
+    return partial
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording the count, latency and body sizes of the HTTP requests."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not prometheus_client:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        # Resolved before the request is handled, the routing updates the scope
+        route = _get_route(scope)
+        request_size = 0
+        response_size = 0
+        status = 500
+
+        async def receive_counted() -> Message:
+            nonlocal request_size
+            message = await receive()
+            if message["type"] == "http.request":
+                request_size += len(message.get("body", b""))
+            return message
+
+        async def send_counted(message: Message):
+            nonlocal response_size, status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            elif message["type"] == "http.response.zerocopy":
+                response_size += message.get("count") or 0
+            await send(message)
+
+        try:
+            await self.app(scope, receive_counted, send_counted)
+        finally:
+            method = scope["method"]
+            HTTP_REQUESTS.labels(method, route, str(status)).inc()
+            HTTP_LATENCY.labels(method, route).observe(time.perf_counter() - started)
+            HTTP_REQUEST_SIZE.labels(method, route).observe(request_size)
+            HTTP_RESPONSE_SIZE.labels(method, route).observe(response_size)
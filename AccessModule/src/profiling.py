@@ -0,0 +1,241 @@
+"""
+profiling.py
+
+This module provides the on-demand profiling of single requests. A request sent by an admin user
+(`ODS_ADMIN_USERS`) with the `X-ODS-Profile: 1` header or the `profile=1` query parameter is
+profiled by a sampling profiler: a thread records the stacks of the server threads every
+`PROFILING_INTERVAL` seconds until the response is sent. Requests without the flag are not
+affected, the profiler only runs while a profiled request is being answered.
+
+The samples are stored as collapsed stacks (one `frame;frame;frame count` line per stack),
+which flamegraph.pl and speedscope read, and retrieved from the `/admin/profiles` endpoints.
+The ID of the profile is returned in the `X-ODS-Profile-Id` header of the profiled response.
+
+All the threads of the server process are sampled (except the idle ones), so the requests
+answered concurrently by the same process appear in the profile, under their own thread.
+
+Layout (shared by all the server processes):
+- {profile_id}.json: Request, duration and number of samples of the profile.
+- {profile_id}.collapsed: Collapsed stacks of the profile.
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional
+from urllib.parse import parse_qs
+
+from pydantic import BaseModel
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+import config
+import exceptions
+import services.auth as service_auth
+
+PROFILE_HEADER = "x-ods-profile"
+PROFILE_ID_HEADER = "x-ods-profile-id"
+PROFILE_HEADER_BYTES = PROFILE_HEADER.encode()
+_PROFILE_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+_FLAG_VALUES = ("1", "true", "yes")
+
+# Innermost frames of the threads waiting for work, which are not sampled
+_IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("_asyncio.py", "run"),
+}
+
+
+class Profile(BaseModel):
+    id: str
+    method: str
+    path: str
+    user: str
+    status: Optional[int] = None
+    created_at: datetime
+    duration: float
+    samples: int
+
+
+def _profile_path(profile_id: str, extension: str) -> str:
+    return os.path.join(config.PROFILES_PATH, f"{profile_id}.{extension}")
+
+
+def _frame_name(code, prefixes: List[str]) -> str:
+    # Paths relative to the import paths, and without the separators of the collapsed format
+    filename = code.co_filename
+    for prefix in prefixes:
+        if filename.startswith(prefix + os.sep):
+            filename = filename[len(prefix) + 1:]
+            break
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ",")
+
+
+class Sampler(threading.Thread):
+    """Background thread recording the stacks of the other threads at a fixed interval."""
+
+    def __init__(self):
+        super().__init__(name="profiler", daemon=True)
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+        self._prefixes = sorted({os.path.abspath(path) for path in sys.path if path}, key=len, reverse=True)
+        self._names = {}
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def _sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == self.ident:
+                continue
+            code = frame.f_code
+            if (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+                continue
+            stack = []
+            while frame is not None:
+                name = self._names.get(frame.f_code)
+                if name is None:
+                    name = self._names[frame.f_code] = _frame_name(frame.f_code, self._prefixes)
+                stack.append(name)
+                frame = frame.f_back
+            stack.append(names.get(thread_id, str(thread_id)).replace(";", ","))
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def run(self):
+        deadline = time.monotonic() + config.PROFILING_MAX_SECONDS
+        # Sampled at once, so even the shortest requests have a sample
+        while True:
+            self._sample()
+            if self._stopped.wait(config.PROFILING_INTERVAL) or time.monotonic() >= deadline:
+                return
+
+
+def _is_requested(scope: Scope) -> bool:
+    for name, value in scope["headers"]:
+        if name == PROFILE_HEADER_BYTES:
+            return value.decode("latin-1").lower() in _FLAG_VALUES
+    query_string = scope.get("query_string", b"")
+    if b"profile=" not in query_string:
+        return False
+    query = parse_qs(query_string.decode("latin-1"))
+    return any(value.lower() in _FLAG_VALUES for value in query.get("profile", []))
+
+
+def _get_admin(scope: Scope) -> Optional[str]:
+    scheme, _, token = Headers(scope=scope).get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    username = service_auth.get_token_username(token)
+    return username if username in config.ADMIN_USERS else None
+
+
+def _save(profile: Profile, sampler: Sampler):
+    os.makedirs(config.PROFILES_PATH, exist_ok=True)
+    collapsed = "".join(f"{stack} {count}\n" for stack, count in sampler.stacks.most_common())
+    for extension, content in (("collapsed", collapsed), ("json", profile.model_dump_json())):
+        path = _profile_path(profile.id, extension)
+        with open(f"{path}.{os.getpid()}.tmp", "w") as buffer:
+            buffer.write(content)
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+    _remove_old_profiles()
+
+
+def _remove_old_profiles():
+    profiles = sorted(
+        (entry for entry in os.scandir(config.PROFILES_PATH) if entry.name.endswith(".json")),
+        key=lambda entry: entry.stat().st_mtime, reverse=True
+    )
+    for entry in profiles[config.PROFILES_MAX:]:
+        profile_id = entry.name[:-len(".json")]
+        for extension in ("json", "collapsed"):
+            try:
+                os.remove(_profile_path(profile_id, extension))
+            except FileNotFoundError:
+                pass
+
+
+def get_profiles() -> List[Profile]:
+    """The stored profiles, the newest first."""
+    if not os.path.isdir(config.PROFILES_PATH):
+        return []
+    profiles = []
+    for entry in os.scandir(config.PROFILES_PATH):
+        if entry.name.endswith(".json"):
+            try:
+                with open(entry.path) as buffer:
+                    profiles.append(Profile(**json.load(buffer)))
+            except (FileNotFoundError, ValueError):
+                continue
+    return sorted(profiles, key=lambda profile: profile.created_at, reverse=True)
+
+
+def get_profile_path(profile_id: str) -> str:
+    """
+    Path of the collapsed stacks of a profile.
+
+    Raises:
+        exceptions.ODSException: If the profile does not exist.
+    """
+    path = _profile_path(profile_id, "collapsed")
+    if not _PROFILE_ID_PATTERN.fullmatch(profile_id) or not os.path.exists(path):
+        raise exceptions.ODSException(config.A404_PROFILE_NOT_FOUND.format(profile_id))
+    return path
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling the requests flagged by an admin user."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        # The requests that are not profiled only pay for a header lookup
+        if scope["type"] != "http" or not _is_requested(scope):
+            await self.app(scope, receive, send)
+            return
+        user = _get_admin(scope)
+        if not user:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+        status = None
+
+        async def send_with_id(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", []), (PROFILE_ID_HEADER.encode(), profile_id.encode())]
+            await send(message)
+
+        created_at = datetime.utcnow()
+        started = time.perf_counter()
+        sampler = Sampler()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            sampler.stop()
+            _save(Profile(
+                id=profile_id,
+                method=scope["method"],
+                path=scope["path"],
+                user=user,
+                status=status,
+                created_at=created_at,
+                duration=time.perf_counter() - started,
+                samples=sampler.samples
+            ), sampler)
@@ -1,39 +1,57 @@
+import time
+
 import requests
 
 import config
+import metrics
+from exceptions import FiwareException
 from schemas import DataCatalogCreate
 
+
+def _send(operation: str, method, *args, **kwargs) -> requests.Response:
+    # Times every request to Orion, the failures are counted per operation and status
+    started = time.perf_counter()
+    status = None
+    try:
+        response = method(*args, **kwargs)
+        status = response.status_code
+        return response
+    finally:
+        metrics.observe_backend("orion", operation, started, status)
+
 def get_datacatalog(catalog_id: str) -> requests.Response:
     url = config.ORION_URL + config.ORION_PATH_GET_ENTITY.format(catalog_id)
     headers = {"Link": f'<{config.FIWARE_CONTEXT}>; rel="http://www.w3.org/ns/json-ld#context"; type="application/ld+json"'}
-    response = requests.get(url, headers=headers)
+    response = _send("get_datacatalog", requests.get, url, headers=headers)
     return None if not response.ok else response
 
 def send_entity(entity_json: list[dict]) -> requests.Response:
     print(entity_json)
     url = config.ORION_URL + config.ORION_PATH_UPLOAD_ENTITY
     headers = {"Content-Type": "application/ld+json"}
-    response = requests.post(url, json=entity_json, headers=headers)
+    response = _send("upsert", requests.post, url, json=entity_json, headers=headers)
     return None if not response.ok else response
 
 def subscribe(catalog_id: dict) -> requests.Response:
     url = config.ORION_URL + config.ORION_PATH_SUBSCRIBE
     headers = {"Content-Type": "application/ld+json"}
-    response = requests.post(url=url, json=catalog_id, headers=headers)
+    response = _send("subscribe", requests.post, url=url, json=catalog_id, headers=headers)
     return None if not response.ok else response
 
 def delete(entity_id: str) -> requests.Response:
     url = config.ORION_URL + config.ORION_PATH_DELETE.format(entity_id)
-    response = requests.delete(url=url)
+    response = _send("delete", requests.delete, url=url)
     return None if not response.ok else response
 
 def get_specific_entity(entity_full_id: str):
     url = config.ORION_URL + config.ORION_PATH_GET_ENTITY.format(entity_full_id)
     headers = {"Link": f'<{config.FIWARE_CONTEXT}>; rel="http://www.w3.org/ns/json-ld#context"; type="application/ld+json"'}
-    response = requests.get(url, headers=headers)
+    response = _send("get_entity", requests.get, url, headers=headers)
     return None if not response.ok else response
 
-def get_entity_full(type_id: str, method: str = "keyValues", fields: list[str] = ['*'], query: str = None):
+def get_entity_full(type_id: str, method: str = "keyValues", fields: list[str] = ['*'], query: str = None,
+                    id_pattern: str = None, limit: int = None, offset: int = None, count: bool = False,
+                    geo_query: dict = None):
     url = config.ORION_URL + config.ORION_PATH_GET
     headers = {"Link": f'<{config.FIWARE_CONTEXT}>; rel="http://www.w3.org/ns/json-ld#context"; type="application/ld+json"'}
 
@@ -45,12 +63,59 @@ def get_entity_full(type_id: str, method: str = "keyValues", fields: list[str] =
         params.append(("attrs", ','.join(fields)))
     if query:
         params.append(("q", query))
+    if id_pattern:
+        params.append(("idPattern", id_pattern))
+    if limit is not None:
+        params.append(("limit", limit))
+    if offset:
+        params.append(("offset", offset))
+    if count:
+        params.append(("count", "true"))
+    if geo_query:
+        params.extend(geo_query.items())
     print(params)
-    response = requests.get(url=url, params=params, headers=headers)
+    response = _send("count" if count else "query", requests.get, url=url, params=params, headers=headers)
     return None if not response.ok else response
 
+def iter_entity_pages(type_id: str, method: str = "keyValues", fields: list[str] = ['*'], query: str = None,
+                      id_pattern: str = None, page_size: int = None, offset: int = 0, limit: int = None,
+                      geo_query: dict = None):
+    """
+    Yields the entities of a type page by page, following the Orion offset pagination.
+    The entities can be restricted to a window of `limit` entities starting at `offset`.
+
+    Raises:
+        FiwareException: If Orion fails to return a page, so a failure is not taken for the end of the entities.
+    """
+    page_size = page_size or config.ORION_PAGE_SIZE
+    remaining = limit
+    while remaining is None or remaining > 0:
+        request_size = page_size if remaining is None else min(page_size, remaining)
+        response = get_entity_full(type_id, method, fields, query, id_pattern, limit=request_size, offset=offset, geo_query=geo_query)
+        if response is None:
+            raise FiwareException(config.Q502_PAGE_FAILED.format(offset, offset + request_size))
+        page = response.json()
+        if page:
+            yield page
+        if len(page) < request_size:
+            return
+        offset += request_size
+        if remaining is not None:
+            remaining -= request_size
+
+def count_entities(type_id: str, fields: list[str] = ['*'], query: str = None, id_pattern: str = None,
+                   geo_query: dict = None) -> int:
+    """Counts the entities of a type matching the filters, from the NGSILD-Results-Count header."""
+    response = get_entity_full(type_id, None, fields, query, id_pattern, limit=1, count=True, geo_query=geo_query)
+    if not response:
+        return 0
+    return int(response.headers.get("NGSILD-Results-Count", 0))
+
+def get_entities_query(entities: list[str] = None) -> str:
+    return "|".join([f"name~={entitie}" for entitie in entities]) if entities and len(entities)>0 else None
+
 def get_entity(type_id: str, method: str = "keyValues", entities: list[str] = None, fields: list[str] = ['*'], filters: dict = {}):
-    return get_entity_full(type_id, method, fields, "|".join([f"name~={entitie}" for entitie in entities]) if entities and len(entities)>0 else None)
+    return get_entity_full(type_id, method, fields, get_entities_query(entities))
 
 def query_entity(type_id: str, entity_patterns:list[str], attributes: list[str] = None):
     url = config.ORION_URL + config.ORION_PATH_QUERY
@@ -75,5 +140,5 @@ def query_entity(type_id: str, entity_patterns:list[str], attributes: list[str]
     if attributes and len(attributes) > 0:
         body["attrs"] = attributes 
     print(body)
-    response = requests.post(url=url, json=body, headers=headers)
+    response = _send("batch_query", requests.post, url=url, json=body, headers=headers)
     return None if not response.ok else response
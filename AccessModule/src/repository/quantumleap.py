@@ -0,0 +1,25 @@
+import time
+from urllib.parse import quote
+
+import requests
+
+import config
+import metrics
+
+def get_entity_attrs(entity_id: str, attributes: list[str] = None, params: dict = {}) -> requests.Response:
+    """
+    Retrieves the history of the attributes of an entity. The response is returned whatever its
+    status, as QuantumLeap answers 404 when there are no records for the query.
+    """
+    url = config.QL_URL + config.QL_PATH_ENTITY_ATTRS.format(quote(entity_id, safe=":"))
+    query_params = dict(params)
+    if attributes and len(attributes) > 0:
+        query_params["attrs"] = ','.join(attributes)
+    started = time.perf_counter()
+    status = None
+    try:
+        response = requests.get(url=url, params=query_params)
+        status = response.status_code
+    finally:
+        metrics.observe_backend("quantumleap", "get_entity_attrs", started, status)
+    return response
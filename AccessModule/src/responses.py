@@ -0,0 +1,206 @@
+"""
+responses.py
+
+This module provides the file response of the download endpoints. Unlike the Starlette
+`FileResponse`, it serves byte ranges, so interrupted downloads can be resumed and large
+files can be fetched in parallel chunks:
+
+- `Range` with one range answers `206 Partial Content` with the selected bytes.
+- `Range` with several ranges answers a `multipart/byteranges` body.
+- `If-Range` only honours the ranges while the file is unchanged (same ETag or Last-Modified).
+- Ranges outside the file answer `416 Range Not Satisfiable`.
+
+The bytes are sent with the ASGI zero-copy extension when the server supports it, so the
+kernel copies them from the file to the socket, and otherwise read in large chunks.
+"""
+
+import hashlib
+import os
+import secrets
+from email.utils import formatdate, parsedate_to_datetime
+from mimetypes import guess_type
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+import config
+
+ZEROCOPY_EXTENSION = "http.response.zerocopy"
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Parse a `Range` header into the byte ranges it selects.
+
+    Args:
+        header (Optional[str]): The value of the `Range` header.
+        size (int): The size of the file.
+
+    Returns:
+        Optional[List[Tuple[int, int]]]: The first and last byte of each range, sorted and with
+        the overlapping ranges merged. None if the header is missing, malformed or has more than
+        `DOWNLOAD_MAX_RANGES` ranges, so the whole file is sent; an empty list if no range is satisfiable.
+    """
+    if not header:
+        return None
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes" or not specs.strip():
+        return None
+    specs = specs.split(",")
+    if len(specs) > config.DOWNLOAD_MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        start, separator, end = spec.strip().partition("-")
+        if not separator or not (start or end):
+            return None
+        if (start and not start.isdigit()) or (end and not end.isdigit()):
+            return None
+        if not start:
+            # Suffix range: the last N bytes of the file
+            if int(end) > 0 and size > 0:
+                ranges.append((max(size - int(end), 0), size - 1))
+            continue
+        if end and int(end) < int(start):
+            return None
+        first, last = int(start), min(int(end) if end else size - 1, size - 1)
+        if first < size:
+            ranges.append((first, last))
+
+    merged: List[Tuple[int, int]] = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def content_disposition(filename: str) -> str:
+    # Non ASCII filenames are sent encoded (RFC 6266)
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def _if_range_matches(if_range: Optional[str], etag: str, last_modified: float) -> bool:
+    # Without If-Range the ranges are always honoured. Weak ETags never match
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag
+    try:
+        return parsedate_to_datetime(if_range).timestamp() == int(last_modified)
+    except (TypeError, ValueError):
+        return False
+
+
+class RangeFileResponse(Response):
+    """File response that serves the byte ranges requested in the request headers."""
+
+    def __init__(
+        self,
+        path: str,
+        request_headers: Headers,
+        filename: Optional[str] = None,
+        media_type: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ):
+        self.path = path
+        self.background = None
+        self.media_type = media_type or guess_type(filename or path)[0] or "application/octet-stream"
+        stat_result = os.stat(path)
+        size = stat_result.st_size
+        # Same validators as the Starlette FileResponse
+        etag = '"' + hashlib.md5(f"{stat_result.st_mtime}-{size}".encode(), usedforsecurity=False).hexdigest() + '"'
+        headers = {
+            **(headers or {}),
+            "accept-ranges": "bytes",
+            "etag": etag,
+            "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        }
+        if filename:
+            headers["content-disposition"] = content_disposition(filename)
+
+        ranges = None
+        if _if_range_matches(request_headers.get("if-range"), etag, stat_result.st_mtime):
+            ranges = parse_range(request_headers.get("range"), size)
+
+        # Each part is sent as the bytes written before it and its range
+        self.parts: List[Tuple[bytes, int, int]] = []
+        self.epilogue = b""
+        if ranges == []:
+            self.status_code = 416
+            headers["content-range"] = f"bytes */{size}"
+            headers["content-length"] = "0"
+        elif ranges is None:
+            self.status_code = 200
+            self.parts = [(b"", 0, size)] if size else []
+            headers["content-length"] = str(size)
+        elif len(ranges) == 1:
+            first, last = ranges[0]
+            self.status_code = 206
+            self.parts = [(b"", first, last - first + 1)]
+            headers["content-range"] = f"bytes {first}-{last}/{size}"
+            headers["content-length"] = str(last - first + 1)
+        else:
+            self.status_code = 206
+            boundary = secrets.token_hex(16)
+            for index, (first, last) in enumerate(ranges):
+                prefix = (
+                    f"--{boundary}\r\n"
+                    f"Content-Type: {self.media_type}\r\n"
+                    f"Content-Range: bytes {first}-{last}/{size}\r\n\r\n"
+                ).encode()
+                # Every part but the first one ends the previous part with a line break
+                self.parts.append((prefix if index == 0 else b"\r\n" + prefix, first, last - first + 1))
+            self.epilogue = f"\r\n--{boundary}--\r\n".encode()
+            headers["content-length"] = str(
+                sum(len(prefix) + count for prefix, _, count in self.parts) + len(self.epilogue)
+            )
+            self.media_type = f"multipart/byteranges; boundary={boundary}"
+        self.init_headers(headers)
+
+    async def _send_part(self, send: Send, file, offset: int, count: int, zerocopy: bool):
+        if zerocopy:
+            await send({
+                "type": ZEROCOPY_EXTENSION,
+                "file": file,
+                "offset": offset,
+                "count": count,
+                "more_body": True,
+            })
+            return
+        end = offset + count
+        while offset < end:
+            chunk = await anyio.to_thread.run_sync(
+                os.pread, file.fileno(), min(config.DOWNLOAD_CHUNK_SIZE, end - offset), offset
+            )
+            if not chunk:
+                # The file was truncated while being sent
+                raise RuntimeError(f"Unexpected end of file {self.path}")
+            offset += len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD" or not self.parts:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        zerocopy = ZEROCOPY_EXTENSION in scope.get("extensions", {})
+        file = await anyio.to_thread.run_sync(open, self.path, "rb")
+        try:
+            for prefix, offset, count in self.parts:
+                if prefix:
+                    await send({"type": "http.response.body", "body": prefix, "more_body": True})
+                await self._send_part(send, file, offset, count, zerocopy)
+        finally:
+            file.close()
+        await send({"type": "http.response.body", "body": self.epilogue, "more_body": False})
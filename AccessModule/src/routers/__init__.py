@@ -6,10 +6,14 @@ from routers.insert import inserdata_router
 from routers.query import query_router
 from routers.subscription import subscription_router
 from routers.download import download_router
+from routers.metrics import metrics_router
+from routers.admin import admin_router
 api_router = APIRouter()
 api_router.include_router(auth_router, prefix= "/auth")
 api_router.include_router(datacatalog_router, prefix= "/datacatalog")
 api_router.include_router(query_router, prefix="/query")
 api_router.include_router(inserdata_router, prefix="/insert")
 api_router.include_router(subscription_router, prefix="/subscription")
-api_router.include_router(download_router, prefix="/download")
\ No newline at end of file
+api_router.include_router(download_router, prefix="/download")
+api_router.include_router(metrics_router, prefix="/metrics")
+api_router.include_router(admin_router, prefix="/admin")
\ No newline at end of file
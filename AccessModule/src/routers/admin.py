@@ -0,0 +1,55 @@
+"""
+Admin API Endpoints
+
+This module defines the FastAPI routes reserved to the admin users (`ODS_ADMIN_USERS`), to
+retrieve the profiles of the requests profiled on demand.
+"""
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+from typing import Annotated, List
+
+import profiling
+from services.auth import get_current_admin_user
+from exceptions import ODSException
+from schemas import User
+
+admin_router = APIRouter()
+
+@admin_router.get("/profiles", summary="List the request profiles", tags=["Admin"])
+async def list_profiles(
+    current_user: Annotated[User, Depends(get_current_admin_user)],
+) -> List[profiling.Profile]:
+    """
+    List the stored profiles, the newest first. A request is profiled when an admin user sends
+    it with the `X-ODS-Profile: 1` header or the `profile=1` query parameter.
+
+    Args:
+        current_user (User): The admin user making the request (injected by FastAPI dependency).
+
+    Returns:
+        List[Profile]: The request, duration and number of samples of each profile.
+    """
+    return profiling.get_profiles()
+
+
+@admin_router.get("/profiles/{profile_id}", summary="Download a request profile", tags=["Admin"])
+async def get_profile(
+    profile_id: str,
+    current_user: Annotated[User, Depends(get_current_admin_user)],
+):
+    """
+    Download a profile as collapsed stacks, which flamegraph.pl and speedscope read.
+
+    Args:
+        profile_id (str): The ID of the profile, returned in the `X-ODS-Profile-Id` header of the profiled request.
+        current_user (User): The admin user making the request (injected by FastAPI dependency).
+
+    Raises:
+        HTTPException: 404 if the profile does not exist.
+    """
+    try:
+        path = profiling.get_profile_path(profile_id)
+    except ODSException as ex:
+        raise HTTPException(status_code=404, detail=ex.args)
+    return FileResponse(path, media_type="text/plain", filename=f"{profile_id}.collapsed")
@@ -8,12 +8,15 @@ authentication, and access to specific operations may be restricted based on
 the user's permissions.
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
 from typing import Annotated, Optional
+import json
 
 import config
 from services.auth import get_current_active_user
 import services.datacatalog as service
+import services.conditional as service_conditional
+import services.snapshots as service_snapshots
 from exceptions import (
     ODSPermissionException, 
     ODSException, 
@@ -51,23 +54,39 @@ async def register_datacatalog(
 
 
 @datacatalog_router.get("/{catalog_id}", response_model=DataCatalogCreate, tags=["Data Catalog"])
-async def get_datacatalog(catalog_id: str):
+async def get_datacatalog(
+    catalog_id: str,
+    response: Response,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+    if_modified_since: Annotated[Optional[str], Header()] = None,
+):
     """
     Retrieve a Data Catalog by its ID.
 
     Args:
         catalog_id (str): The unique identifier for the catalog.
+        response (Response): The response, to set its validators.
+        if_none_match (Optional[str]): ETags of the copies held by the client.
+        if_modified_since (Optional[str]): Date of the copy held by the client.
 
     Returns:
-        DataCatalogCreate: The data catalog object if found.
+        DataCatalogCreate: The data catalog object if found, or a 304 response if it has not changed.
 
     Raises:
         HTTPException: If the catalog is not found, a 404 error is raised.
     """
+    # The validators are built before retrieving the catalog, so they never describe a newer catalog
+    etag, last_modified = service_conditional.get_catalog_validators(catalog_id)
+    headers = service_conditional.get_headers(etag, last_modified)
     try:
-        return service.get_catalog(catalog_id)
+        datacatalog = service.get_catalog(catalog_id)
     except ODSException as ex:
         raise HTTPException(status_code=404, detail=ex.args)
+    # Evaluated once the catalog is known to exist, so a deleted catalog is never reported as unchanged
+    if service_conditional.is_not_modified(etag, last_modified, if_none_match, if_modified_since):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return datacatalog
 
 
 @datacatalog_router.put("/{catalog_id}", response_model=DataCatalogCreate, tags=["Data Catalog"])
@@ -126,6 +145,7 @@ async def delete_datacatalog(
     try:
         result = service.delete_catalog(catalog_id, current_user.username)
         if result:
+            service_snapshots.remove_catalog(catalog_id)
             return Response(status_code=200)
     except ODSPermissionException as ex:
         raise HTTPException(status_code=403, detail=ex.args)
@@ -134,25 +154,39 @@ async def delete_datacatalog(
 
 
 @datacatalog_router.post("/page", tags=["Data Catalog"])
-async def page_catalog(query: CatalogQueryRequest) -> CatalogQueryResponse:
+async def page_catalog(
+    query: CatalogQueryRequest,
+    response: Response,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+    if_modified_since: Annotated[Optional[str], Header()] = None,
+) -> CatalogQueryResponse:
     """
     Retrieve multiple Data Catalogs using a query. Pagination is supported.
 
     Args:
         query (dict): The filter criteria for retrieving the catalogs.
+        response (Response): The response, to set its validators.
+        if_none_match (Optional[str]): ETags of the copies held by the client.
+        if_modified_since (Optional[str]): Date of the copy held by the client.
 
     Returns:
-        List[DataCatalogCreate]: A list of matching data catalogs.
+        List[DataCatalogCreate]: A list of matching data catalogs, or a 304 response if none of them has changed.
 
     Raises:
         HTTPException: 
             - 403 if the user does not have permission to access the catalogs.
             - 404 if no catalogs are found.
     """
+    etag, last_modified = service_conditional.get_catalog_list_validators(json.dumps(query.model_dump(mode="json"), sort_keys=True))
+    headers = service_conditional.get_headers(etag, last_modified)
     try:
         catalogs = service.get_catalogs(query)
-        return CatalogQueryResponse(size=len(catalogs), entries=catalogs)
     except ODSPermissionException as ex:
         raise HTTPException(status_code=403, detail=ex.args)
     except DataCatalogNotFound as ex:
         raise HTTPException(status_code=404, detail=ex.args)
+    # Evaluated once the catalogs are retrieved, so the request fails as it would without the headers
+    if service_conditional.is_not_modified(etag, last_modified, if_none_match, if_modified_since):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return CatalogQueryResponse(size=len(catalogs), entries=catalogs)
@@ -6,34 +6,48 @@ It includes endpoints for fetching specific files using the catalog name, file o
 and entity ID.
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Response
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
 from typing import Annotated
+import itertools
+from urllib.parse import quote
+from mimetypes import guess_type
 import os
 
 from utils import json_to_csv, table_to_csv
 import config
 from services.auth import get_current_active_user
 import services.files as service_file
+import services.archive as service_archive
+import services.compression as service_compression
+import services.datacatalog as service_datacatalog
 from exceptions import (
     ODSPermissionException, 
     ODSException, 
     DataCatalogUpdateError, 
     DataCatalogNotFound
 )
-from schemas import User, QueryRequest, TypeCatalog, OutputFormat
+from schemas import User, QueryRequest, TypeCatalog, OutputFormat, BulkDownloadRequest
+from responses import RangeFileResponse, content_disposition
 
 # APIRouter object to define all routes for file download
 download_router = APIRouter()
 
-@download_router.get("/{datacatalog_name}/{file_owner}/{entity_id}", tags=["File Download"])
-async def fetch_data(
+@download_router.api_route("/{datacatalog_name}/{file_owner}/{entity_id}", methods=["GET", "HEAD"], tags=["File Download"])
+def fetch_data(
     datacatalog_name: str,
     file_owner: str,
     entity_id: str,
+    request: Request,
 ):
     """
-    Fetch a file from the data catalog.
+    Fetch a file from the data catalog. The entity of the file is checked in Orion, so the
+    handler runs in the threadpool rather than in the event loop.
+
+    The `Range` header selects one or several byte ranges of the file (`If-Range` makes them
+    conditional on the file being unchanged), so downloads can be resumed or split into parallel requests.
+    Files compressed at rest are sent compressed, with `Content-Encoding`, to the clients accepting
+    their encoding, and decompressed (without ranges) for any other client.
 
     Args:
         datacatalog_name (str): The name of the data catalog.
@@ -41,21 +55,83 @@ async def fetch_data(
         entity_id (str): The unique identifier for the entity.
 
     Returns:
-        FileResponse: The requested file if found.
+        RangeFileResponse: The requested file, or the requested ranges of it.
 
     Raises:
         HTTPException: 
             - 404 if the file is not found.
     """
     # Get the file path and filename using the service layer
-    file_path, filename = service_file.get_file_path(datacatalog_name, file_owner, entity_id)
-
-    # Debugging output
-    print(file_path)
+    try:
+        file_path, filename, codec = service_file.get_file_path(datacatalog_name, file_owner, entity_id)
+    except ODSException:
+        raise HTTPException(status_code=404, detail=config.F404_FILE_NOT_FOUND)
 
     # Check if file exists, if not, return 404 error
     if not file_path or not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail=config.F404_FILE_NOT_FOUND)
 
-    # Return the file as a response
-    return FileResponse(file_path, filename=filename)
+    if service_compression.is_compressed(codec):
+        headers = {"Vary": "Accept-Encoding"}
+        if service_compression.accepts(request.headers.get("accept-encoding"), codec):
+            # The stored bytes are sent as they are, the ranges apply to the encoded file
+            headers["Content-Encoding"] = codec
+            return RangeFileResponse(file_path, request.headers, filename=filename, headers=headers)
+        headers["Content-Disposition"] = content_disposition(filename)
+        return StreamingResponse(
+            service_compression.iter_decoded(file_path, codec),
+            media_type=guess_type(filename)[0] or "application/octet-stream",
+            headers=headers
+        )
+
+    # Let the reverse proxy send the file, it also serves the ranges
+    if config.DOWNLOAD_ACCEL_REDIRECT:
+        location = config.DOWNLOAD_ACCEL_REDIRECT.rstrip("/") + "/" + quote(os.path.relpath(file_path, config.FIWARE_FILE_PATH))
+        return Response(headers={
+            "X-Accel-Redirect": location,
+            "Content-Disposition": content_disposition(filename)
+        })
+
+    # Return the file, or the requested ranges, as a response
+    return RangeFileResponse(file_path, request.headers, filename=filename)
+
+
+@download_router.post("/{datacatalog_id}", tags=["File Download"])
+def fetch_archive(
+    datacatalog_id: str,
+    form_data: BulkDownloadRequest,
+):
+    """
+    Download the files of a FILE data catalog as a ZIP archive, generated while it is sent.
+
+    Args:
+        datacatalog_id (str): The ID of the data catalog.
+        form_data (BulkDownloadRequest): The entities to include (all of them if empty) and
+            whether the files are stored or deflated.
+
+    Returns:
+        StreamingResponse: The ZIP archive, with a `{owner}/{entity}/{filename}` entry per file.
+
+    Raises:
+        HTTPException:
+            - 400 if the data catalog is not found or is not a FILE catalog.
+            - 404 if no entity matches.
+    """
+    try:
+        datacatalog = service_datacatalog.get_catalog(datacatalog_id)
+        if datacatalog.type != TypeCatalog.FILE:
+            raise HTTPException(status_code=400, detail=config.F400_NOT_FILE_CATALOG.format(datacatalog_id))
+        # Retrieve the first page before answering, so a missing entity is still reported
+        pages = service_file.iter_files(datacatalog_id, form_data.entities)
+        first_page = next(pages, None)
+    except ODSException as ex:
+        raise HTTPException(status_code=400, detail=ex.args)
+    if not first_page:
+        raise HTTPException(status_code=404, detail=config.F404_FILE_NOT_FOUND)
+
+    filename = datacatalog_id.replace(":", "_") + ".zip"
+    return StreamingResponse(
+        service_archive.render_zip(itertools.chain([first_page], pages), form_data.compression),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
@@ -7,6 +7,7 @@ Each endpoint allows authenticated users to insert data into a specified data ca
 """
 
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, Form, Response
+from fastapi.responses import JSONResponse
 from typing import Annotated, List
 import codecs
 import json
@@ -17,16 +18,26 @@ import services.timeseries as service_timeseries
 import services.tabledata as service_tables
 import services.genericdata as service_genericdata
 import services.files as service_files
-from exceptions import ODSPermissionException, ODSException, DataCatalogUpdateError, DataCatalogNotFound
-from schemas import User, TimeSeriesRequest, GeneralEntityRequest
+import services.ingestion as service_ingestion
+import config
+import metrics
+from exceptions import ODSPermissionException, ODSException, DataCatalogUpdateError, DataCatalogNotFound, JobNotFound
+from schemas import User, TimeSeriesRequest, GeneralEntityRequest, IngestionJob, IngestionItemError
 
 # APIRouter object to define all routes for data insertion
 inserdata_router = APIRouter()
 
+
+def _accepted(job: IngestionJob) -> JSONResponse:
+    # 202 Accepted: the entities are queued and will be sent to Orion in the background
+    return JSONResponse(status_code=202, content=job.model_dump(mode="json"))
+
+
 @inserdata_router.post("/timeseries", summary="Upload time series data", tags=["Insert Data"])
 async def upload_timeseries_data(
     form_data: TimeSeriesRequest,
     current_user: Annotated[User, Depends(get_current_active_user)],
+    asynchronous: bool = False,
 ):
     """
     Upload time series data to the specified data catalog.
@@ -34,10 +45,26 @@ async def upload_timeseries_data(
     Args:
         form_data (TimeSeriesRequest): The time series data to be uploaded.
         current_user (User): The user making the upload request (injected by FastAPI dependency).
+        asynchronous (bool): Queue the values and return at once with an ingestion job (202).
 
     Returns:
-        dict: A JSON object indicating the number of successful and failed insertions.
+        dict: A JSON object indicating the number of successful and failed insertions,
+        or the ingestion job in asynchronous mode.
     """
+    if asynchronous:
+        try:
+            data_catalog = service_timeseries.validate_catalog(form_data.datacatalog_id, current_user.username)
+        except ODSException as ex:
+            raise HTTPException(status_code=400, detail=ex.args)
+        entities, errors = [], []
+        for index, data in enumerate(form_data.values):
+            try:
+                entities.append((index, service_timeseries.build_entity(data_catalog, data, current_user.username)))
+            except ODSException as ex:
+                errors.append(IngestionItemError(index=index, entity_id=data.id, detail=str(ex)))
+        metrics.count_ingested(data_catalog.type, "async", entities=len(entities))
+        return _accepted(service_ingestion.submit_job(form_data.datacatalog_id, current_user.username, entities, errors))
+
     inserted = 0
     error = 0
     for data in form_data.values:
@@ -53,6 +80,7 @@ async def upload_timeseries_data(
 async def upload_general_data(
     form_data: GeneralEntityRequest,
     current_user: Annotated[User, Depends(get_current_active_user)],
+    asynchronous: bool = False,
 ):
     """
     Upload general entity data to the specified data catalog.
@@ -60,14 +88,20 @@ async def upload_general_data(
     Args:
         form_data (GeneralEntityRequest): The general entity data to be uploaded.
         current_user (User): The user making the upload request (injected by FastAPI dependency).
+        asynchronous (bool): Queue the entity and return at once with an ingestion job (202).
 
     Returns:
-        dict: A JSON object indicating success or failure.
+        dict: A JSON object indicating success or failure, or the ingestion job in asynchronous mode.
 
     Raises:
         HTTPException: If there is an error during the data insertion, a 400 error is raised.
     """
     try:
+        if asynchronous:
+            data_catalog = service_genericdata.validate_catalog(form_data.datacatalog_id, current_user.username)
+            entity = service_genericdata.build_entity(data_catalog, form_data, current_user.username)
+            metrics.count_ingested(data_catalog.type, "async")
+            return _accepted(service_ingestion.submit_job(form_data.datacatalog_id, current_user.username, [(0, entity)], []))
         service_genericdata.insert_data(form_data, current_user.username)
     except ODSException as ex:
         raise HTTPException(status_code=400, detail=ex.args)
@@ -81,6 +115,7 @@ async def upload_table_data(
     entity: Annotated[str, Form()],
     tags: Annotated[List[str], Form()],
     current_user: Annotated[User, Depends(get_current_active_user)],
+    asynchronous: bool = False,
 ):
     """
     Upload table data from a CSV file to the specified data catalog.
@@ -90,15 +125,21 @@ async def upload_table_data(
         datacatalog (str): The ID of the data catalog to upload the data to.
         entity (str): The entity associated with the data.
         current_user (User): The user making the upload request (injected by FastAPI dependency).
+        asynchronous (bool): Queue the table and return at once with an ingestion job (202).
 
     Returns:
-        dict: A JSON object indicating success or failure.
+        dict: A JSON object indicating success or failure, or the ingestion job in asynchronous mode.
 
     Raises:
         HTTPException: If there is an error during the data insertion, a 400 error is raised.
     """
     try:
         csvReader = csv.DictReader(codecs.iterdecode(file.file, 'utf-8'))
+        if asynchronous:
+            data_catalog = service_tables.validate_catalog(datacatalog, current_user.username)
+            fiware_entity = service_tables.build_entity(csvReader, data_catalog, entity, current_user.username)
+            metrics.count_ingested(data_catalog.type, "async", rows=service_tables.count_rows(fiware_entity, data_catalog))
+            return _accepted(service_ingestion.submit_job(datacatalog, current_user.username, [(0, fiware_entity)], []))
         service_tables.insert_data(csvReader, datacatalog, entity, current_user.username)
     except ODSException as ex:
         raise HTTPException(status_code=400, detail=ex.args)
@@ -113,6 +154,7 @@ async def upload_file(
     metadata: Annotated[str, Form()],
     tags: Annotated[List[str], Form()],
     current_user: Annotated[User, Depends(get_current_active_user)],
+    asynchronous: bool = False,
 ):
     """
     Upload a file with associated metadata to the specified data catalog.
@@ -123,16 +165,51 @@ async def upload_file(
         entity (str): The entity associated with the file.
         metadata (str): Metadata in JSON format associated with the file.
         current_user (User): The user making the upload request (injected by FastAPI dependency).
+        asynchronous (bool): Store the file and queue its entity, returning at once with an ingestion job (202).
 
     Returns:
-        dict: A JSON object indicating success or failure.
+        dict: A JSON object indicating success or failure, or the ingestion job in asynchronous mode.
 
     Raises:
         HTTPException: If there is an error during the data insertion, a 400 error is raised.
     """
     try:
         metadata_json = json.loads(metadata)
+        if asynchronous:
+            data_catalog = service_files.validate_catalog(datacatalog, current_user.username)
+            fiware_entity = service_files.build_entity(file.file, file.filename, data_catalog, entity, metadata_json, current_user.username)
+            metrics.count_ingested(data_catalog.type, "async")
+            return _accepted(service_ingestion.submit_job(datacatalog, current_user.username, [(0, fiware_entity)], []))
         service_files.insert_data(file.file, file.filename, datacatalog, entity, metadata_json, current_user.username)
     except ODSException as ex:
         raise HTTPException(status_code=400, detail=ex.args)
     return {"success": True}
+
+
+@inserdata_router.get("/jobs/{job_id}", response_model=IngestionJob, summary="Get an ingestion job status", tags=["Insert Data"])
+async def get_ingestion_job(
+    job_id: str,
+    current_user: Annotated[User, Depends(get_current_active_user)],
+):
+    """
+    Retrieve the progress and the per-item errors of an asynchronous ingestion job.
+
+    Args:
+        job_id (str): The job ID returned by an asynchronous insert request.
+        current_user (User): The user requesting the job status (injected by FastAPI dependency).
+
+    Returns:
+        IngestionJob: The current status of the job.
+
+    Raises:
+        HTTPException:
+            - 403 if the job was submitted by another user.
+            - 404 if the job does not exist or has expired.
+    """
+    try:
+        job = service_ingestion.get_job(job_id)
+    except JobNotFound as ex:
+        raise HTTPException(status_code=404, detail=ex.args)
+    if job.owner != current_user.username:
+        raise HTTPException(status_code=403, detail=config.I403_JOB_OWNER_ERROR)
+    return job
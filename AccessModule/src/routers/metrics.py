@@ -0,0 +1,26 @@
+"""
+Metrics API Endpoint
+
+This module defines the FastAPI route exposing the Prometheus metrics of the AccessModule,
+aggregated across all the server processes.
+"""
+
+from fastapi import APIRouter, HTTPException, Response
+
+import config
+import metrics
+
+metrics_router = APIRouter()
+
+@metrics_router.get("", summary="Prometheus metrics", tags=["Metrics"], include_in_schema=False)
+async def get_metrics():
+    """
+    Render the Prometheus metrics in the text exposition format.
+
+    Raises:
+        HTTPException: 404 if `prometheus_client` is not installed.
+    """
+    if not metrics.is_available():
+        raise HTTPException(status_code=404, detail=config.M404_METRICS_NOT_AVAILABLE)
+    content, media_type = metrics.render()
+    return Response(content=content, media_type=media_type)
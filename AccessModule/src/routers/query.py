@@ -6,65 +6,167 @@ multiple types of catalogs (Generic, Table, File, and Time Series) and returns d
 based on the request.
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
 from typing import Annotated
+import itertools
+import json
 
-from utils import json_to_csv, table_to_csv
 from services.auth import get_current_active_user
-import services.timeseries as service_timeseries
 import services.datacatalog as service_datacatalog
-import services.genericdata as service_genericdata
+import services.export as service_export
+import services.cache as service_cache
+import services.federation as service_federation
+import services.snapshots as service_snapshots
+import services.conditional as service_conditional
+import utils
+import config
 from exceptions import ODSPermissionException, ODSException, DataCatalogUpdateError, DataCatalogNotFound
-from schemas import User, QueryRequest, TypeCatalog, OutputFormat, DataCatalogCreate
+from schemas import User, QueryRequest, MultiQueryRequest, TypeCatalog, OutputFormat, DataCatalogCreate
 
 # APIRouter object to define all routes for data querying
 query_router = APIRouter()
 
 @query_router.post("/", summary="Fetch data from catalog", tags=["Query Data"])
-async def fetch_data(
+def fetch_data(
     form_data: QueryRequest,
+    request: Request,
 ):
     """
-    Query data from the specified catalog based on the provided query request.
+    Query data from the specified catalog based on the provided query request. The handler waits
+    for Orion and QuantumLeap, so it runs in the threadpool rather than in the event loop.
 
     Args:
         form_data (QueryRequest): The form data containing catalog ID, entities, fields, and output format.
+        request (Request): The incoming request, to read its conditional headers (`If-None-Match`,
+            `If-Modified-Since`).
 
     Returns:
         dict or Response: 
-            - JSON object with queried data if requested in JSON format.
-            - CSV file if requested in CSV format.
+            - JSON object with queried data if requested in JSON format. In envelope mode,
+              an object with the catalog context and the entities in `data`. When paginated
+              with `limit`, an object with the entities in `data` and the `next_cursor`.
+            - CSV, NDJSON, Arrow IPC stream or Parquet file otherwise, streamed as the data is retrieved.
+              When paginated, the cursor of the next page is sent in the `X-Next-Cursor` header.
+            A cursor past the last page returns an empty page.
+        The encoded results are cached until the data of the catalog changes, and full exports
+        are served from a snapshot built in the background. A 304 response is returned if the
+        copy held by the client is still valid.
     
     Raises:
         HTTPException: 
             - 400 if the catalog is not found.
+            - 400 if the output format is not available.
+            - 400 if the cursor is not valid.
     """
-    data = {}
-
+    if not service_export.is_available(form_data.output):
+        raise HTTPException(status_code=400, detail=config.Q400_FORMAT_NOT_AVAILABLE.format(form_data.output.value))
+    # The validators are built before retrieving the data, so they never describe newer data than the response
+    etag, last_modified = service_conditional.get_query_validators(form_data.catalog_id, service_cache.get_cache_key(form_data))
+    validators = service_conditional.get_headers(etag, last_modified)
     try:
-        # Get the catalog based on the provided catalog ID
+        # The catalog must exist before the preconditions are evaluated, a deleted catalog is not unchanged
         datacatalog: DataCatalogCreate = service_datacatalog.get_catalog(form_data.catalog_id)
-        if not datacatalog:
-            raise HTTPException(status_code=404, detail="Data catalog not found")
-        # Handle data fetching based on the type of catalog
-        if datacatalog.type in [TypeCatalog.GENERIC, TypeCatalog.TABLE, TypeCatalog.FILE]:
-            data = service_genericdata.get_data(form_data, datacatalog)
-        elif datacatalog.type == TypeCatalog.TIMESERIES:
-            data = service_timeseries.get_data(form_data)
+    except ODSException as ex:
+        raise HTTPException(status_code=400, detail=ex.args)
+    if service_conditional.is_not_modified(etag, last_modified, request.headers.get("if-none-match"), request.headers.get("if-modified-since")):
+        return Response(status_code=304, headers=validators)
+    # Full exports are served from their snapshot while the catalog does not change
+    if service_snapshots.is_full_export(form_data):
+        snapshot = service_snapshots.get_snapshot(form_data)
+        if snapshot:
+            path, media_type, filename = snapshot
+            return FileResponse(path, media_type=media_type, filename=filename, headers=validators)
+    # The change counter is read before retrieving the data, so a change made meanwhile discards the results
+    cache_key, version, cached = service_cache.get(form_data)
+    if cached:
+        return Response(content=cached.body, media_type=cached.media_type, headers={**cached.headers, **validators})
+    try:
+        # Retrieve the first page before answering, so a failing or empty query is still reported
+        pages = service_export.iter_pages(form_data, datacatalog)
+        first_page = next(pages, None)
+        next_cursor = service_export.get_next_cursor(form_data, datacatalog)
     except DataCatalogNotFound as ex:
         # Raise HTTP 400 error if the catalog is not found
         raise HTTPException(status_code=400, detail=ex.args)
     except ODSException as ex:
         raise HTTPException(status_code=400, detail=ex.args)
 
-    # Handle the output format, converting data to CSV if requested
-    if data and form_data.output == OutputFormat.CSV:
-        if datacatalog.type in [TypeCatalog.GENERIC, TypeCatalog.FILE]:
-            content = json_to_csv(data)
-        elif datacatalog.type in [TypeCatalog.TABLE, TypeCatalog.TIMESERIES]:
-            content = table_to_csv(data)
-        return Response(content, media_type="text/csv", headers={"Content-Disposition": "attachment; filename=data.csv"})
-    if not data:
-        raise HTTPException(status_code=400, detail="Query data does not match any available data")
-    # Return the data in JSON format by default
-    return data
+    if not first_page and not form_data.cursor:
+        raise HTTPException(status_code=400, detail=config.Q400_NO_DATA)
+    # A cursor past the last page (the entities were deleted meanwhile) returns an empty page
+    pages = itertools.chain([first_page or []], pages)
+
+    # Return the data in JSON format if requested
+    if form_data.output == OutputFormat.JSON:
+        data = [entity for page in pages for entity in page]
+        envelope = service_export.get_envelope(form_data, datacatalog)
+        if form_data.limit:
+            content = {**(envelope or {}), "data": data, "next_cursor": next_cursor}
+        else:
+            content = {**envelope, "data": data} if envelope else data
+        body = json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str).encode()
+        service_cache.put(cache_key, form_data.catalog_id, version, body, "application/json")
+        return Response(content=body, media_type="application/json", headers=validators)
+    # Any other format is streamed as the data is retrieved
+    content, media_type, filename = service_export.render(pages, form_data, datacatalog)
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+    if next_cursor:
+        headers[config.NEXT_CURSOR_HEADER] = next_cursor
+    return StreamingResponse(
+        service_cache.tee(content, cache_key, form_data.catalog_id, version, media_type, headers),
+        media_type=media_type,
+        headers={**headers, **validators}
+    )
+
+
+@query_router.post("/multi", summary="Fetch data from several catalogs", tags=["Query Data"])
+def fetch_multi_data(
+    form_data: MultiQueryRequest,
+):
+    """
+    Query data from several catalogs at once. The catalogs are queried concurrently and their
+    entities are merged as they are retrieved, each one tagged with its `data_catalog`. The
+    handler waits for the catalogs, so it runs in the threadpool rather than in the event loop.
+
+    Args:
+        form_data (MultiQueryRequest): The query of each catalog, and the output format.
+
+    Returns:
+        dict or Response:
+            - JSON object with the merged entities in `data` and the failed catalogs in `errors`.
+            - NDJSON stream otherwise, a failed catalog is reported as a line with its `error`.
+
+    Raises:
+        HTTPException:
+            - 400 if the output format is not JSON or NDJSON.
+            - 400 if there are too many catalogs, or any of them is not found.
+    """
+    if form_data.output not in [OutputFormat.JSON, OutputFormat.NDJSON]:
+        raise HTTPException(status_code=400, detail=config.Q400_MULTI_FORMAT_NOT_AVAILABLE.format(form_data.output.value))
+    if len(form_data.catalogs) > config.MULTI_QUERY_MAX_CATALOGS:
+        raise HTTPException(status_code=400, detail=config.Q400_TOO_MANY_CATALOGS.format(config.MULTI_QUERY_MAX_CATALOGS))
+    queries = form_data.get_queries()
+    try:
+        datacatalogs = service_federation.get_catalogs(queries)
+    except ODSException as ex:
+        raise HTTPException(status_code=400, detail=ex.args)
+
+    pages = service_federation.iter_pages(queries, datacatalogs)
+    if form_data.output == OutputFormat.JSON:
+        data, errors = [], []
+        for catalog_id, page in pages:
+            if isinstance(page, Exception):
+                errors.append(service_federation.get_error(catalog_id, page))
+            else:
+                data.extend(page)
+        return {"data": data, "errors": errors}
+
+    return StreamingResponse(
+        utils.iter_ndjson(
+            [service_federation.get_error(catalog_id, page)] if isinstance(page, Exception) else page
+            for catalog_id, page in pages
+        ),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=data.ndjson"}
+    )
@@ -2,16 +2,23 @@
 Subscription API Endpoints
 
 This module defines the FastAPI routes for managing subscriptions in the system. It includes
-an endpoint for creating a new subscription, ensuring that the user is authenticated before performing the operation.
+an endpoint for creating a new subscription, ensuring that the user is authenticated before performing the operation,
+and the live streams (Server-Sent Events and WebSocket) of the changes of a catalog.
 """
 
-from fastapi import APIRouter, Depends, HTTPException
-from typing import Annotated, Union
+from fastapi import APIRouter, Depends, HTTPException, Body, Header, Query, Request, WebSocket, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import Annotated, List, Optional, Union
 from sqlalchemy.orm import Session
+import asyncio
+import json
 
 import config
-from services.auth import get_current_active_user
+from services.auth import get_current_active_user, get_stream_user
+import services.events as service_events
 import services.subscription as service_subscription
+import services.notifications as service_notifications
 from exceptions import ODSPermissionException, ODSException, DataCatalogUpdateError, DataCatalogNotFound
 from schemas import User, Subscription, DataCatalogSubscription, EntitySubscription
 
@@ -19,7 +26,7 @@ from schemas import User, Subscription, DataCatalogSubscription, EntitySubscript
 subscription_router = APIRouter()
 
 @subscription_router.post("/", summary="Create a new subscription", tags=["Subscription"])
-async def create_subscription(
+def create_subscription(
     subscription: Union[EntitySubscription, DataCatalogSubscription],
     current_user: Annotated[User, Depends(get_current_active_user)],
 ):
@@ -34,17 +41,142 @@ async def create_subscription(
         dict: A dictionary representing the newly created subscription.
 
     Raises:
-        HTTPException: If there is an ODS-related exception, an appropriate HTTP error is raised.
+        HTTPException:
+            - 403 if the catalog is private and owned by another user.
+            - 400 if there is any other ODS-related exception.
     """
-    # try:
+    try:
         # Call the service layer to create the subscription
-    if isinstance(subscription, EntitySubscription):
-        subscription = service_subscription.create_entity_subscription(subscription, current_user.username)
-    elif isinstance(subscription, DataCatalogSubscription):
-        subscription = service_subscription.create_datacatalog_subscription(subscription, current_user.username)
-    
-    return subscription
-    # except ODSException as ex:
-    #     print(ex)
-    #     # Raise an HTTP error if there is an exception in the subscription creation process
-    #     raise HTTPException(status_code=400, detail=ex.args)
+        if isinstance(subscription, EntitySubscription):
+            subscription = service_subscription.create_entity_subscription(subscription, current_user.username)
+        elif isinstance(subscription, DataCatalogSubscription):
+            subscription = service_subscription.create_datacatalog_subscription(subscription, current_user.username)
+
+        return subscription
+    except ODSPermissionException as ex:
+        raise HTTPException(status_code=403, detail=ex.args)
+    except ODSException as ex:
+        # Raise an HTTP error if there is an exception in the subscription creation process
+        raise HTTPException(status_code=400, detail=ex.args)
+
+
+@subscription_router.post("/notify", summary="Receive catalog change notifications", tags=["Subscription"], include_in_schema=False)
+def notify_changes(
+    notification: Annotated[dict, Body()],
+    x_ods_notify_token: Annotated[Optional[str], Header()] = None,
+):
+    """
+    Receive the notifications of the internal subscriptions created for each catalog, so the
+    cached query results of the changed catalogs are invalidated and the notification is
+    fanned out to the subscribers of the catalogs.
+
+    Args:
+        notification (dict): The NGSI-LD notification sent by Orion.
+        x_ods_notify_token (Optional[str]): The shared secret of the internal subscriptions.
+
+    Returns:
+        dict: The IDs of the changed catalogs and the number of subscribers notified.
+
+    Raises:
+        HTTPException:
+            - 403 if the notification does not carry the shared secret.
+            - 400 if a notified entity does not belong to a known catalog.
+    """
+    if not service_subscription.check_notify_token(x_ods_notify_token):
+        raise HTTPException(status_code=403, detail=config.S403_INVALID_NOTIFY_TOKEN)
+    try:
+        service_subscription.validate_notification(notification)
+    except ODSException as ex:
+        raise HTTPException(status_code=400, detail=ex.args)
+    # Only authenticated notifications reach the caches, the event logs and the subscribers
+    changed = service_subscription.process_change_notification(notification)
+    service_events.publish(notification)
+    return {"changed": changed, "subscribers": service_notifications.dispatch(notification)}
+
+
+@subscription_router.get("/stream/{catalog_id}", summary="Stream the changes of a catalog", tags=["Subscription"])
+async def stream_changes(
+    catalog_id: str,
+    request: Request,
+    current_user: Annotated[User, Depends(get_stream_user)],
+    entities: Annotated[Optional[List[str]], Query()] = None,
+    attrs: Annotated[Optional[List[str]], Query()] = None,
+):
+    """
+    Stream the changes of a catalog as Server-Sent Events, as Orion notifies them.
+
+    Args:
+        catalog_id (str): The ID of the data catalog.
+        request (Request): The incoming request, to resume the stream after its `Last-Event-ID`.
+        current_user (User): The user opening the stream, authenticated with the Authorization
+            header or the `token` query parameter.
+        entities (Optional[List[str]]): Names or Regex patterns of the streamed entities, all of them if empty.
+        attrs (Optional[List[str]]): Attributes streamed for each entity, all of them if empty.
+
+    Returns:
+        StreamingResponse: A `change` event with the changed entities for each notification,
+        and a comment every `EVENTS_HEARTBEAT` seconds without changes.
+
+    Raises:
+        HTTPException:
+            - 403 if the catalog is private and owned by another user.
+            - 400 if the catalog is not found.
+    """
+    try:
+        # Blocking requests to Orion, kept out of the event loop
+        await run_in_threadpool(service_events.open_stream, catalog_id, current_user.username)
+    except ODSPermissionException as ex:
+        raise HTTPException(status_code=403, detail=ex.args)
+    except ODSException as ex:
+        raise HTTPException(status_code=400, detail=ex.args)
+
+    async def content():
+        async for event in service_events.follow(catalog_id, entities, attrs, request.headers.get("last-event-id")):
+            if event is None:
+                yield ": heartbeat\n\n"
+                continue
+            event_id, data = event
+            yield f"id: {event_id}\nevent: change\ndata: {json.dumps(data, default=str)}\n\n"
+
+    # Proxies must not buffer the events
+    return StreamingResponse(content(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@subscription_router.websocket("/ws/{catalog_id}")
+async def websocket_changes(
+    websocket: WebSocket,
+    catalog_id: str,
+    token: Optional[str] = None,
+    last_event_id: Optional[str] = None,
+    entities: Annotated[Optional[List[str]], Query()] = None,
+    attrs: Annotated[Optional[List[str]], Query()] = None,
+):
+    """
+    Stream the changes of a catalog through a WebSocket, as Orion notifies them. Each message
+    is a JSON object with the `id` of the event and the changed entities in `data`, and the
+    stream is resumed after an event with its `last_event_id`.
+    """
+    try:
+        current_user = await get_stream_user(websocket, token)
+        await run_in_threadpool(service_events.open_stream, catalog_id, current_user.username)
+    except (HTTPException, ODSException):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+
+    async def send_events():
+        async for event in service_events.follow(catalog_id, entities, attrs, last_event_id):
+            if event:
+                event_id, data = event
+                await websocket.send_text(json.dumps({"id": event_id, **data}, default=str))
+
+    async def wait_disconnect():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    # The stream ends when the client disconnects, even if no event is sent meanwhile
+    tasks = [asyncio.ensure_future(send_events()), asyncio.ensure_future(wait_disconnect())]
+    await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    for task in tasks:
+        task.cancel()
@@ -3,4 +3,5 @@ from schemas.datacatalog import *
 from schemas.entities import *
 from schemas.enums import *
 from schemas.fiware import *
+from schemas.ingestion import *
 from schemas.subscription import *
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, ConfigDict
-from typing import Optional, List
-from schemas.enums import OutputFormat
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
+from typing import Optional, List, Union
+from schemas.enums import OutputFormat, AggregationMethod, AggregationPeriod, PredicateOperator, FillPolicy, ZipCompression
 
 class GeneralEntityRequest(BaseModel):
     datacatalog_id: str
@@ -21,13 +21,91 @@ class TimeSeriesRequest(BaseModel):
     values: List[TimeSeriesEntry]
 
 class TimeFilter(BaseModel):
-    start_date: int
-    end_date: str
+    start_date: Optional[int] = None
+    end_date: Optional[int] = None
+    last_n: Optional[int] = None
+    aggr_method: Optional[AggregationMethod] = None
+    aggr_period: Optional[AggregationPeriod] = None
+
+    @field_validator("start_date", "end_date")
+    @classmethod
+    def check_bound(cls, value: Optional[int]) -> Optional[int]:
+        # 0 (the default of the API documentation) leaves the bound open
+        return value or None
+
+    @model_validator(mode="after")
+    def check_aggregation(self) -> "TimeFilter":
+        if self.aggr_period and not self.aggr_method:
+            raise ValueError("aggr_period requires aggr_method")
+        return self
+
+class Resample(BaseModel):
+    step: int = Field(gt=0)
+    fill: FillPolicy = FillPolicy.NONE
+
+class RowPredicate(BaseModel):
+    column: str
+    op: PredicateOperator
+    value: Union[int, float, str, List[Union[int, float, str]]]
+
+class RowFilter(BaseModel):
+    offset: int = Field(default=0, ge=0)
+    limit: Optional[int] = Field(default=None, ge=0)
+    predicates: List[RowPredicate] = []
+
+class NearFilter(BaseModel):
+    point: List[float] = Field(min_length=2, max_length=2)
+    max_distance: float = Field(gt=0)
+
+class GeoFilter(BaseModel):
+    attribute: Optional[str] = None
+    bbox: Optional[List[float]] = Field(default=None, min_length=4, max_length=4)
+    near: Optional[NearFilter] = None
+
+    @model_validator(mode="after")
+    def check_shape(self) -> "GeoFilter":
+        if (self.bbox is None) == (self.near is None):
+            raise ValueError("Specify either bbox or near")
+        return self
 
 class QueryRequest(BaseModel):
     catalog_id: str
     entities: List[str]
     fields: List[str]
     time_filter: Optional[TimeFilter] = None
+    resample: Optional[Resample] = None
+    row_filter: Optional[RowFilter] = None
+    geo_filter: Optional[GeoFilter] = None
+    limit: Optional[int] = Field(default=None, ge=1)
+    cursor: Optional[str] = None
     include_context: bool = True
+    envelope: bool = False
     output: OutputFormat = OutputFormat.CSV
+
+    def context_per_entity(self) -> bool:
+        # In envelope mode the catalog context is sent once, in the header of the response
+        return self.include_context and not self.envelope
+
+class CatalogQuery(BaseModel):
+    catalog_id: str
+    entities: List[str] = []
+    fields: List[str] = []
+    time_filter: Optional[TimeFilter] = None
+    resample: Optional[Resample] = None
+    row_filter: Optional[RowFilter] = None
+    geo_filter: Optional[GeoFilter] = None
+
+class MultiQueryRequest(BaseModel):
+    catalogs: List[CatalogQuery] = Field(min_length=1)
+    include_context: bool = True
+    output: OutputFormat = OutputFormat.NDJSON
+
+    def get_queries(self) -> List[QueryRequest]:
+        return [
+            QueryRequest(**catalog.model_dump(), include_context=self.include_context, output=self.output)
+            for catalog in self.catalogs
+        ]
+
+class BulkDownloadRequest(BaseModel):
+    entities: List[str] = []
+    compression: ZipCompression = ZipCompression.STORED
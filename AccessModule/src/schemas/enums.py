@@ -4,6 +4,9 @@ from enum import Enum
 class OutputFormat(str, Enum):
     CSV = "CSV"
     JSON = "JSON"
+    ARROW = "ARROW"
+    PARQUET = "PARQUET"
+    NDJSON = "NDJSON"
 
 
 class TypeCatalog(str, Enum):
@@ -21,3 +24,47 @@ class TypeAttribute(str, Enum):
     COORDINATE = "COORDINATE"
     TIMESTAMP = "TIMESTAMP"
     OBJECT = "OBJECT"
+
+
+class JobStatus(str, Enum):
+    QUEUED = "QUEUED"
+    PROCESSING = "PROCESSING"
+    COMPLETED = "COMPLETED"
+    # Completed, but some of the entities were rejected (see the job errors)
+    PARTIAL = "PARTIAL"
+    FAILED = "FAILED"
+
+
+class AggregationMethod(str, Enum):
+    COUNT = "count"
+    SUM = "sum"
+    AVG = "avg"
+    MIN = "min"
+    MAX = "max"
+
+
+class AggregationPeriod(str, Enum):
+    YEAR = "year"
+    MONTH = "month"
+    DAY = "day"
+    HOUR = "hour"
+    MINUTE = "minute"
+    SECOND = "second"
+
+
+class PredicateOperator(str, Enum):
+    EQ = "="
+    LT = "<"
+    GT = ">"
+    IN = "in"
+
+
+class FillPolicy(str, Enum):
+    NONE = "none"
+    FFILL = "ffill"
+    LINEAR = "linear"
+
+
+class ZipCompression(str, Enum):
+    STORED = "stored"
+    DEFLATED = "deflated"
@@ -5,7 +5,12 @@ import utils
 import config
 
 from schemas.datacatalog import DataCatalogCreate
-from schemas.enums import TypeCatalog
+from schemas.enums import TypeCatalog, TypeAttribute
+
+def get_property_type(attribute_type: TypeAttribute) -> str:
+    # Coordinates are stored as GeoProperties, so Orion can filter them with geo-queries
+    return "GeoProperty" if attribute_type == TypeAttribute.COORDINATE else "Property"
+
 
 class FiwareProperty(BaseModel):
     property_key: str
@@ -19,6 +24,8 @@ class FiwareProperty(BaseModel):
                 fiware_dict = utils.get_property(self.property_value)
             elif self.property_type == "Relationship":
                 fiware_dict = utils.get_relationship(self.property_value)
+            elif self.property_type == "GeoProperty":
+                fiware_dict = utils.get_geoproperty(self.property_value)
             else:
                 fiware_dict = utils.get_property(self.property_value)
 
@@ -61,6 +68,10 @@ class OrionSubscription(BaseModel):
 
 class OrionSubscriptionCreate(OrionSubscription):
     id: str
+    # Headers Orion sends with each notification
+    receiver_info: Optional[Dict[str, str]] = None
+    # NGSI-LD query the notified entities must match
+    query: Optional[str] = None
 
     def subscription_to_fiware(self) -> dict:
         fiware_obj = {}
@@ -68,8 +79,15 @@ class OrionSubscriptionCreate(OrionSubscription):
         fiware_obj["id"] = self.id
         fiware_obj["type"] = "Subscription"
         fiware_obj["entities"] = [ {"type": type_id} for type_id in self.entities_type]
-        fiware_obj["watchedAttributes"] = self.watched_attribute
+        if self.watched_attribute:
+            fiware_obj["watchedAttributes"] = self.watched_attribute
+        if self.query:
+            fiware_obj["q"] = self.query
         fiware_obj["notification"] = {"endpoint": {"uri": self.subscription_endpoint, "accept": "application/ld+json"}}
+        if self.receiver_info:
+            fiware_obj["notification"]["endpoint"]["receiverInfo"] = [
+                {"key": key, "value": value} for key, value in self.receiver_info.items()
+            ]
         return fiware_obj
     
 
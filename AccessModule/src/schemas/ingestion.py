@@ -0,0 +1,22 @@
+from pydantic import BaseModel
+from typing import Optional, List
+from datetime import datetime
+from schemas.enums import JobStatus
+
+class IngestionItemError(BaseModel):
+    index: int
+    entity_id: Optional[str] = None
+    detail: str
+
+
+class IngestionJob(BaseModel):
+    id: str
+    datacatalog_id: str
+    owner: str
+    status: JobStatus = JobStatus.QUEUED
+    total: int
+    processed: int = 0
+    success: int = 0
+    errors: List[IngestionItemError] = []
+    created_at: datetime
+    updated_at: datetime
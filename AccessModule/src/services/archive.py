@@ -0,0 +1,74 @@
+"""
+archive.py
+
+This module streams the files of a FILE data catalog as a ZIP archive. The archive is generated
+on the fly while it is sent: each file is read from disk in chunks and its compressed bytes are
+streamed as soon as they are written, so no temporary archive is stored and the memory used does
+not depend on the size of the files.
+
+Each file is stored in the archive as `{owner}/{entity}/{filename}`.
+"""
+
+import os
+import zipfile
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+import config
+import utils
+import services.compression as service_compression
+from schemas import ZipCompression
+
+_COMPRESSION = {
+    ZipCompression.STORED: zipfile.ZIP_STORED,
+    ZipCompression.DEFLATED: zipfile.ZIP_DEFLATED,
+}
+
+
+def _get_zipinfo(arcname: str, stat_result: os.stat_result, compression: ZipCompression, codec: Optional[str]) -> zipfile.ZipInfo:
+    # ZIP dates can't be older than 1980
+    modified = max(datetime.fromtimestamp(stat_result.st_mtime), datetime(1980, 1, 1))
+    zinfo = zipfile.ZipInfo(arcname, date_time=modified.timetuple()[:6])
+    zinfo.compress_type = _COMPRESSION[compression]
+    zinfo.external_attr = 0o644 << 16
+    # The size decides whether the entry needs ZIP64 extensions, it is unknown for compressed files
+    if not service_compression.is_compressed(codec):
+        zinfo.file_size = stat_result.st_size
+    return zinfo
+
+
+def render_zip(pages: Iterator[List[Tuple[str, str, str, Optional[str]]]], compression: ZipCompression) -> Iterator[bytes]:
+    """
+    Render the files of a catalog as a ZIP archive.
+
+    Args:
+        pages (Iterator[List[Tuple[str, str, str, Optional[str]]]]): The path, `owner/entity` name,
+            filename and storage codec of each file.
+        compression (ZipCompression): Whether the files are stored as they are or deflated.
+
+    Yields:
+        bytes: The chunks of the archive.
+    """
+    sink = utils.ChunkSink()
+    with zipfile.ZipFile(sink, "w", allowZip64=True) as archive:
+        for page in pages:
+            for file_path, name, filename, codec in page:
+                try:
+                    # Files compressed at rest are decompressed, the archive has the original files
+                    stat_result = os.stat(file_path)
+                    file = service_compression.open_decoded(file_path, codec)
+                except OSError:
+                    # Entities whose file is missing are left out of the archive
+                    print(f"File not found: {file_path}")
+                    continue
+                with file:
+                    zinfo = _get_zipinfo(f"{name}/{os.path.basename(filename)}", stat_result, compression, codec)
+                    with archive.open(zinfo, "w", force_zip64=service_compression.is_compressed(codec)) as entry:
+                        while True:
+                            chunk = file.read(config.DOWNLOAD_CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            entry.write(chunk)
+                            yield sink.take()
+                yield sink.take()
+    yield sink.take()
@@ -10,12 +10,15 @@ Dependencies:
 """
 
 from fastapi import Depends, HTTPException, status
+from fastapi.requests import HTTPConnection
 from fastapi.security import OAuth2PasswordBearer
 
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from typing import Optional, Annotated
 from passlib.context import CryptContext
+import config
+import metrics
 import utils
 from schemas import TokenData, User, UserRequest, UserDB
 import repository.fiware  as fiware_repository
@@ -44,7 +47,8 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     if not plain_password or not hashed_password:
         raise ValueError("Both password and hashed_password must be provided.")
-    return pwd_context.verify(plain_password, hashed_password)
+    with metrics.timed("password_verify"):
+        return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """
@@ -58,7 +62,8 @@ def get_password_hash(password: str) -> str:
     """
     if not password:
         raise ValueError("Password must not be empty.")
-    return pwd_context.hash(password)
+    with metrics.timed("password_hash"):
+        return pwd_context.hash(password)
 
 def update_password(username: str, new_password:str):
     user_in_db = get_user(username)
@@ -138,6 +143,19 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
 
 
 
+def get_token_username(token: str) -> Optional[str]:
+    """
+    Reads the username of a JWT token, without retrieving the user.
+
+    Returns:
+        Optional[str]: The username, or None if the token is invalid or expired.
+    """
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except JWTError:
+        return None
+
+
 async def get_current_user(
     token: Annotated[str, Depends(oauth2_scheme)]
 ) -> UserDB:
@@ -175,6 +193,33 @@ async def get_current_user(
     return user
 
 
+async def get_stream_user(connection: HTTPConnection, token: Optional[str] = None) -> UserDB:
+    """
+    Retrieves the user of a live stream. Browsers can't set the Authorization header of an
+    EventSource or a WebSocket, so the token can also be passed in the `token` query parameter.
+
+    Args:
+        connection (HTTPConnection): The HTTP request or WebSocket of the stream.
+        token (Optional[str]): The JWT token passed in the query parameters.
+
+    Returns:
+        UserDB: The user object associated with the token.
+
+    Raises:
+        HTTPException: If there is no token, it is invalid or the user cannot be found.
+    """
+    scheme, _, credentials = connection.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and credentials:
+        token = credentials
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await get_current_user(token)
+
+
 def get_user(username: str) -> Optional[UserDB]:
     """
     Retrieves a user from the database by username.
@@ -205,3 +250,17 @@ async def get_current_active_user(
         User: The current active user object.
     """
     return current_user
+
+
+async def get_current_admin_user(
+    current_user: Annotated[User, Depends(get_current_active_user)]
+) -> User:
+    """
+    Retrieves the current user, only if it is an admin user (`ODS_ADMIN_USERS`).
+
+    Raises:
+        HTTPException: 403 if the user is not an admin user.
+    """
+    if current_user.username not in config.ADMIN_USERS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=config.A403_NOT_ADMIN)
+    return current_user
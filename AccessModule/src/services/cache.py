@@ -0,0 +1,132 @@
+"""
+cache.py
+
+This module provides an in-memory cache of encoded query results. Entries are keyed on the
+normalized query request and evicted in LRU order when the cache exceeds its size in bytes.
+
+Each entry stores the change counter of its catalog when the results were retrieved. A lookup
+compares it with the current counter, so an insert handled by any server process, or a change
+notification from Orion, invalidates the cached results of the catalog.
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional, Tuple
+
+from pydantic import BaseModel
+
+import config
+import metrics
+import services.changes as service_changes
+from schemas import QueryRequest
+
+
+class CachedResult(BaseModel):
+    catalog_id: str
+    version: int
+    body: bytes
+    media_type: str
+    headers: Dict[str, str] = {}
+
+
+class QueryCache:
+    """Size bounded LRU cache of encoded query results."""
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: "OrderedDict[str, CachedResult]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._size -= len(entry.body)
+
+    def get(self, key: str, version: int) -> Optional[CachedResult]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.version != version:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, entry: CachedResult):
+        if len(entry.body) > self.max_entry_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._size += len(entry.body)
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, catalog_id: str):
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry.catalog_id == catalog_id]:
+                self._remove(key)
+
+
+query_cache = QueryCache(config.QUERY_CACHE_MAX_BYTES, config.QUERY_CACHE_MAX_ENTRY_BYTES)
+service_changes.add_listener(query_cache.invalidate)
+
+
+def get_cache_key(query: QueryRequest) -> str:
+    """
+    Normalize a query request, so equivalent requests share the same cache entry.
+    The order of the requested entities and fields does not change the results.
+    """
+    request = query.model_dump(mode="json")
+    request["entities"] = sorted(set(request["entities"]))
+    request["fields"] = sorted(set(request["fields"]))
+    return json.dumps(request, sort_keys=True)
+
+
+def get(query: QueryRequest) -> Tuple[str, int, Optional[CachedResult]]:
+    """
+    Look up the results of a query.
+
+    Returns:
+        Tuple[str, int, Optional[CachedResult]]: The cache key, the current change counter of
+        the catalog and the cached results, if they are still valid.
+    """
+    key = get_cache_key(query)
+    version, _ = service_changes.get_version(query.catalog_id)
+    cached = query_cache.get(key, version)
+    metrics.count_lookup("query", cached is not None)
+    return key, version, cached
+
+
+def put(key: str, catalog_id: str, version: int, body: bytes, media_type: str, headers: Dict[str, str] = {}):
+    query_cache.put(key, CachedResult(
+        catalog_id=catalog_id,
+        version=version,
+        body=body,
+        media_type=media_type,
+        headers=headers
+    ))
+
+
+def tee(content: Iterator, key: str, catalog_id: str, version: int, media_type: str, headers: Dict[str, str] = {}) -> Iterator[bytes]:
+    """
+    Stream the chunks of a response while keeping a copy of them. The copy is stored in the
+    cache once the response is complete, unless it grows larger than the entry size limit.
+    """
+    chunks = []
+    size = 0
+    for chunk in content:
+        data = chunk.encode() if isinstance(chunk, str) else chunk
+        if chunks is not None:
+            size += len(data)
+            if size <= query_cache.max_entry_bytes:
+                chunks.append(data)
+            else:
+                chunks = None
+        yield data
+    if chunks is not None:
+        put(key, catalog_id, version, b"".join(chunks), media_type, headers)
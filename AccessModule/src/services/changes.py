@@ -0,0 +1,119 @@
+"""
+changes.py
+
+This module keeps a change counter for each data catalog. The counter is increased every time
+the data or the definition of a catalog is modified, either through the AccessModule or when
+Orion notifies a change. It is stored in the local data directory, so all the server processes
+share it, and it is used to detect stale cached results.
+
+Changes made directly in Orion are only noticed if Orion notifies them, so a counter expires
+`CHANGES_MAX_AGE` seconds after the last change: reading an expired counter increases it, and
+the results cached meanwhile are retrieved again. Only the counters of existing catalogs are
+kept (see `track`), so looking up any other ID does not create one.
+"""
+
+import fcntl
+import os
+import time
+from typing import Callable, List, Optional, Tuple
+from urllib.parse import quote
+
+import config
+
+# Counter of the changes in the list of catalogs (a catalog ID always includes its owner)
+CATALOG_LIST = config.CATALOG_ENTITY
+
+# Functions called, in the current process, after a catalog changes
+_listeners: List[Callable[[str], None]] = []
+_epoch: Optional[float] = None
+
+
+def _version_path(catalog_id: str) -> str:
+    return os.path.join(config.CHANGES_PATH, quote(catalog_id, safe=""))
+
+
+def add_listener(listener: Callable[[str], None]):
+    _listeners.append(listener)
+
+
+def mark_changed(catalog_id: str) -> int:
+    """
+    Increase the change counter of a catalog.
+
+    Args:
+        catalog_id (str): The ID of the changed catalog.
+
+    Returns:
+        int: The new value of the counter.
+    """
+    os.makedirs(config.CHANGES_PATH, exist_ok=True)
+    with open(_version_path(catalog_id), "a+") as version_file:
+        fcntl.flock(version_file, fcntl.LOCK_EX)
+        version_file.seek(0)
+        content = version_file.read().strip()
+        version = (int(content) if content.isdigit() else 0) + 1
+        version_file.seek(0)
+        version_file.truncate()
+        version_file.write(str(version))
+        version_file.flush()
+    for listener in _listeners:
+        listener(catalog_id)
+    return version
+
+
+def track(catalog_id: str):
+    """Start the change counter of an existing catalog, so it expires even if it never changes."""
+    path = _version_path(catalog_id)
+    if os.path.exists(path):
+        return
+    os.makedirs(config.CHANGES_PATH, exist_ok=True)
+    try:
+        with open(path, "x") as version_file:
+            version_file.write("0")
+    except FileExistsError:
+        pass
+
+
+def get_version(catalog_id: str) -> Tuple[int, float]:
+    """
+    Retrieve the change counter of a catalog. An expired counter is increased first.
+
+    Args:
+        catalog_id (str): The ID of the catalog.
+
+    Returns:
+        Tuple[int, float]: The counter and the time of the last change (0 if it never changed).
+    """
+    version, changed_at = _read_version(catalog_id)
+    if changed_at and time.time() - changed_at > config.CHANGES_MAX_AGE:
+        # The catalog may have changed without being notified
+        mark_changed(catalog_id)
+        version, changed_at = _read_version(catalog_id)
+    return version, changed_at
+
+
+def _read_version(catalog_id: str) -> Tuple[int, float]:
+    try:
+        with open(_version_path(catalog_id)) as version_file:
+            fcntl.flock(version_file, fcntl.LOCK_SH)
+            content = version_file.read().strip()
+            return (int(content) if content.isdigit() else 0), os.fstat(version_file.fileno()).st_mtime
+    except FileNotFoundError:
+        return 0, 0.0
+
+
+def get_epoch() -> float:
+    """
+    Time since the change counters are kept. Catalogs without changes since then have a
+    counter of 0, and their last change is assumed to be the epoch.
+    """
+    global _epoch
+    if _epoch is None:
+        os.makedirs(config.CHANGES_PATH, exist_ok=True)
+        path = os.path.join(config.CHANGES_PATH, ".epoch")
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            pass
+        _epoch = os.stat(path).st_mtime
+    return _epoch
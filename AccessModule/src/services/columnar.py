@@ -0,0 +1,225 @@
+"""
+columnar.py
+
+This module renders query results in the Arrow IPC stream and Parquet formats. The columns are
+typed from the `entities_context` of the data catalog, so numeric values are not stringified
+and clients can load the results without parsing them.
+
+The formats are only available when `pyarrow` is installed.
+"""
+
+import itertools
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+import config
+import utils
+from schemas import DataCatalogCreate, QueryRequest, TypeAttribute, TypeCatalog
+
+
+def is_available() -> bool:
+    return pa is not None
+
+
+def _to_int(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        try:
+            return int(float(value))
+        except (TypeError, ValueError):
+            return None
+
+
+def _to_float(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_str(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def _to_json(value: Any) -> Optional[str]:
+    return None if value is None else json.dumps(value)
+
+
+def _to_bool(value: Any) -> Optional[bool]:
+    return None if value is None else bool(value)
+
+
+def _to_datetime(value: Any) -> Optional[datetime]:
+    if value is None:
+        return None
+    if isinstance(value, str) and value.lstrip("-").isdigit():
+        # Epoch timestamps sent as text, as CSV values are
+        value = int(value)
+    try:
+        if isinstance(value, (int, float)):
+            # Epoch timestamps are accepted in seconds (as the time series entries) or milliseconds
+            return datetime.fromtimestamp(value / 1000 if abs(value) > 1e11 else value, tz=timezone.utc)
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except (ValueError, OverflowError, OSError):
+        return None
+
+
+def _get_attribute_type(attribute_type: TypeAttribute):
+    return {
+        TypeAttribute.STRING: (pa.string(), _to_str),
+        TypeAttribute.INTEGER: (pa.int64(), _to_int),
+        TypeAttribute.DOUBLE: (pa.float64(), _to_float),
+        TypeAttribute.TIMESTAMP: (pa.timestamp("ms", tz="UTC"), _to_datetime),
+    }.get(attribute_type, (pa.string(), _to_json))
+
+
+def _get_value_type(value: Any):
+    if isinstance(value, bool):
+        return pa.bool_(), _to_bool
+    if isinstance(value, int):
+        return pa.int64(), _to_int
+    if isinstance(value, float):
+        return pa.float64(), _to_float
+    if isinstance(value, str) or value is None:
+        return pa.string(), _to_str
+    return pa.string(), _to_json
+
+
+def _is_pivoted(datacatalog: DataCatalogCreate) -> bool:
+    return datacatalog.type in [TypeCatalog.TABLE, TypeCatalog.TIMESERIES]
+
+
+def get_schema(query: QueryRequest, datacatalog: DataCatalogCreate) -> List[tuple]:
+    """
+    Build the typed columns of the results of a query.
+
+    Returns:
+        List[tuple]: The name, Arrow type and value converter of each column.
+    """
+    columns = [("id", pa.string(), _to_str)]
+    if datacatalog.type == TypeCatalog.TIMESERIES:
+        columns.append(("timestamp", pa.timestamp("ms", tz="UTC"), _to_datetime))
+    for attribute in datacatalog.entities_context:
+        if not query.fields or attribute.context_key in query.fields:
+            columns.append((attribute.context_key, *_get_attribute_type(attribute.context_type)))
+    if datacatalog.type == TypeCatalog.FILE:
+        for key in [config.FIWARE_FILE_PROPERTY, config.FIWARE_FILENAME_PROPERTY]:
+            if not query.fields or key in query.fields:
+                columns.append((key, pa.string(), _to_str))
+    if not _is_pivoted(datacatalog):
+        columns.append(("tags", pa.list_(pa.string()), lambda tags: [str(tag) for tag in tags] if isinstance(tags, list) else None))
+    if query.context_per_entity():
+        for property in datacatalog.catalog_context:
+            columns.append((property.context_key, *_get_value_type(property.context_value)))
+    columns.append(("data_catalog", pa.string(), _to_str))
+    return columns
+
+
+def get_resampled_schema(page: List[Dict[str, Any]]) -> List[tuple]:
+    """
+    Build the typed columns of a resampled time series from its table, as its value columns
+    depend on the entities found.
+    """
+    columns = [("timestamp", pa.timestamp("ms", tz="UTC"), _to_datetime)]
+    for name, value in page[0].items():
+        if name == "timestamp":
+            continue
+        if isinstance(value, list):
+            columns.append((name, pa.float64(), _to_float))
+        else:
+            columns.append((name, *_get_value_type(value)))
+    return columns
+
+
+def _get_metadata(query: QueryRequest, datacatalog: DataCatalogCreate) -> Optional[Dict[bytes, bytes]]:
+    # In envelope mode the catalog context is stored once, in the schema metadata
+    if not query.envelope:
+        return None
+    context = {property.context_key: property.context_value for property in datacatalog.catalog_context} if query.include_context else {}
+    return {b"catalog_id": datacatalog.id.encode(), b"catalog_context": json.dumps(context, default=str).encode()}
+
+
+def _get_value(field: Any) -> Any:
+    return field["value"] if isinstance(field, dict) and "value" in field else field
+
+
+def to_record_batch(page: List[Dict[str, Any]], columns: List[tuple], pivot: bool):
+    """
+    Convert a page of entities into an Arrow record batch. When pivoting, the list fields of
+    each entity (table columns, time series values) become rows and the other fields are repeated.
+    """
+    values: Dict[str, list] = {name: [] for name, _, _ in columns}
+    for entity in page:
+        fields = {key: _get_value(value) for key, value in entity.items()}
+        if pivot:
+            total_rows = max([len(fields[name]) for name in values if isinstance(fields.get(name), list)], default=0)
+            for name, _, convert in columns:
+                field = fields.get(name)
+                if isinstance(field, list):
+                    column = [convert(value) for value in field[:total_rows]]
+                    column += [None] * (total_rows - len(column))
+                else:
+                    column = [convert(field)] * total_rows
+                values[name].extend(column)
+        else:
+            for name, _, convert in columns:
+                values[name].append(convert(fields.get(name)))
+    return pa.record_batch(
+        [pa.array(values[name], type=arrow_type) for name, arrow_type, _ in columns],
+        schema=pa.schema([(name, arrow_type) for name, arrow_type, _ in columns])
+    )
+
+
+def _peek_schema(pages: Iterator[List[Dict[str, Any]]], query: QueryRequest, datacatalog: DataCatalogCreate):
+    # The columns of a resampled time series are only known once its table is retrieved
+    if not query.resample:
+        return pages, get_schema(query, datacatalog)
+    first_page = next(pages, None)
+    if not first_page:
+        return iter([]), [("timestamp", pa.timestamp("ms", tz="UTC"), _to_datetime)]
+    return itertools.chain([first_page], pages), get_resampled_schema(first_page)
+
+
+def render_arrow(pages: Iterator[List[Dict[str, Any]]], query: QueryRequest, datacatalog: DataCatalogCreate) -> Iterator[bytes]:
+    """Render the pages of a query as an Arrow IPC stream, one record batch per page."""
+    pages, columns = _peek_schema(pages, query, datacatalog)
+    schema = pa.schema([(name, arrow_type) for name, arrow_type, _ in columns], metadata=_get_metadata(query, datacatalog))
+    sink = utils.ChunkSink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for page in pages:
+            writer.write_batch(to_record_batch(page, columns, _is_pivoted(datacatalog)))
+            yield sink.take()
+    yield sink.take()
+
+
+def render_parquet(pages: Iterator[List[Dict[str, Any]]], query: QueryRequest, datacatalog: DataCatalogCreate) -> Iterator[bytes]:
+    """
+    Render the pages of a query as a Parquet file. Pages are grouped into row groups of
+    `COLUMNAR_ROW_GROUP_SIZE` rows, each one is streamed as soon as it is written.
+    """
+    pages, columns = _peek_schema(pages, query, datacatalog)
+    schema = pa.schema([(name, arrow_type) for name, arrow_type, _ in columns], metadata=_get_metadata(query, datacatalog))
+    sink = utils.ChunkSink()
+    batches = []
+    rows = 0
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for page in pages:
+            batch = to_record_batch(page, columns, _is_pivoted(datacatalog))
+            batches.append(batch)
+            rows += batch.num_rows
+            if rows >= config.COLUMNAR_ROW_GROUP_SIZE:
+                writer.write_table(pa.Table.from_batches(batches, schema=schema))
+                batches, rows = [], 0
+                yield sink.take()
+        if batches:
+            writer.write_table(pa.Table.from_batches(batches, schema=schema))
+    yield sink.take()
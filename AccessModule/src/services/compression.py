@@ -0,0 +1,84 @@
+"""
+compression.py
+
+This module provides the compression at rest of the uploaded files. When `FILE_COMPRESSION` is
+`zstd`, the files with a compressible extension (CSV, JSON, logs...) are compressed with
+Zstandard while they are stored, and their entity records the codec in its `file_codec` property.
+
+Compressed files are downloaded as they are stored, with `Content-Encoding: zstd`, by the
+clients that accept it, and decompressed on the fly for any other client.
+
+The compression is only available when `zstandard` is installed.
+"""
+
+import contextlib
+import os
+from typing import BinaryIO, Iterator, Optional
+
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+
+import config
+
+ZSTD = "zstd"
+IDENTITY = "identity"
+
+
+def is_available() -> bool:
+    return zstd is not None
+
+
+def get_codec(filename: str) -> str:
+    """Codec used to store a new file, according to the storage settings and its extension."""
+    if config.FILE_COMPRESSION != ZSTD or not is_available():
+        return IDENTITY
+    extension = os.path.splitext(filename or "")[1].lower()
+    return ZSTD if extension in config.FILE_COMPRESSIBLE_EXTENSIONS else IDENTITY
+
+
+def is_compressed(codec: Optional[str]) -> bool:
+    return bool(codec) and codec != IDENTITY
+
+
+def writer(destination: BinaryIO, codec: str):
+    """
+    Wrap a file being written, so the bytes written to the wrapper are stored encoded with the codec.
+    The wrapper must be closed (it is a context manager) to write the end of the compressed data.
+    """
+    if codec == ZSTD:
+        return zstd.ZstdCompressor(level=config.FILE_COMPRESSION_LEVEL).stream_writer(destination, closefd=False)
+    return contextlib.nullcontext(destination)
+
+
+def open_decoded(path: str, codec: Optional[str]) -> BinaryIO:
+    """Open a stored file for reading its original bytes."""
+    file = open(path, "rb")
+    if codec == ZSTD:
+        return zstd.ZstdDecompressor().stream_reader(file, closefd=True)
+    return file
+
+
+def iter_decoded(path: str, codec: Optional[str]) -> Iterator[bytes]:
+    """Read the original bytes of a stored file in chunks."""
+    with open_decoded(path, codec) as file:
+        while True:
+            chunk = file.read(config.DOWNLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def accepts(accept_encoding: Optional[str], codec: str) -> bool:
+    """Whether a client accepts the stored encoding, according to its `Accept-Encoding` header."""
+    for coding in (accept_encoding or "").split(","):
+        name, _, parameters = coding.strip().partition(";")
+        if name.strip().lower() == codec:
+            # A quality of 0 means the coding is not acceptable
+            quality = parameters.strip().lower().replace(" ", "")
+            try:
+                return float(quality[2:]) > 0 if quality.startswith("q=") else True
+            except ValueError:
+                return False
+    return False
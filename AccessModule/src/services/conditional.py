@@ -0,0 +1,69 @@
+"""
+conditional.py
+
+This module builds the validators (ETag and Last-Modified) of the catalog and query responses,
+and evaluates the conditional request headers against them. The validators only depend on the
+change counters of the catalogs, so an unchanged resource is answered with a 304 without
+retrieving its data from Orion. The routers only evaluate the headers once the catalog is known
+to exist, so a missing or deleted catalog is reported as such rather than as unchanged.
+
+The counters are increased by the AccessModule inserts and catalog updates, and by the Orion
+notifications of the changes made by other clients.
+"""
+
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+import services.changes as service_changes
+
+
+def _get_validators(counter_id: str, key: str) -> Tuple[str, float]:
+    version, changed_at = service_changes.get_version(counter_id)
+    epoch = service_changes.get_epoch()
+    digest = hashlib.sha1(f"{epoch}:{counter_id}:{version}:{key}".encode()).hexdigest()
+    return f'"{digest}"', max(changed_at, epoch)
+
+
+def get_catalog_validators(catalog_id: str) -> Tuple[str, float]:
+    """
+    Build the validators of a catalog definition.
+
+    Returns:
+        Tuple[str, float]: The ETag and the time of the last change.
+    """
+    return _get_validators(catalog_id, "catalog")
+
+
+def get_catalog_list_validators(key: str) -> Tuple[str, float]:
+    """Build the validators of a list of catalogs, `key` identifies the request filters."""
+    return _get_validators(service_changes.CATALOG_LIST, key)
+
+
+def get_query_validators(catalog_id: str, key: str) -> Tuple[str, float]:
+    """Build the validators of the results of a query, `key` is the normalized query request."""
+    return _get_validators(catalog_id, key)
+
+
+def get_headers(etag: str, last_modified: float) -> Dict[str, str]:
+    return {"ETag": etag, "Last-Modified": formatdate(last_modified, usegmt=True)}
+
+
+def is_not_modified(etag: str, last_modified: float, if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+    """
+    Evaluate the conditional headers of a request. `If-Modified-Since` is ignored when
+    `If-None-Match` is present, as stated by RFC 9110.
+
+    Returns:
+        bool: True if the client copy is still valid and a 304 can be returned.
+    """
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        # The weak comparison applies, a weak tag matches the strong tag with the same value
+        return "*" in tags or etag in [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+    if if_modified_since is not None:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
@@ -9,7 +9,9 @@ from schemas import DataCatalogCreate, DataCatalogBase, TypeCatalog, OrionSubscr
 from utils import get_full_catalog_id, get_full_subscription_id, get_internal_catalog_id, get_full_user_id
 from exceptions import DataCatalogExists, DataCatalogNotFound, DataCatalogUpdateError, FiwareException, ODSPermissionException, ODSException
 import config
+import metrics
 import repository.fiware as fiware_repository
+import services.changes as service_changes
 
 
 def get_catalog(catalog_id: str) -> DataCatalogCreate:
@@ -17,7 +19,9 @@ def get_catalog(catalog_id: str) -> DataCatalogCreate:
         catalog_json = fiware_repository.get_datacatalog(get_full_catalog_id(catalog_id))
         print(catalog_json)
         if catalog_json:
-            datacatalog = DataCatalogCreate.from_fiware(catalog_json.json())
+            with metrics.timed("catalog_parse"):
+                datacatalog = DataCatalogCreate.from_fiware(catalog_json.json())
+            service_changes.track(catalog_id)
             return datacatalog
         raise DataCatalogNotFound(config.C404_DATACATALOG_NOT_FOUND.format(catalog_id))
     except Exception as e:
@@ -31,7 +35,9 @@ def get_catalogs(request: CatalogQueryRequest = None) -> List[DataCatalogCreate]
         else:
             query_response = fiware_repository.get_entity(config.CATALOG_ENTITY, method= None)
         if query_response:
-            return [DataCatalogCreate.from_fiware(data) for data in query_response.json()]
+            service_changes.track(service_changes.CATALOG_LIST)
+            with metrics.timed("catalog_list_parse"):
+                return [DataCatalogCreate.from_fiware(data) for data in query_response.json()]
         return []
     except Exception as e:
         raise ODSException(f"Error retrieving catalogs: {str(e)}")
@@ -56,6 +62,8 @@ def create_catalog(datacatalog: DataCatalogBase, username: str) -> DataCatalogCr
         if not result.ok or "errors" in result.json():
             raise FiwareException("Failed to create catalog in Fiware")
         
+        service_changes.mark_changed(service_changes.CATALOG_LIST)
+
         if datacatalog.type == TypeCatalog.TIMESERIES:
             subscription = OrionSubscriptionCreate(
                 description=config.INTERNAL_QL_SUBSCRIPTION_DESC,
@@ -65,6 +73,12 @@ def create_catalog(datacatalog: DataCatalogBase, username: str) -> DataCatalogCr
                 id=get_full_subscription_id(catalog.get_catalog_type_id(), config.QL_NAME)
             )
             fiware_repository.subscribe(subscription.subscription_to_fiware())
+
+        if config.ODS_NOTIFY_URL:
+            # Orion notifies the changes made without the AccessModule, to invalidate the cached queries.
+            # Imported here, the subscription service depends on this module
+            import services.subscription as service_subscription
+            service_subscription.ensure_internal_subscription(catalog_id)
         
         return catalog if result else None
     except Exception as e:
@@ -88,6 +102,8 @@ def update_catalog(catalog_id: str, datacatalog: DataCatalogBase, current_user:
         
         if not result:
             raise ODSException("Failed to update catalog in Fiware")
+        service_changes.mark_changed(catalog.id)
+        service_changes.mark_changed(service_changes.CATALOG_LIST)
         
         return catalog
     except Exception as e:
@@ -106,6 +122,8 @@ def delete_catalog(catalog_id: str, current_user: str) -> bool:
         result = fiware_repository.delete(get_full_catalog_id(catalog_id))
         if not result.ok:
             raise ODSException("Failed to delete catalog in Fiware")
+        service_changes.mark_changed(current_datacatalog.id)
+        service_changes.mark_changed(service_changes.CATALOG_LIST)
         
         return True
     except Exception as e:
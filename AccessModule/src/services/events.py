@@ -0,0 +1,221 @@
+"""
+events.py
+
+This module provides the live stream of the changes in the data catalogs. The notifications
+received from Orion are appended to an event log per catalog, and every open stream (in any
+server process) follows the log of its catalog, as `tail -f` does, to push the new events to
+its client.
+
+Each event is a line of JSON with the entities notified at once. The ID of an event is the
+inode of its log and its end offset, so a client reconnecting with the ID of its last event
+(`Last-Event-ID`) resumes the stream after it. A log is rotated when it exceeds
+`EVENTS_LOG_MAX_BYTES`, keeping the previous log until the next rotation.
+
+Layout (shared by all the server processes):
+- {catalog_id}.log: Current log of the catalog.
+- {catalog_id}.log.1: Previous log of the catalog.
+
+Dependencies:
+- Notifications service: For the catalog of the notified entities.
+- Subscription service: For the internal subscription of the streamed catalogs.
+- Utils: For matching the entity patterns of the streams.
+"""
+
+import asyncio
+import fcntl
+import json
+import os
+import re
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import config
+import exceptions
+import utils
+import services.datacatalog as service_datacatalog
+import services.notifications as service_notifications
+import services.subscription as service_subscription
+from schemas import DataCatalogCreate
+
+
+def _log_path(catalog_id: str) -> str:
+    return os.path.join(config.EVENTS_PATH, quote(catalog_id, safe="") + ".log")
+
+
+def _is_replaced(path: str, file) -> bool:
+    try:
+        return os.stat(path).st_ino != os.fstat(file.fileno()).st_ino
+    except FileNotFoundError:
+        return True
+
+
+def publish(notification: Dict[str, Any]) -> List[str]:
+    """
+    Append the entities of an Orion notification to the event log of their catalogs.
+
+    Args:
+        notification (Dict[str, Any]): The NGSI-LD notification sent by Orion.
+
+    Returns:
+        List[str]: The IDs of the catalogs with new events.
+    """
+    by_catalog: Dict[str, List[Dict[str, Any]]] = {}
+    for entity in notification.get("data", []):
+        catalog_id = service_notifications.get_notified_catalog(entity)
+        if catalog_id:
+            by_catalog.setdefault(catalog_id, []).append(entity)
+    if not by_catalog:
+        return []
+
+    os.makedirs(config.EVENTS_PATH, exist_ok=True)
+    notified_at = notification.get("notifiedAt")
+    for catalog_id, entities in by_catalog.items():
+        line = (json.dumps({"catalog_id": catalog_id, "notified_at": notified_at, "data": entities},
+                           separators=(",", ":"), default=str) + "\n").encode()
+        path = _log_path(catalog_id)
+        while True:
+            with open(path, "ab") as log:
+                fcntl.flock(log, fcntl.LOCK_EX)
+                # The log may have been rotated while waiting for the lock, the event goes to the new one
+                if _is_replaced(path, log):
+                    continue
+                if log.tell() > 0 and log.tell() + len(line) > config.EVENTS_LOG_MAX_BYTES:
+                    os.replace(path, path + ".1")
+                    continue
+                log.write(line)
+                break
+    return sorted(by_catalog)
+
+
+def open_stream(catalog_id: str, user: str) -> DataCatalogCreate:
+    """
+    Check that a user can stream the changes of a catalog, and that Orion notifies them.
+
+    Raises:
+        exceptions.ODSPermissionException: If the catalog is private and owned by another user.
+        exceptions.ODSException: If the catalog does not exist.
+    """
+    datacatalog = service_datacatalog.get_catalog(catalog_id)
+    if datacatalog.owner != user and not datacatalog.is_public:
+        raise exceptions.ODSPermissionException(config.C403_DATACATALOG_ACCESS_ERROR)
+    if config.ODS_NOTIFY_URL:
+        service_subscription.ensure_internal_subscription(catalog_id)
+    return datacatalog
+
+
+def _parse_event_id(event_id: Optional[str]) -> Optional[Tuple[int, int]]:
+    inode, _, offset = (event_id or "").partition("-")
+    if not inode.isdigit() or not offset.isdigit():
+        return None
+    return int(inode), int(offset)
+
+
+class EventReader:
+    """Follows the event log of a catalog from the end, or from the event after `last_event_id`."""
+
+    def __init__(self, catalog_id: str, last_event_id: Optional[str] = None):
+        self.path = _log_path(catalog_id)
+        os.makedirs(config.EVENTS_PATH, exist_ok=True)
+        # The log is created if it does not exist yet, so its inode identifies the events
+        self.file = open(self.path, "a+b")
+        self.file.seek(0, os.SEEK_END)
+        self.buffer = b""
+
+        resume = _parse_event_id(last_event_id)
+        if resume:
+            inode, offset = resume
+            if inode == os.fstat(self.file.fileno()).st_ino and offset <= self.file.tell():
+                self.file.seek(offset)
+            else:
+                # The event may be in the previous log, read it from there before the current one
+                try:
+                    previous = open(self.path + ".1", "rb")
+                except FileNotFoundError:
+                    return
+                if os.fstat(previous.fileno()).st_ino == inode:
+                    self.file.close()
+                    self.file = previous
+                    self.file.seek(offset)
+                else:
+                    previous.close()
+
+    def close(self):
+        self.file.close()
+
+    def read(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Read the events appended since the last read.
+
+        Returns:
+            List[Tuple[str, Dict[str, Any]]]: The ID and the content of each event.
+        """
+        events = []
+        while True:
+            # Checked before reading, so the events written before the rotation are not missed.
+            # Until a new log is created, the rotated one is still the current one
+            rotated = os.path.exists(self.path) and _is_replaced(self.path, self.file)
+            self.buffer += self.file.read()
+            inode = os.fstat(self.file.fileno()).st_ino
+            offset = self.file.tell() - len(self.buffer)
+            *lines, self.buffer = self.buffer.split(b"\n")
+            for line in lines:
+                offset += len(line) + 1
+                events.append((f"{inode}-{offset}", json.loads(line)))
+            # Once a rotated log is read to the end, the events continue in the new log
+            if not rotated:
+                return events
+            self.file.close()
+            self.file = open(self.path, "rb")
+            self.buffer = b""
+
+
+def filter_event(event: Dict[str, Any], catalog_id: str, entities: Optional[List[str]],
+                 attrs: Optional[List[str]]) -> Optional[Dict[str, Any]]:
+    """
+    Keep the entities of an event matching the entity patterns, and only the requested
+    attributes of each entity (the entities without any of them are dropped).
+
+    Returns:
+        Optional[Dict[str, Any]]: The filtered event, or None if no entity is left.
+    """
+    pattern = re.compile(utils.get_entity_id_pattern(catalog_id, entities)) if entities else None
+    data = []
+    for entity in event.get("data", []):
+        if pattern and not pattern.match(entity.get("id", "")):
+            continue
+        if attrs:
+            selected = {key: value for key, value in entity.items() if key in attrs}
+            if not selected:
+                continue
+            entity = {"id": entity.get("id"), "type": entity.get("type"), **selected}
+        data.append(entity)
+    if not data:
+        return None
+    return {**event, "data": data}
+
+
+async def follow(catalog_id: str, entities: Optional[List[str]] = None, attrs: Optional[List[str]] = None,
+                 last_event_id: Optional[str] = None) -> AsyncIterator[Optional[Tuple[str, Dict[str, Any]]]]:
+    """
+    Follow the events of a catalog, filtered by entities and attributes.
+
+    Returns:
+        AsyncIterator[Optional[Tuple[str, Dict[str, Any]]]]: The ID and content of each new event,
+        and None every `EVENTS_HEARTBEAT` seconds without events, so idle connections are kept alive.
+    """
+    reader = EventReader(catalog_id, last_event_id)
+    try:
+        last_sent = time.monotonic()
+        while True:
+            for event_id, event in reader.read():
+                event = filter_event(event, catalog_id, entities, attrs)
+                if event:
+                    last_sent = time.monotonic()
+                    yield event_id, event
+            if time.monotonic() - last_sent >= config.EVENTS_HEARTBEAT:
+                last_sent = time.monotonic()
+                yield None
+            await asyncio.sleep(config.EVENTS_POLL_INTERVAL)
+    finally:
+        reader.close()
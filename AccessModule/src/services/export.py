@@ -0,0 +1,164 @@
+"""
+export.py
+
+This module retrieves the results of a query page by page, and renders them in the requested
+output format as a stream of chunks. Each page is rendered as soon as it is retrieved from
+Orion or QuantumLeap, so the memory used by a query does not depend on the size of its results.
+
+Dependencies:
+- Services: For retrieving the data of each type of catalog.
+- Utils: For the CSV rendering functions.
+- Columnar: For the Arrow and Parquet rendering functions.
+"""
+
+import itertools
+import json
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import config
+import exceptions
+import utils
+import services.changes as service_changes
+import services.columnar as service_columnar
+import services.genericdata as service_genericdata
+import services.pagination as service_pagination
+import services.timeseries as service_timeseries
+from schemas import DataCatalogCreate, QueryRequest, TypeCatalog, OutputFormat
+
+# Media type and file name of each streamed output format
+OUTPUT_MEDIA_TYPES = {
+    OutputFormat.CSV: ("text/csv", "data.csv"),
+    OutputFormat.ARROW: ("application/vnd.apache.arrow.stream", "data.arrow"),
+    OutputFormat.PARQUET: ("application/vnd.apache.parquet", "data.parquet"),
+    OutputFormat.NDJSON: ("application/x-ndjson", "data.ndjson"),
+}
+
+
+def iter_pages(query: QueryRequest, datacatalog: DataCatalogCreate) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Retrieve the results of a query page by page.
+
+    Args:
+        query (QueryRequest): The query request.
+        datacatalog (DataCatalogCreate): The data catalog being queried.
+
+    Returns:
+        Iterator[List[Dict[str, Any]]]: The pages of entities.
+
+    Raises:
+        exceptions.ODSException: If the query resamples a catalog that is not a time series.
+    """
+    if query.resample:
+        if datacatalog.type != TypeCatalog.TIMESERIES:
+            raise exceptions.ODSException(config.Q400_RESAMPLE_NOT_TIMESERIES.format(datacatalog.id))
+        return service_timeseries.iter_resampled(query, datacatalog)
+    if datacatalog.type == TypeCatalog.TIMESERIES:
+        return service_timeseries.iter_data(query, datacatalog)
+    return service_genericdata.iter_data(query, datacatalog)
+
+
+def get_next_cursor(query: QueryRequest, datacatalog: DataCatalogCreate) -> Optional[str]:
+    """
+    Build the cursor of the next page of a paginated query.
+
+    Returns:
+        Optional[str]: The next cursor, or None if the query is not paginated or this is its last page.
+    """
+    if not query.limit:
+        return None
+    # The entities are only counted for the first page, or again if the catalog changed meanwhile
+    version, _ = service_changes.get_version(query.catalog_id)
+    total = service_pagination.get_total(query, version)
+    if total is None and datacatalog.type == TypeCatalog.TIMESERIES:
+        total = service_timeseries.count_data(query, datacatalog)
+    elif total is None:
+        total = service_genericdata.count_data(query, datacatalog)
+    return service_pagination.get_next_cursor(query, total, version)
+
+
+def get_columns(query: QueryRequest, datacatalog: DataCatalogCreate) -> List[str]:
+    """
+    Columns known in advance from the catalog definition. Rendering can start without
+    knowing every entity, and columns missing in the first page are still present.
+    """
+    columns = ["id"]
+    if datacatalog.type == TypeCatalog.TIMESERIES:
+        columns.append("timestamp")
+    columns += [
+        attribute.context_key for attribute in datacatalog.entities_context
+        if not query.fields or attribute.context_key in query.fields
+    ]
+    if datacatalog.type == TypeCatalog.FILE:
+        columns += [
+            key for key in [config.FIWARE_FILE_PROPERTY, config.FIWARE_FILENAME_PROPERTY]
+            if not query.fields or key in query.fields
+        ]
+    return columns
+
+
+def get_envelope(query: QueryRequest, datacatalog: DataCatalogCreate) -> Optional[Dict[str, Any]]:
+    """
+    Build the header sent once per response in envelope mode, with the catalog context that
+    is otherwise repeated in every entity.
+
+    Returns:
+        Optional[Dict[str, Any]]: The catalog ID and context, or None if the query is not in envelope mode.
+    """
+    if not query.envelope:
+        return None
+    return {
+        "catalog_id": datacatalog.id,
+        "catalog_context": {
+            property.context_key: property.context_value for property in datacatalog.catalog_context
+        } if query.include_context else {}
+    }
+
+
+def render_csv(pages: Iterator[List[Dict[str, Any]]], query: QueryRequest, datacatalog: DataCatalogCreate) -> Iterator[str]:
+    """
+    Render the pages of a query as CSV. Table and time series entities are pivoted into one
+    row per value, any other entity is rendered as a single row. A resampled time series is a
+    single wide table, whose columns depend on the entities found.
+    """
+    if query.resample:
+        content = utils.iter_table_csv(pages)
+    elif datacatalog.type in [TypeCatalog.TABLE, TypeCatalog.TIMESERIES]:
+        content = utils.iter_table_csv(pages, get_columns(query, datacatalog))
+    else:
+        content = utils.iter_json_csv(pages, get_columns(query, datacatalog))
+    envelope = get_envelope(query, datacatalog)
+    if envelope:
+        # The envelope is written as a commented preamble before the CSV header
+        return itertools.chain([utils.csv_preamble(envelope)], content)
+    return content
+
+
+def render_ndjson(pages: Iterator[List[Dict[str, Any]]], query: QueryRequest, datacatalog: DataCatalogCreate) -> Iterator[str]:
+    """Render the pages of a query as NDJSON, the envelope (if any) is the first line."""
+    envelope = get_envelope(query, datacatalog)
+    if envelope:
+        return itertools.chain([json.dumps(envelope, default=str) + "\n"], utils.iter_ndjson(pages))
+    return utils.iter_ndjson(pages)
+
+
+def is_available(output: OutputFormat) -> bool:
+    if output in [OutputFormat.ARROW, OutputFormat.PARQUET]:
+        return service_columnar.is_available()
+    return True
+
+
+def render(pages: Iterator[List[Dict[str, Any]]], query: QueryRequest, datacatalog: DataCatalogCreate) -> Tuple[Iterator, str, str]:
+    """
+    Render the pages of a query in its output format.
+
+    Returns:
+        Tuple[Iterator, str, str]: The chunks of the output, its media type and its file name.
+    """
+    media_type, filename = OUTPUT_MEDIA_TYPES[query.output]
+    if query.output == OutputFormat.ARROW:
+        return service_columnar.render_arrow(pages, query, datacatalog), media_type, filename
+    if query.output == OutputFormat.PARQUET:
+        return service_columnar.render_parquet(pages, query, datacatalog), media_type, filename
+    if query.output == OutputFormat.NDJSON:
+        return render_ndjson(pages, query, datacatalog), media_type, filename
+    return render_csv(pages, query, datacatalog), media_type, filename
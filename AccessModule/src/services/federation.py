@@ -0,0 +1,94 @@
+"""
+federation.py
+
+This module runs a query over several data catalogs at once. The catalog lookups and the data
+retrieval of every catalog run concurrently, bounded by `MULTI_QUERY_MAX_CONCURRENCY`, and the
+pages are merged in the order they are retrieved. Each entity keeps its `data_catalog` field, so
+the merged results can be told apart.
+
+Dependencies:
+- Datacatalog service: For retrieving the catalog definitions.
+- Export service: For retrieving the data of each catalog page by page.
+"""
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Tuple
+
+import config
+import services.datacatalog as service_datacatalog
+import services.export as service_export
+from schemas import DataCatalogCreate, QueryRequest
+
+# Marks the end of the pages of a catalog in the merge queue
+_DONE = object()
+
+
+def get_catalogs(queries: List[QueryRequest]) -> List[DataCatalogCreate]:
+    """
+    Retrieve concurrently the data catalogs of a multi-catalog query.
+
+    Raises:
+        exceptions.ODSException: If any of the catalogs does not exist or can't be retrieved.
+    """
+    catalog_ids = list(dict.fromkeys(query.catalog_id for query in queries))
+    with ThreadPoolExecutor(max_workers=config.MULTI_QUERY_MAX_CONCURRENCY) as executor:
+        catalogs = dict(zip(catalog_ids, executor.map(service_datacatalog.get_catalog, catalog_ids)))
+    return [catalogs[query.catalog_id] for query in queries]
+
+
+def iter_pages(queries: List[QueryRequest], datacatalogs: List[DataCatalogCreate]) -> Iterator[Tuple[str, Any]]:
+    """
+    Retrieve concurrently the pages of several catalog queries.
+
+    Args:
+        queries (List[QueryRequest]): The query of each catalog.
+        datacatalogs (List[DataCatalogCreate]): The catalog of each query.
+
+    Yields:
+        Tuple[str, Any]: The catalog ID and either a page of entities or the error that
+        interrupted the query of the catalog. A failing catalog does not stop the others.
+    """
+    # The queue is bounded, so a slow client stops the retrieval instead of buffering everything
+    merged: "queue.Queue" = queue.Queue(maxsize=config.MULTI_QUERY_MAX_CONCURRENCY * 2)
+    cancelled = threading.Event()
+
+    def put(item) -> bool:
+        while not cancelled.is_set():
+            try:
+                merged.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(query: QueryRequest, datacatalog: DataCatalogCreate):
+        try:
+            for page in service_export.iter_pages(query, datacatalog):
+                if page and not put((query.catalog_id, page)):
+                    return
+        except Exception as ex:
+            put((query.catalog_id, ex))
+        finally:
+            put((query.catalog_id, _DONE))
+
+    executor = ThreadPoolExecutor(max_workers=config.MULTI_QUERY_MAX_CONCURRENCY)
+    try:
+        for query, datacatalog in zip(queries, datacatalogs):
+            executor.submit(run, query, datacatalog)
+        pending = len(queries)
+        while pending:
+            catalog_id, item = merged.get()
+            if item is _DONE:
+                pending -= 1
+                continue
+            yield catalog_id, item
+    finally:
+        # Stops the remaining queries if the response is interrupted
+        cancelled.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_error(catalog_id: str, error: Exception) -> Dict[str, Any]:
+    return {"data_catalog": catalog_id, "error": str(error.args[0] if error.args else error)}
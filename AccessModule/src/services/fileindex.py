@@ -0,0 +1,219 @@
+"""
+fileindex.py
+
+This module keeps a local index of the stored files, so a download is resolved with an indexed
+read instead of reading the file details from the entity in Orion (which is only checked to
+still exist). The index is an SQLite database (in WAL mode,
+shared by all the server processes) that maps each catalog, owner and entity to the path of the
+file, its original filename, size on disk, SHA-256 hash (of the original bytes), storage codec
+and modification time.
+
+Files are indexed when they are inserted, and the files inserted asynchronously or before the
+index existed are indexed the first time they are downloaded. The index can be reconciled with
+Orion, to index every file entity and drop the files whose entity does not exist anymore:
+
+    python -m services.fileindex [--catalog CATALOG_ID]
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import BinaryIO, Dict, Optional, Tuple
+
+from pydantic import BaseModel
+
+import config
+import services.compression as service_compression
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    catalog_id TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    entity TEXT NOT NULL,
+    path TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT,
+    mtime REAL NOT NULL,
+    codec TEXT,
+    PRIMARY KEY (catalog_id, owner, entity)
+) WITHOUT ROWID
+"""
+
+_local = threading.local()
+
+
+class FileRecord(BaseModel):
+    catalog_id: str
+    owner: str
+    entity: str
+    path: str
+    filename: str
+    size: int
+    sha256: Optional[str] = None
+    mtime: float
+    codec: Optional[str] = None
+
+
+def _connection() -> sqlite3.Connection:
+    # SQLite connections can't be shared between threads, each thread opens its own
+    connection = getattr(_local, "connection", None)
+    if connection is None:
+        os.makedirs(os.path.dirname(os.path.abspath(config.FILE_INDEX_PATH)), exist_ok=True)
+        connection = sqlite3.connect(config.FILE_INDEX_PATH, timeout=30, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(_SCHEMA)
+        # Indexes created before the files were compressed lack the codec column
+        if "codec" not in [column[1] for column in connection.execute("PRAGMA table_info(files)")]:
+            try:
+                connection.execute("ALTER TABLE files ADD COLUMN codec TEXT")
+            except sqlite3.OperationalError:
+                pass
+        _local.connection = connection
+    return connection
+
+
+def copy_file(source: BinaryIO, destination: BinaryIO) -> Tuple[int, str]:
+    """
+    Copy a file in chunks, hashing it on the way.
+
+    Returns:
+        Tuple[int, str]: The size and the SHA-256 hash of the copied bytes.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = source.read(config.DOWNLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+        destination.write(chunk)
+        size += len(chunk)
+    return size, digest.hexdigest()
+
+
+def hash_file(path: str, codec: Optional[str] = None) -> str:
+    digest = hashlib.sha256()
+    for chunk in service_compression.iter_decoded(path, codec):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def put(catalog_id: str, owner: str, entity: str, path: str, filename: str, sha256: Optional[str] = None,
+        codec: Optional[str] = None) -> FileRecord:
+    """
+    Index a stored file, replacing its previous record.
+
+    Args:
+        catalog_id (str): The ID of the data catalog.
+        owner (str): The owner of the entity.
+        entity (str): The name of the entity.
+        path (str): The path of the file.
+        filename (str): The original name of the file.
+        sha256 (Optional[str]): The hash of the file, if it is known.
+        codec (Optional[str]): The codec the file is stored with.
+
+    Returns:
+        FileRecord: The indexed record.
+    """
+    stat_result = os.stat(path)
+    record = FileRecord(
+        catalog_id=catalog_id, owner=owner, entity=entity, path=path, filename=filename,
+        size=stat_result.st_size, sha256=sha256, mtime=stat_result.st_mtime, codec=codec
+    )
+    _connection().execute(
+        "INSERT OR REPLACE INTO files (catalog_id, owner, entity, path, filename, size, sha256, mtime, codec) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (record.catalog_id, record.owner, record.entity, record.path, record.filename, record.size, record.sha256,
+         record.mtime, record.codec)
+    )
+    return record
+
+
+def get(catalog_id: str, owner: str, entity: str) -> Optional[FileRecord]:
+    """Look up the record of a file, None if it is not indexed."""
+    row = _connection().execute(
+        "SELECT catalog_id, owner, entity, path, filename, size, sha256, mtime, codec FROM files "
+        "WHERE catalog_id = ? AND owner = ? AND entity = ?",
+        (catalog_id, owner, entity)
+    ).fetchone()
+    if row is None:
+        return None
+    return FileRecord(**dict(zip(FileRecord.model_fields, row)))
+
+
+def move(catalog_id: str, owner: str, entity: str, old_path: str, new_path: str):
+    """Update the path of an indexed file, unless it has been indexed again with another path."""
+    _connection().execute(
+        "UPDATE files SET path = ? WHERE catalog_id = ? AND owner = ? AND entity = ? AND path = ?",
+        (new_path, catalog_id, owner, entity, old_path)
+    )
+
+
+def delete(catalog_id: str, owner: str, entity: str):
+    _connection().execute(
+        "DELETE FROM files WHERE catalog_id = ? AND owner = ? AND entity = ?", (catalog_id, owner, entity)
+    )
+
+
+def reconcile(catalog_id: Optional[str] = None) -> Dict[str, int]:
+    """
+    Reconcile the index with the file entities in Orion. Every entity whose file is stored is
+    indexed (hashing the files that changed since they were indexed), and the records of the
+    entities that do not exist anymore are removed.
+
+    Args:
+        catalog_id (Optional[str]): The ID of the data catalog to reconcile, all the FILE catalogs if None.
+
+    Returns:
+        Dict[str, int]: The number of indexed, unchanged, missing (entity without file) and removed records.
+    """
+    import services.datacatalog as service_datacatalog
+    import services.files as service_files
+    from schemas import TypeCatalog
+
+    if catalog_id:
+        catalog_ids = [catalog_id]
+    else:
+        catalog_ids = [catalog.id for catalog in service_datacatalog.get_catalogs() if catalog.type == TypeCatalog.FILE]
+
+    stats = {"indexed": 0, "unchanged": 0, "missing": 0, "removed": 0}
+    for current_catalog in catalog_ids:
+        # Fails if Orion can't be reached, rather than removing every record of the catalog
+        service_datacatalog.get_catalog(current_catalog)
+        found = set()
+        for page in service_files.iter_files(current_catalog, []):
+            for file_path, name, filename, codec in page:
+                owner, _, entity = name.partition("/")
+                found.add((owner, entity))
+                if not os.path.exists(file_path):
+                    stats["missing"] += 1
+                    continue
+                record = get(current_catalog, owner, entity)
+                stat_result = os.stat(file_path)
+                if (record and record.path == file_path and record.filename == filename and record.sha256
+                        and record.codec == codec and record.size == stat_result.st_size
+                        and record.mtime == stat_result.st_mtime):
+                    stats["unchanged"] += 1
+                    continue
+                put(current_catalog, owner, entity, file_path, filename, hash_file(file_path, codec), codec)
+                stats["indexed"] += 1
+        indexed = _connection().execute(
+            "SELECT owner, entity FROM files WHERE catalog_id = ?", (current_catalog,)
+        ).fetchall()
+        for owner, entity in indexed:
+            if (owner, entity) not in found:
+                delete(current_catalog, owner, entity)
+                stats["removed"] += 1
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Reconcile the local file index with Orion")
+    parser.add_argument("--catalog", help="ID of the FILE data catalog to reconcile (all of them by default)")
+    arguments = parser.parse_args()
+    print(reconcile(arguments.catalog))
@@ -0,0 +1,109 @@
+"""
+filemigration.py
+
+This module moves the stored files to the layout configured in `FILE_LAYOUT` (see
+`services.files.get_storage_path`), while the AccessModule keeps serving them:
+
+    python -m services.filemigration [--dry-run]
+
+Each file is first linked at its new path, then its record in the file index is updated, and
+only then the old path is removed, so a download always finds the file at one of its paths.
+Files that are not moved yet are found by `services.files.resolve_path` in the previous layout,
+and files uploaded meanwhile are written to the new layout, replacing their previous version.
+"""
+
+import contextlib
+import os
+from typing import Dict, Iterator, Tuple
+
+import config
+import services.fileindex as service_fileindex
+import services.files as service_files
+
+
+def _iter_stored_files() -> Iterator[Tuple[str, str, str, str]]:
+    """
+    List the stored files in any layout: the files directly in an owner directory (flat layout)
+    and the files two levels below it (sharded layout).
+
+    Yields:
+        Tuple[str, str, str, str]: The catalog ID, owner, entity name and path of each file.
+    """
+    for catalog in os.scandir(config.FIWARE_FILE_PATH):
+        if not catalog.is_dir(follow_symlinks=False):
+            continue
+        for owner in os.scandir(catalog.path):
+            if not owner.is_dir(follow_symlinks=False):
+                continue
+            for entry in os.scandir(owner.path):
+                if entry.is_file(follow_symlinks=False):
+                    yield catalog.name, owner.name, entry.name, entry.path
+                elif entry.is_dir(follow_symlinks=False):
+                    for shard in os.scandir(entry.path):
+                        if not shard.is_dir(follow_symlinks=False):
+                            continue
+                        for file in os.scandir(shard.path):
+                            if file.is_file(follow_symlinks=False):
+                                yield catalog.name, owner.name, file.name, file.path
+
+
+def _remove_empty_directories(path: str, stop: str):
+    # Remove the shard directories left empty, up to the owner directory
+    while os.path.abspath(path) != os.path.abspath(stop):
+        try:
+            os.rmdir(path)
+        except OSError:
+            return
+        path = os.path.dirname(path)
+
+
+def migrate(dry_run: bool = False) -> Dict[str, int]:
+    """
+    Move the stored files to the configured layout.
+
+    Args:
+        dry_run (bool): Only count the files that would be moved.
+
+    Returns:
+        Dict[str, int]: The number of moved files, files already in place and files replaced by
+        a newer upload while the migration was running.
+    """
+    stats = {"moved": 0, "in_place": 0, "replaced": 0}
+    for catalog_id, owner, entity, path in _iter_stored_files():
+        target = service_files.get_storage_path(catalog_id, owner, entity)
+        if os.path.abspath(target) == os.path.abspath(path):
+            stats["in_place"] += 1
+            continue
+        if dry_run:
+            stats["moved"] += 1
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(path, target)
+        except FileExistsError:
+            # The file was uploaded again (or moved by an interrupted run), the target is the current
+            # version and its upload indexed it, so only the old copy is removed
+            stats["replaced"] += 1
+        except OSError:
+            # Hard links are not supported, the file is renamed and the index updated afterwards
+            os.replace(path, target)
+            service_fileindex.move(catalog_id, owner, entity, path, target)
+            stats["moved"] += 1
+            continue
+        else:
+            service_fileindex.move(catalog_id, owner, entity, path, target)
+            stats["moved"] += 1
+        # The old copy may have been removed meanwhile, by a concurrent run or a deletion
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+        _remove_empty_directories(os.path.dirname(path), os.path.join(config.FIWARE_FILE_PATH, catalog_id, owner))
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=f"Move the stored files to the {config.FILE_LAYOUT} layout")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the files to move")
+    arguments = parser.parse_args()
+    print(migrate(arguments.dry_run))
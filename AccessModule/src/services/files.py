@@ -6,17 +6,163 @@ data catalog. It includes functions for inserting data from a file into a Fiware
 retrieving file paths for stored entities.
 """
 
-from typing import BinaryIO, Tuple
+from typing import BinaryIO, Iterator, List, Optional, Tuple
 from schemas import (TypeCatalog, GeneralEntityRequest, 
                      FiwareEntity, FiwareProperty, QueryRequest, 
-                     DataCatalogCreate, OutputFormat)
-from repository.fiware import send_entity, get_entity, get_specific_entity
+                     DataCatalogCreate, OutputFormat, get_property_type)
+from repository.fiware import send_entity, get_entity, get_specific_entity, iter_entity_pages
 import utils 
 import config
+import metrics
 import os
+import hashlib
 import services.datacatalog as services
+import services.changes as service_changes
+import services.fileindex as service_fileindex
+import services.compression as service_compression
 import exceptions
-import shutil
+
+FLAT_LAYOUT = "flat"
+SHARDED_LAYOUT = "sharded"
+
+def get_storage_path(datacatalog: str, owner: str, entity: str, layout: str = None) -> str:
+    """
+    Path where the file of an entity is stored. In the flat layout all the files of an owner share
+    a directory; in the sharded layout they are spread over 65536 subdirectories named after the
+    hash of the entity, `{catalog}/{owner}/{h[0:2]}/{h[2:4]}/{entity}`, so directories stay small.
+
+    Args:
+        datacatalog (str): The ID of the data catalog.
+        owner (str): The owner of the entity.
+        entity (str): The name of the entity.
+        layout (str): The layout of the file store, `FILE_LAYOUT` by default.
+
+    Returns:
+        str: The path of the file.
+    """
+    directory = config.FIWARE_FILE_FORMAT.format(config.FIWARE_FILE_PATH, datacatalog, owner)
+    if (layout or config.FILE_LAYOUT) == SHARDED_LAYOUT:
+        digest = hashlib.sha1(entity.encode()).hexdigest()
+        directory = os.path.join(directory, digest[:2], digest[2:4])
+    return os.path.join(directory, entity)
+
+def _get_other_layout() -> str:
+    return FLAT_LAYOUT if config.FILE_LAYOUT == SHARDED_LAYOUT else SHARDED_LAYOUT
+
+def resolve_path(datacatalog: str, owner: str, entity: str) -> str:
+    """
+    Path of the stored file of an entity. While the file store is being migrated to a new
+    layout (see `services.filemigration`), the files not moved yet are found in the previous one.
+    """
+    file_path = get_storage_path(datacatalog, owner, entity)
+    if not os.path.exists(file_path):
+        previous_path = get_storage_path(datacatalog, owner, entity, _get_other_layout())
+        if os.path.exists(previous_path):
+            return previous_path
+    return file_path
+
+def validate_catalog(datacatalog_name: str, user: str) -> DataCatalogCreate:
+    """
+    Retrieve a file data catalog and check that the user can store files in it.
+
+    Args:
+        datacatalog_name (str): The name of the data catalog.
+        user (str): The user who is storing the file.
+
+    Returns:
+        DataCatalogCreate: The validated data catalog.
+
+    Raises:
+        exceptions.DataCatalogNotFound: If the specified data catalog does not exist.
+        exceptions.ODSPermissionException: If the user does not have permission to access the catalog.
+        exceptions.ODSException: If the data catalog type is not 'FILE'.
+    """
+    data_catalog = services.get_catalog(datacatalog_name)
+    if not data_catalog:
+        raise exceptions.DataCatalogNotFound()
+    if data_catalog.owner != user and not data_catalog.is_public:
+        raise exceptions.ODSPermissionException()
+    if data_catalog.type != TypeCatalog.FILE:
+        raise exceptions.ODSException("Data catalog type is not 'FILE'.")
+    return data_catalog
+
+def build_entity(file: BinaryIO, filename: str, data_catalog: DataCatalogCreate, entity_name: str, metadata: dict, user: str) -> dict:
+    """
+    Store a file on disk and build the Fiware entity that references it.
+    See `_build_entity` for the arguments.
+    """
+    entity, _, _, _ = _build_entity(file, filename, data_catalog, entity_name, metadata, user)
+    # The entity is sent to Orion later, until then downloads are resolved from Orion
+    service_fileindex.delete(data_catalog.id, user, entity_name)
+    return entity
+
+def _build_entity(file: BinaryIO, filename: str, data_catalog: DataCatalogCreate, entity_name: str, metadata: dict, user: str) -> Tuple[dict, str, str, str]:
+    """
+    Store a file on disk and build the Fiware entity that references it.
+
+    Args:
+        file (BinaryIO): The file object to be stored.
+        filename (str): The original name of the file.
+        data_catalog (DataCatalogCreate): The already validated data catalog.
+        entity_name (str): The name of the entity to be created/updated.
+        metadata (dict): Metadata associated with the entity.
+        user (str): The user who owns the file.
+
+    Returns:
+        Tuple[dict, str, str, str]: The Fiware entity, the path of the stored file, its SHA-256 hash
+        and the codec it is stored with.
+
+    Raises:
+        exceptions.ODSException: If any metadata key defined by the catalog is missing.
+    """
+    datacatalog_name = data_catalog.id
+    entity = FiwareEntity(
+        id=utils.get_entity_id(datacatalog_name, user, entity_name),
+        type=datacatalog_name,
+        tags=[],
+        entity_values=[]
+    )
+
+    for entry_attribute in data_catalog.entities_context:
+        if entry_attribute.context_key not in metadata:
+            raise exceptions.ODSException(f"Metadata key {entry_attribute.context_key} missing.")
+        entity.entity_values.append(FiwareProperty(
+            property_key=entry_attribute.context_key,
+            property_value=metadata[entry_attribute.context_key],
+            property_type=get_property_type(entry_attribute.context_type)
+        ))
+    try:
+        # Invalid metadata is rejected before saving the file
+        entity.to_fiware()
+    except ValueError as e:
+        raise exceptions.ODSException(str(e))
+
+    # Save the file to the specified location and add the path to the entity data
+    file_path = get_storage_path(datacatalog_name, user, entity_name)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    # Compressible files are compressed as they are written
+    codec = service_compression.get_codec(filename)
+    with open(file_path, 'wb+') as buffer, service_compression.writer(buffer, codec) as output:
+        _, sha256 = service_fileindex.copy_file(file, output)
+    # A previous version of the file not migrated to the current layout is replaced by this one
+    previous_path = get_storage_path(datacatalog_name, user, entity_name, _get_other_layout())
+    if os.path.exists(previous_path):
+        os.remove(previous_path)
+
+    entity.entity_values.append(FiwareProperty(
+        property_key=config.FIWARE_FILE_PROPERTY,
+        property_value=config.FIWARE_FILE_URL_FORMAT.format(config.HOSTMANE, datacatalog_name, user, entity_name)
+    ))
+    entity.entity_values.append(FiwareProperty(
+        property_key=config.FIWARE_FILENAME_PROPERTY,
+        property_value=filename
+    ))
+    entity.entity_values.append(FiwareProperty(
+        property_key=config.FIWARE_CODEC_PROPERTY,
+        property_value=codec
+    ))
+
+    return entity.to_fiware(), file_path, sha256, codec
 
 def insert_data(file: BinaryIO, filename: str, datacatalog_name: str, entity_name: str, metadata: dict, user: str) -> str:
     """
@@ -39,57 +185,27 @@ def insert_data(file: BinaryIO, filename: str, datacatalog_name: str, entity_nam
         exceptions.ODSException: For any other errors related to the operation.
     """
     try:
-        data_catalog = services.get_catalog(datacatalog_name)
+        data_catalog = validate_catalog(datacatalog_name, user)
         print(metadata)
-        if not data_catalog:
-            raise exceptions.DataCatalogNotFound()
-        if data_catalog.owner != user and not data_catalog.is_public:
-            raise exceptions.ODSPermissionException()
-        if data_catalog.type != TypeCatalog.FILE:
-            raise exceptions.ODSException("Data catalog type is not 'FILE'.")
-
-        entity = FiwareEntity(
-            id=utils.get_entity_id(datacatalog_name, user, entity_name),
-            type=datacatalog_name,
-            tags=[],
-            entity_values=[]
-        )
-
-        for entry_attribute in data_catalog.entities_context:
-            if entry_attribute.context_key not in metadata:
-                raise exceptions.ODSException(f"Metadata key {entry_attribute.context_key} missing.")
-            entity.entity_values.append(FiwareProperty(
-                property_key=entry_attribute.context_key,
-                property_value=metadata[entry_attribute.context_key]
-            ))
-
-        # Save the file to the specified location and add the path to the entity data
-        file_path = config.FIWARE_FILE_FORMAT.format(config.FIWARE_FILE_PATH, datacatalog_name, user)
-        if not os.path.exists(file_path):
-            os.makedirs(file_path)
-        with open(os.path.join(file_path, entity_name), 'wb+') as buffer:
-            shutil.copyfileobj(file, buffer)
-
-        entity.entity_values.append(FiwareProperty(
-            property_key=config.FIWARE_FILE_PROPERTY,
-            property_value=config.FIWARE_FILE_URL_FORMAT.format(config.HOSTMANE, datacatalog_name, user, entity_name)
-        ))
-        entity.entity_values.append(FiwareProperty(
-            property_key=config.FIWARE_FILENAME_PROPERTY,
-            property_value=filename
-        ))
+        entity, file_path, sha256, codec = _build_entity(file, filename, data_catalog, entity_name, metadata, user)
 
-        response = send_entity([entity.to_fiware()])
+        response = send_entity([entity])
         if not response.ok:
             raise exceptions.ODSException("Failed to send entity to Fiware.")
+        service_fileindex.put(data_catalog.id, user, entity_name, file_path, filename, sha256, codec)
+        service_changes.mark_changed(data_catalog.id)
+        metrics.count_ingested(data_catalog.type, "sync")
 
-        return entity.id
+        return entity["id"]
     except Exception as e:
         raise exceptions.ODSException(f"Error inserting data: {str(e)}")
 
-def get_file_path(datacatalog: str, owner: str, entity: str) -> Tuple[str, str]:
+def get_file_path(datacatalog: str, owner: str, entity: str) -> Tuple[str, str, Optional[str]]:
     """
-    Retrieve the file path and original filename for a specified entity.
+    Retrieve the file path, original filename and storage codec for a specified entity. The entity is
+    checked in Orion, so the files of deleted entities are not served (and their record is removed from
+    the local file index). The file details are read from the index, and only taken from the entity (and
+    then indexed) for files not indexed yet.
 
     Args:
         datacatalog (str): The name of the data catalog.
@@ -97,17 +213,54 @@ def get_file_path(datacatalog: str, owner: str, entity: str) -> Tuple[str, str]:
         entity (str): The name of the entity.
 
     Returns:
-        Tuple[str, str]: A tuple containing the file path and the original filename.
+        Tuple[str, str, Optional[str]]: A tuple containing the file path, the original filename and
+        the codec the file is stored with (None for the files stored before they were compressed).
 
     Raises:
         exceptions.ODSException: If the file path cannot be retrieved.
     """
     try:
+        record = service_fileindex.get(datacatalog, owner, entity)
         response = get_specific_entity(utils.get_entity_id(datacatalog, owner, entity))
+        if not response and record:
+            service_fileindex.delete(datacatalog, owner, entity)
+        if response and record and os.path.exists(record.path):
+            return record.path, record.filename, record.codec
         if response:
-            file_path = config.FIWARE_FILE_FORMAT.format(config.FIWARE_FILE_PATH, datacatalog, owner) + entity
-            return file_path, response.json()[config.FIWARE_FILENAME_PROPERTY]["value"]
+            file_path = resolve_path(datacatalog, owner, entity)
+            filename = response.json()[config.FIWARE_FILENAME_PROPERTY]["value"]
+            codec = response.json().get(config.FIWARE_CODEC_PROPERTY, {}).get("value")
+            if os.path.exists(file_path):
+                service_fileindex.put(datacatalog, owner, entity, file_path, filename, codec=codec)
+            return file_path, filename, codec
         else:
             raise exceptions.ODSException("Entity not found in Fiware.")
     except Exception as e:
         raise exceptions.ODSException(f"Error retrieving file path: {str(e)}")
+
+def iter_files(datacatalog: str, entities: List[str]) -> Iterator[List[Tuple[str, str, str, Optional[str]]]]:
+    """
+    List the stored files of a data catalog, page by page. The metadata of each page is
+    retrieved from Orion in a single request.
+
+    Args:
+        datacatalog (str): The ID of the data catalog.
+        entities (List[str]): The names (or regex patterns) of the entities, all of them if empty.
+
+    Yields:
+        List[Tuple[str, str, str, Optional[str]]]: The path of each entity file, its `owner/entity` name,
+        its original filename and its storage codec.
+    """
+    pages = iter_entity_pages(
+        datacatalog, fields=[config.FIWARE_FILENAME_PROPERTY, config.FIWARE_CODEC_PROPERTY], id_pattern=utils.get_entity_id_pattern(datacatalog, entities)
+    )
+    for page in pages:
+        files = []
+        for entity in page:
+            owner, _, entity_name = utils.get_id_from_fiware_id(entity["id"]).partition(":")
+            file_path = resolve_path(datacatalog, owner, entity_name)
+            files.append((
+                file_path, f"{owner}/{entity_name}",
+                entity.get(config.FIWARE_FILENAME_PROPERTY) or entity_name, entity.get(config.FIWARE_CODEC_PROPERTY)
+            ))
+        yield files
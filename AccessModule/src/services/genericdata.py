@@ -8,15 +8,82 @@ retrieving data based on queries. It includes functions to validate user permiss
 ensure the data catalog type is appropriate, and interact with the Fiware repository.
 """
 
-from typing import Optional, Any, Dict
+from typing import Optional, Any, Dict, List, Iterator
 from schemas import (TypeCatalog, GeneralEntityRequest, 
                      FiwareEntity, FiwareProperty, QueryRequest, 
-                     DataCatalogCreate, OutputFormat)
-from repository.fiware import send_entity, query_entity, get_entity, get_datacatalog
+                     DataCatalogCreate, OutputFormat, get_property_type)
+from repository.fiware import send_entity, query_entity, get_entity, get_datacatalog, iter_entity_pages, get_entities_query, count_entities
 import utils 
+import config
+import metrics
 import services.datacatalog as services
+import services.changes as service_changes
+import services.tabledata as service_tabledata
+import services.pagination as service_pagination
+import services.geoindex as service_geoindex
 import exceptions
 
+def validate_catalog(datacatalog_id: str, user: str) -> DataCatalogCreate:
+    """
+    Retrieve a generic data catalog and check that the user can insert data into it.
+
+    Args:
+        datacatalog_id (str): The ID of the data catalog.
+        user (str): The user who is inserting the data.
+
+    Returns:
+        DataCatalogCreate: The validated data catalog.
+
+    Raises:
+        exceptions.DataCatalogNotFound: If the specified data catalog does not exist.
+        exceptions.ODSPermissionException: If the user does not have permission to access the catalog.
+        exceptions.ODSException: If the data catalog type is not 'GENERIC'.
+    """
+    data_catalog = services.get_catalog(datacatalog_id)
+    if not data_catalog:
+        raise exceptions.DataCatalogNotFound(f"Data catalog {datacatalog_id} not found.")
+    if data_catalog.owner != user and not data_catalog.is_public:
+        raise exceptions.ODSPermissionException(f"User {user} does not have permission to access this catalog.")
+    if data_catalog.type != TypeCatalog.GENERIC:
+        raise exceptions.ODSException(f"Data catalog type is not 'GENERIC'. Found {data_catalog.type}.")
+    return data_catalog
+
+def build_entity(data_catalog: DataCatalogCreate, entry: GeneralEntityRequest, user: str) -> Dict[str, Any]:
+    """
+    Build the Fiware payload of a general entity for an already validated data catalog.
+
+    Args:
+        data_catalog (DataCatalogCreate): The data catalog the entity belongs to.
+        entry (GeneralEntityRequest): The general entity request containing the data to be inserted.
+        user (str): The user who owns the entity.
+
+    Returns:
+        Dict[str, Any]: The Fiware entity.
+
+    Raises:
+        exceptions.ODSException: If any attribute of the catalog is missing in the entry.
+    """
+    entity = FiwareEntity(
+        id=utils.get_entity_id(entry.datacatalog_id, user, entry.id),
+        type=entry.datacatalog_id,
+        tags=entry.tags,
+        entity_values=[]
+    )
+
+    for entry_attribute in data_catalog.entities_context:
+        if entry_attribute.context_key not in entry.model_dump_json():
+            raise exceptions.ODSException(f"Missing attribute {entry_attribute.context_key} in entry data.")
+        entity.entity_values.append(FiwareProperty(
+            property_key=entry_attribute.context_key,
+            property_value=getattr(entry, entry_attribute.context_key),
+            property_type=get_property_type(entry_attribute.context_type)
+        ))
+
+    try:
+        return entity.to_fiware()
+    except ValueError as e:
+        raise exceptions.ODSException(str(e))
+
 def insert_data(entry: GeneralEntityRequest, user: str) -> str:
     """
     Insert data into a Fiware entity within a specified data catalog.
@@ -34,59 +101,83 @@ def insert_data(entry: GeneralEntityRequest, user: str) -> str:
         exceptions.ODSException: For any other errors related to the operation.
     """
     try:
-        data_catalog = services.get_catalog(entry.datacatalog_id)
-        if not data_catalog:
-            raise exceptions.DataCatalogNotFound(f"Data catalog {entry.datacatalog_id} not found.")
-        if data_catalog.owner != user and not data_catalog.is_public:
-            raise exceptions.ODSPermissionException(f"User {user} does not have permission to access this catalog.")
-        if data_catalog.type != TypeCatalog.GENERIC:
-            raise exceptions.ODSException(f"Data catalog type is not 'GENERIC'. Found {data_catalog.type}.")
-
-        entity = FiwareEntity(
-            id=utils.get_entity_id(entry.datacatalog_id, user, entry.id),
-            type=entry.datacatalog_id,
-            tags=entry.tags,
-            entity_values=[]
-        )
-
-        for entry_attribute in data_catalog.entities_context:
-            if entry_attribute.context_key not in entry.model_dump_json():
-                raise exceptions.ODSException(f"Missing attribute {entry_attribute.context_key} in entry data.")
-            entity.entity_values.append(FiwareProperty(
-                property_key=entry_attribute.context_key,
-                property_value=getattr(entry, entry_attribute.context_key)
-            ))
+        data_catalog = validate_catalog(entry.datacatalog_id, user)
+        entity = build_entity(data_catalog, entry, user)
 
-        response = send_entity([entity.to_fiware()])
+        response = send_entity([entity])
         if not response.ok:
             raise exceptions.ODSException("Failed to send entity to Fiware.")
+        service_changes.mark_changed(data_catalog.id)
+        metrics.count_ingested(data_catalog.type, "sync")
 
-        return entity.id
+        return entity["id"]
     except Exception as e:
         raise exceptions.ODSException(f"Error inserting data: {str(e)}")
 
-def get_data(query: QueryRequest, datacatalog: DataCatalogCreate) -> Optional[Dict[str, Any]]:
+def _to_result(entity: Dict[str, Any], query: QueryRequest, datacatalog: DataCatalogCreate) -> Dict[str, Any]:
+    entity["id"] = utils.get_id_from_fiware_id(entity["id"])
+    if query.context_per_entity():
+        for property in datacatalog.catalog_context:
+            entity[property.context_key] = property.context_value
+    entity["data_catalog"] = entity["type"]
+    entity.pop("type")
+    return entity
+
+def iter_data(query: QueryRequest, datacatalog: DataCatalogCreate) -> Iterator[List[Dict[str, Any]]]:
     """
-    Retrieve data from a Fiware entity based on a query request.
+    Retrieve the entities matching a query request page by page, as they are returned by Orion.
 
     Args:
         query (QueryRequest): The query request specifying the catalog ID, entities, and fields to retrieve.
+        datacatalog (DataCatalogCreate): The data catalog being queried.
 
-    Returns:
-        Optional[Dict[str, Any]]: The retrieved data in JSON format, or None if the query fails.
+    Yields:
+        List[Dict[str, Any]]: A page of entities in JSON format.
     """
     try:
-        response = get_entity(type_id=query.catalog_id, entities=query.entities, fields=query.fields)
-        response = response.json() if response else None
-        if response:
-            for entity in response:
-                entity["id"] = utils.get_id_from_fiware_id(entity["id"])
-                if query.include_context:
-                    for property in datacatalog.catalog_context:
-                        entity[property.context_key] = property.context_value
-                entity["data_catalog"] = entity["type"]
-                entity.pop("type")
-
-        return response if response else None
+        fields = query.fields
+        row_filter = query.row_filter if datacatalog.type == TypeCatalog.TABLE else None
+        if row_filter:
+            filter_columns = service_tabledata.get_filter_columns(row_filter, datacatalog)
+            if fields:
+                # The predicate columns are retrieved even if they are not requested
+                fields = list(dict.fromkeys(fields + filter_columns))
+        if query.geo_filter:
+            indexed = service_geoindex.search(query, datacatalog)
+            if indexed is not None:
+                for start in range(0, len(indexed), config.ORION_PAGE_SIZE):
+                    yield [_to_result(entity, query, datacatalog) for entity in indexed[start:start + config.ORION_PAGE_SIZE]]
+                return
+        pages = iter_entity_pages(
+            query.catalog_id, fields=fields, query=get_entities_query(query.entities),
+            offset=service_pagination.get_offset(query), limit=query.limit,
+            geo_query=service_geoindex.get_geo_query(query, datacatalog)
+        )
+        for page in pages:
+            if row_filter:
+                page = [service_tabledata.filter_rows(entity, row_filter, datacatalog, query.fields) for entity in page]
+            yield [_to_result(entity, query, datacatalog) for entity in page]
     except Exception as e:
         raise exceptions.ODSException(f"Error retrieving data: {str(e)}")
+
+def count_data(query: QueryRequest, datacatalog: DataCatalogCreate) -> int:
+    """
+    Count the entities matching a query request, regardless of its cursor and limit.
+    """
+    return count_entities(
+        query.catalog_id, fields=query.fields, query=get_entities_query(query.entities),
+        geo_query=service_geoindex.get_geo_query(query, datacatalog)
+    )
+
+def get_data(query: QueryRequest, datacatalog: DataCatalogCreate) -> Optional[List[Dict[str, Any]]]:
+    """
+    Retrieve data from a Fiware entity based on a query request.
+
+    Args:
+        query (QueryRequest): The query request specifying the catalog ID, entities, and fields to retrieve.
+
+    Returns:
+        Optional[List[Dict[str, Any]]]: The retrieved data in JSON format, or None if the query fails.
+    """
+    response = [entity for page in iter_data(query, datacatalog) for entity in page]
+    return response if response else None
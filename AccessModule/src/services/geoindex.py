@@ -0,0 +1,257 @@
+"""
+geoindex.py
+
+This module resolves the geo filters of the queries. The filters are pushed down to Orion as
+NGSI-LD geo-queries (`georel`, `geometry`, `coordinates` and `geoproperty`) over the COORDINATE
+attributes, which are stored as GeoProperties.
+
+Catalogs queried with geo filters are also indexed in memory, in a regular grid of
+`GEOINDEX_CELL_SIZE` degrees. Once the index of a catalog is built, viewport queries are served
+from it without querying Orion, until the data of the catalog changes. Only catalogs whose
+coordinates are all points, and with up to `GEOINDEX_MAX_ENTITIES` entities, are indexed. The
+catalogs that can't be indexed are remembered until they change, so they are not scanned again
+by every geo query.
+
+Dependencies:
+- Fiware repository: For retrieving the entities to index.
+- Changes service: For the change counter of the catalogs.
+"""
+
+import json
+import math
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import config
+import exceptions
+import utils
+import services.changes as service_changes
+from repository.fiware import iter_entity_pages
+from schemas import DataCatalogCreate, GeoFilter, QueryRequest, TypeAttribute, TypeCatalog
+
+_EARTH_RADIUS = 6371008.8
+
+_indexes: "OrderedDict[Tuple[str, str], GridIndex]" = OrderedDict()
+_building = set()
+# Version of the catalogs that could not be indexed (not only points, too many entities or a failure)
+_unindexable: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_geo_attribute(geo_filter: GeoFilter, datacatalog: DataCatalogCreate) -> str:
+    """
+    Resolve the attribute a geo filter applies to, the first COORDINATE attribute by default.
+
+    Raises:
+        exceptions.ODSException: If the catalog has no such COORDINATE attribute.
+    """
+    coordinates = [
+        attribute.context_key for attribute in datacatalog.entities_context
+        if attribute.context_type == TypeAttribute.COORDINATE
+    ]
+    if geo_filter.attribute in coordinates or (not geo_filter.attribute and coordinates):
+        return geo_filter.attribute or coordinates[0]
+    raise exceptions.ODSException(config.Q400_NO_COORDINATE.format(datacatalog.id, geo_filter.attribute or ""))
+
+
+def check_geo_filter(geo_filter: GeoFilter):
+    """
+    Check the coordinates of a geo filter.
+
+    Raises:
+        exceptions.ODSException: If a coordinate is out of range, or the bbox is inverted.
+    """
+    try:
+        if geo_filter.bbox:
+            min_lon, min_lat, max_lon, max_lat = geo_filter.bbox
+            utils.check_position([min_lon, min_lat])
+            utils.check_position([max_lon, max_lat])
+        else:
+            utils.check_position(geo_filter.near.point)
+    except ValueError as ex:
+        raise exceptions.ODSException(config.Q400_INVALID_COORDINATES.format(ex))
+    if geo_filter.bbox and (min_lon > max_lon or min_lat > max_lat):
+        raise exceptions.ODSException(config.Q400_INVALID_BBOX.format(geo_filter.bbox))
+
+
+def get_geo_query(query: QueryRequest, datacatalog: DataCatalogCreate) -> Optional[Dict[str, str]]:
+    """
+    Build the NGSI-LD geo-query parameters of the geo filter of a query.
+
+    Returns:
+        Optional[Dict[str, str]]: The Orion query parameters, or None if the query has no geo filter.
+
+    Raises:
+        exceptions.ODSException: If the geo filter is not valid for the catalog.
+    """
+    geo_filter = query.geo_filter
+    if not geo_filter:
+        return None
+    check_geo_filter(geo_filter)
+    if geo_filter.bbox:
+        min_lon, min_lat, max_lon, max_lat = geo_filter.bbox
+        geometry = "Polygon"
+        georel = "within"
+        coordinates = [[[min_lon, min_lat], [max_lon, min_lat], [max_lon, max_lat], [min_lon, max_lat], [min_lon, min_lat]]]
+    else:
+        geometry = "Point"
+        georel = f"near;maxDistance=={geo_filter.near.max_distance:g}"
+        coordinates = geo_filter.near.point
+    return {
+        "georel": georel,
+        "geometry": geometry,
+        "coordinates": json.dumps(coordinates, separators=(",", ":")),
+        "geoproperty": get_geo_attribute(geo_filter, datacatalog),
+    }
+
+
+def _distance(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+    # Haversine distance in meters
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi, dlambda = phi2 - phi1, math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * _EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+class GridIndex:
+    """Regular grid of the point coordinates of the entities of a catalog."""
+
+    def __init__(self, version: int, cell_size: float):
+        self.version = version
+        self.cell_size = cell_size
+        self.entities: List[Dict[str, Any]] = []
+        self._points: List[Tuple[float, float]] = []
+        self._cells: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+
+    def _cell(self, lon: float, lat: float) -> Tuple[int, int]:
+        return math.floor(lon / self.cell_size), math.floor(lat / self.cell_size)
+
+    def add(self, entity: Dict[str, Any], lon: float, lat: float):
+        self._cells[self._cell(lon, lat)].append(len(self.entities))
+        self.entities.append(entity)
+        self._points.append((lon, lat))
+
+    def _candidates(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> List[int]:
+        min_x, min_y = self._cell(min_lon, min_lat)
+        max_x, max_y = self._cell(max_lon, max_lat)
+        if (max_x - min_x + 1) * (max_y - min_y + 1) > len(self._cells):
+            # The box covers more cells than the occupied ones, look only at these
+            positions = [position for (x, y), cell in self._cells.items()
+                         if min_x <= x <= max_x and min_y <= y <= max_y for position in cell]
+        else:
+            positions = [position for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)
+                         for position in self._cells.get((x, y), [])]
+        # Keep the order of Orion, as the pushed down query would
+        return sorted(positions)
+
+    def search_bbox(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> Iterator[Dict[str, Any]]:
+        for position in self._candidates(min_lon, min_lat, max_lon, max_lat):
+            lon, lat = self._points[position]
+            if min_lon <= lon <= max_lon and min_lat <= lat <= max_lat:
+                yield self.entities[position]
+
+    def search_near(self, lon: float, lat: float, max_distance: float) -> Iterator[Dict[str, Any]]:
+        delta_lat = math.degrees(max_distance / _EARTH_RADIUS)
+        delta_lon = delta_lat / max(math.cos(math.radians(lat)), 1e-6)
+        for position in self._candidates(lon - delta_lon, lat - delta_lat, lon + delta_lon, lat + delta_lat):
+            if _distance(lon, lat, *self._points[position]) <= max_distance:
+                yield self.entities[position]
+
+
+def _remember_unindexable(key: Tuple[str, str], version: int):
+    with _lock:
+        _unindexable[key] = version
+        _unindexable.move_to_end(key)
+        while len(_unindexable) > config.GEOINDEX_MAX_UNINDEXABLE:
+            _unindexable.popitem(last=False)
+
+
+def _build_index(catalog_id: str, attribute: str):
+    key = (catalog_id, attribute)
+    version = None
+    try:
+        version, _ = service_changes.get_version(catalog_id)
+        index = GridIndex(version, config.GEOINDEX_CELL_SIZE)
+        for page in iter_entity_pages(catalog_id):
+            for entity in page:
+                geometry = entity.get(attribute)
+                if not isinstance(geometry, dict) or geometry.get("type") != "Point":
+                    # Only points are indexed, other geometries are always queried in Orion
+                    _remember_unindexable(key, version)
+                    return
+                lon, lat = geometry["coordinates"][:2]
+                index.add(entity, lon, lat)
+            if len(index.entities) > config.GEOINDEX_MAX_ENTITIES:
+                _remember_unindexable(key, version)
+                return
+        with _lock:
+            _indexes[key] = index
+            _indexes.move_to_end(key)
+            while len(_indexes) > config.GEOINDEX_MAX_CATALOGS:
+                _indexes.popitem(last=False)
+    except Exception as ex:
+        print(f"Spatial index of {catalog_id} failed: {ex}")
+        if version is not None:
+            _remember_unindexable(key, version)
+    finally:
+        with _lock:
+            _building.discard(key)
+
+
+def _get_index(catalog_id: str, attribute: str) -> Optional[GridIndex]:
+    version, _ = service_changes.get_version(catalog_id)
+    key = (catalog_id, attribute)
+    with _lock:
+        index = _indexes.get(key)
+        if index and index.version == version:
+            _indexes.move_to_end(key)
+            return index
+        _indexes.pop(key, None)
+        # Not indexed again until the catalog changes
+        if key in _building or _unindexable.get(key) == version:
+            return None
+        _unindexable.pop(key, None)
+        _building.add(key)
+    threading.Thread(target=_build_index, args=key, name="geoindex-builder", daemon=True).start()
+    return None
+
+
+def _invalidate(catalog_id: str):
+    with _lock:
+        for key in [key for key in _indexes if key[0] == catalog_id]:
+            del _indexes[key]
+        for key in [key for key in _unindexable if key[0] == catalog_id]:
+            del _unindexable[key]
+
+
+service_changes.add_listener(_invalidate)
+
+
+def search(query: QueryRequest, datacatalog: DataCatalogCreate) -> Optional[List[Dict[str, Any]]]:
+    """
+    Resolve the geo filter of a query from the spatial index of its catalog. The index is only
+    used for whole catalog queries (no entity patterns, row filter or pagination), otherwise the
+    results are retrieved from Orion. A missing index is built in the background.
+
+    Returns:
+        Optional[List[Dict[str, Any]]]: The matching entities, as returned by Orion, or None
+        if the query can't be served from the index.
+    """
+    if (datacatalog.type in [TypeCatalog.TIMESERIES, TypeCatalog.TABLE] or query.entities
+            or query.row_filter or query.limit or query.cursor):
+        return None
+    check_geo_filter(query.geo_filter)
+    attribute = get_geo_attribute(query.geo_filter, datacatalog)
+    index = _get_index(datacatalog.id, attribute)
+    if index is None:
+        return None
+    if query.geo_filter.bbox:
+        entities = index.search_bbox(*query.geo_filter.bbox)
+    else:
+        entities = index.search_near(*query.geo_filter.near.point, query.geo_filter.near.max_distance)
+    # The indexed entities are shared, so the results are copies
+    return [
+        {key: value for key, value in entity.items() if not query.fields or key in ("id", "type") or key in query.fields}
+        for entity in entities
+    ]
@@ -0,0 +1,386 @@
+"""
+ingestion.py
+
+This module provides the asynchronous (write-behind) ingestion mode of the insert endpoints.
+Validated entities are persisted to a local spool directory and the request returns at once
+with a job ID. A background worker, running in every server process, coalesces the queued
+jobs into large Orion batch upserts and keeps the job status up to date.
+
+Spool layout (shared by all the server processes):
+- jobs/{job_id}.json: Status of the job, readable from any process.
+- pending/{job_id}.json: Entities waiting to be sent to Orion.
+- processing/{job_id}.{pid}.json: Entities claimed by the worker of the process `pid`.
+
+Dependencies:
+- Fiware repository: For sending the batch upserts.
+- Schemas: For the ingestion job models.
+- Exceptions: For handling custom errors such as a missing job.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+import config
+import exceptions
+import utils
+import services.changes as service_changes
+from repository.fiware import send_entity
+from schemas import IngestionJob, IngestionItemError, JobStatus
+
+logger = logging.getLogger(__name__)
+
+_JOBS = "jobs"
+_PENDING = "pending"
+_PROCESSING = "processing"
+_JOB_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+_worker: Optional["IngestionWorker"] = None
+
+
+def _spool_path(*parts: str) -> str:
+    return os.path.join(config.INGESTION_SPOOL_PATH, *parts)
+
+
+def _write_json(path: str, content: Any):
+    # Write to a temporary file and rename it, so readers never see a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as buffer:
+        json.dump(content, buffer)
+        buffer.flush()
+        os.fsync(buffer.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str) -> Any:
+    with open(path) as buffer:
+        return json.load(buffer)
+
+
+def _save_job(job: IngestionJob):
+    job.updated_at = datetime.utcnow()
+    _write_json(_spool_path(_JOBS, f"{job.id}.json"), job.model_dump(mode="json"))
+
+
+def submit_job(datacatalog_id: str, owner: str, entities: List[Tuple[int, dict]], errors: List[IngestionItemError]) -> IngestionJob:
+    """
+    Persist a batch of validated entities to the spool and create its ingestion job.
+
+    Args:
+        datacatalog_id (str): The ID of the data catalog the entities belong to.
+        owner (str): The user submitting the batch.
+        entities (List[Tuple[int, dict]]): The position of each item in the request and its Fiware entity.
+        errors (List[IngestionItemError]): The items rejected during the validation.
+
+    Returns:
+        IngestionJob: The created job.
+    """
+    for folder in (_JOBS, _PENDING, _PROCESSING):
+        os.makedirs(_spool_path(folder), exist_ok=True)
+
+    now = datetime.utcnow()
+    job = IngestionJob(
+        id=uuid.uuid4().hex,
+        datacatalog_id=datacatalog_id,
+        owner=owner,
+        total=len(entities) + len(errors),
+        processed=len(errors),
+        errors=errors,
+        created_at=now,
+        updated_at=now
+    )
+    if not entities:
+        job.status = _get_final_status(job)
+        _save_job(job)
+        return job
+
+    # The job must exist before any worker can claim its entities
+    _save_job(job)
+    _write_json(_spool_path(_PENDING, f"{job.id}.json"), {
+        "errors": [error.model_dump() for error in errors],
+        "items": [
+            {"index": index, "size": len(json.dumps(entity)), "entity": entity}
+            for index, entity in entities
+        ]
+    })
+    if _worker:
+        _worker.wake()
+    return job
+
+
+def get_job(job_id: str) -> IngestionJob:
+    """
+    Retrieve the status of an ingestion job.
+
+    Args:
+        job_id (str): The job ID returned when the batch was submitted.
+
+    Returns:
+        IngestionJob: The current status of the job.
+
+    Raises:
+        exceptions.JobNotFound: If the job does not exist or has expired.
+    """
+    if not _JOB_ID_PATTERN.fullmatch(job_id):
+        raise exceptions.JobNotFound(config.I404_JOB_NOT_FOUND.format(job_id))
+    try:
+        return IngestionJob(**_read_json(_spool_path(_JOBS, f"{job_id}.json")))
+    except FileNotFoundError:
+        raise exceptions.JobNotFound(config.I404_JOB_NOT_FOUND.format(job_id))
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _recover_orphans():
+    """Move back to pending the jobs claimed by processes that are not running anymore."""
+    for entry in os.scandir(_spool_path(_PROCESSING)):
+        parts = entry.name.split(".")
+        if len(parts) != 3 or not parts[1].isdigit():
+            continue
+        pid = int(parts[1])
+        if pid == os.getpid() or not _pid_alive(pid):
+            try:
+                os.rename(entry.path, _spool_path(_PENDING, f"{parts[0]}.json"))
+            except FileNotFoundError:
+                continue
+
+
+def _pending_jobs() -> List[str]:
+    pending = []
+    for entry in os.scandir(_spool_path(_PENDING)):
+        if not entry.name.endswith(".json"):
+            continue
+        try:
+            pending.append((entry.stat().st_mtime_ns, entry.name[:-len(".json")]))
+        except FileNotFoundError:
+            continue
+    return [job_id for _, job_id in sorted(pending)]
+
+
+def _claim_batch() -> List[Tuple[str, str, dict]]:
+    """
+    Claim the oldest pending jobs until there are enough entities for a full batch.
+    The rename is atomic, so each job is claimed by a single process.
+    """
+    claimed = []
+    total = 0
+    for job_id in _pending_jobs():
+        processing_path = _spool_path(_PROCESSING, f"{job_id}.{os.getpid()}.json")
+        try:
+            os.rename(_spool_path(_PENDING, f"{job_id}.json"), processing_path)
+        except FileNotFoundError:
+            # Claimed by another process
+            continue
+        payload = _read_json(processing_path)
+        claimed.append((job_id, processing_path, payload))
+        total += len(payload["items"])
+        if total >= config.INGESTION_BATCH_SIZE or len(claimed) >= config.INGESTION_MAX_JOBS_PER_BATCH:
+            break
+    return claimed
+
+
+def _release(claimed: List[Tuple[str, str, dict]]):
+    for job_id, processing_path, _ in claimed:
+        try:
+            os.rename(processing_path, _spool_path(_PENDING, f"{job_id}.json"))
+        except FileNotFoundError:
+            continue
+
+
+def _coalesce(claimed: List[Tuple[str, str, dict]]) -> List[List[Tuple[str, dict]]]:
+    """
+    Merge the items of all the claimed jobs into batches. An entity can only appear once
+    per batch, otherwise the upsert would drop all but the last value (e.g. time series
+    observations of the same entity).
+    """
+    batches: List[List[Tuple[str, dict]]] = []
+    batch: List[Tuple[str, dict]] = []
+    batch_ids = set()
+    batch_size = 0
+    for job_id, _, payload in claimed:
+        for item in payload["items"]:
+            entity_id = item["entity"]["id"]
+            if batch and (len(batch) >= config.INGESTION_BATCH_SIZE
+                          or batch_size + item["size"] > config.INGESTION_BATCH_MAX_BYTES
+                          or entity_id in batch_ids):
+                batches.append(batch)
+                batch, batch_ids, batch_size = [], set(), 0
+            batch.append((job_id, item))
+            batch_ids.add(entity_id)
+            batch_size += item["size"]
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _send_batch(batch: List[Tuple[str, dict]]) -> Dict[str, str]:
+    """Send a batch upsert to Orion and return the error of each failed entity."""
+    entities = [item["entity"] for _, item in batch]
+    response = send_entity(entities)
+    if response is None:
+        return {entity["id"]: config.I502_BATCH_REJECTED for entity in entities}
+    if response.status_code == 207:
+        # Multi-status: some of the entities could not be upserted
+        failures = {}
+        for error in response.json().get("errors", []):
+            detail = error.get("error", {})
+            failures[error.get("entityId")] = detail.get("detail") or detail.get("title") or config.I502_BATCH_REJECTED
+        return failures
+    return {}
+
+
+def _process_batch(claimed: List[Tuple[str, str, dict]]):
+    jobs: Dict[str, IngestionJob] = {}
+    for job_id, processing_path, payload in list(claimed):
+        try:
+            job = get_job(job_id)
+        except exceptions.JobNotFound:
+            # The job has expired, its entities are discarded
+            os.remove(processing_path)
+            claimed.remove((job_id, processing_path, payload))
+            continue
+        # Reset the progress, the job could have been interrupted and requeued
+        job.status = JobStatus.PROCESSING
+        job.errors = [IngestionItemError(**error) for error in payload["errors"]]
+        job.processed = len(job.errors)
+        job.success = 0
+        _save_job(job)
+        jobs[job_id] = job
+
+    for batch in _coalesce(claimed):
+        failures = _send_batch(batch)
+        for job_id, item in batch:
+            job = jobs[job_id]
+            job.processed += 1
+            entity_id = item["entity"]["id"]
+            if entity_id in failures:
+                job.errors.append(IngestionItemError(
+                    index=item["index"],
+                    entity_id=utils.get_id_from_fiware_id(entity_id),
+                    detail=failures[entity_id]
+                ))
+            else:
+                job.success += 1
+        for job_id in {job_id for job_id, _ in batch}:
+            _save_job(jobs[job_id])
+        for datacatalog_id in {jobs[job_id].datacatalog_id for job_id, _ in batch}:
+            service_changes.mark_changed(datacatalog_id)
+
+    for job_id, processing_path, _ in claimed:
+        job = jobs[job_id]
+        job.status = _get_final_status(job)
+        _save_job(job)
+        os.remove(processing_path)
+
+
+def _get_final_status(job: IngestionJob) -> JobStatus:
+    # A job is only completed if every entity was stored
+    if not job.errors:
+        return JobStatus.COMPLETED
+    return JobStatus.PARTIAL if job.success > 0 else JobStatus.FAILED
+
+
+def _fail_batch(claimed: List[Tuple[str, str, dict]], detail: str):
+    for job_id, processing_path, payload in claimed:
+        try:
+            job = get_job(job_id)
+            job.status = JobStatus.FAILED
+            job.processed = job.total
+            job.errors = [IngestionItemError(**error) for error in payload["errors"]] + [
+                IngestionItemError(index=item["index"], entity_id=utils.get_id_from_fiware_id(item["entity"]["id"]), detail=detail)
+                for item in payload["items"]
+            ]
+            _save_job(job)
+        except exceptions.JobNotFound:
+            pass
+        if os.path.exists(processing_path):
+            os.remove(processing_path)
+
+
+def _get_job_ids(claimed: List[Tuple[str, str, dict]]) -> str:
+    return ", ".join(sorted({job_id for job_id, _, _ in claimed}))
+
+
+def _purge_expired_jobs():
+    expiration = time.time() - config.INGESTION_JOB_RETENTION
+    for entry in os.scandir(_spool_path(_JOBS)):
+        try:
+            if entry.stat().st_mtime < expiration and not os.path.exists(_spool_path(_PENDING, entry.name)):
+                os.remove(entry.path)
+        except FileNotFoundError:
+            continue
+
+
+class IngestionWorker(threading.Thread):
+    """
+    Background thread that sends the spooled entities to Orion. Every server process runs
+    one worker, and they share the pending jobs through the spool directory.
+    """
+
+    def __init__(self):
+        super().__init__(name="ingestion-worker", daemon=True)
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._last_purge = 0.0
+
+    def wake(self):
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def run(self):
+        _recover_orphans()
+        while not self._stopped.is_set():
+            claimed = _claim_batch()
+            if claimed:
+                try:
+                    _process_batch(claimed)
+                except requests.RequestException as ex:
+                    # Orion is not reachable: keep the jobs and try again later
+                    logger.warning("Ingestion batch of jobs %s requeued: %s", _get_job_ids(claimed), ex)
+                    _release(claimed)
+                    self._stopped.wait(config.INGESTION_RETRY_INTERVAL)
+                except Exception as ex:
+                    logger.exception("Ingestion batch of jobs %s failed", _get_job_ids(claimed))
+                    _fail_batch(claimed, str(ex))
+                continue
+
+            if time.time() - self._last_purge > 3600:
+                _purge_expired_jobs()
+                self._last_purge = time.time()
+            self._wakeup.wait(config.INGESTION_POLL_INTERVAL)
+            self._wakeup.clear()
+
+
+def start_worker():
+    global _worker
+    for folder in (_JOBS, _PENDING, _PROCESSING):
+        os.makedirs(_spool_path(folder), exist_ok=True)
+    _worker = IngestionWorker()
+    _worker.start()
+
+
+def stop_worker():
+    global _worker
+    if _worker:
+        _worker.stop()
+        _worker.join(timeout=config.INGESTION_RETRY_INTERVAL)
+        _worker = None
@@ -0,0 +1,320 @@
+"""
+notifications.py
+
+This module fans out the Orion notifications to the subscribers of the AccessModule. Instead of
+creating one Orion subscription per user, Orion holds a single internal subscription per catalog
+(and one for the catalog list), which notifies the AccessModule `/subscription/notify` endpoint.
+Each notification is matched against the registered subscribers and queued for each of them.
+
+The subscribers are registered in an SQLite database shared by all the server processes. The
+notifications are delivered by a hub running in every server process (the one that received the
+notification delivers it), with a queue per subscriber:
+
+- Batching: the entities queued for a subscriber are sent together, up to `NOTIFY_BATCH_SIZE`
+  per notification.
+- Throttling: a subscriber receives at most one notification every `NOTIFY_MIN_INTERVAL` seconds,
+  and only one at a time, so a slow callback does not delay the others.
+- Retry: failed deliveries are retried with an exponential backoff, and dropped after
+  `NOTIFY_MAX_RETRIES` retries. A full queue drops its oldest entities.
+
+Dependencies:
+- Utils: For matching the entity patterns of the subscriptions.
+"""
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional
+
+import requests
+from pydantic import BaseModel
+
+import config
+import utils
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscribers (
+    id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    catalog_id TEXT NOT NULL,
+    callback_url TEXT NOT NULL,
+    entities TEXT,
+    owners TEXT,
+    tags TEXT,
+    types TEXT,
+    created_at REAL NOT NULL
+)
+"""
+
+_local = threading.local()
+_hub: Optional["NotificationHub"] = None
+
+
+class Subscriber(BaseModel):
+    id: str
+    owner: str
+    catalog_id: str
+    callback_url: str
+    entities: Optional[List[str]] = None
+    owners: Optional[List[str]] = None
+    tags: Optional[List[str]] = None
+    types: Optional[List[str]] = None
+
+
+def _connection() -> sqlite3.Connection:
+    # SQLite connections can't be shared between threads, each thread opens its own
+    connection = getattr(_local, "connection", None)
+    if connection is None:
+        os.makedirs(os.path.dirname(os.path.abspath(config.NOTIFY_SUBSCRIBERS_PATH)), exist_ok=True)
+        connection = sqlite3.connect(config.NOTIFY_SUBSCRIBERS_PATH, timeout=30, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(_SCHEMA)
+        connection.execute("CREATE INDEX IF NOT EXISTS subscribers_catalog ON subscribers (catalog_id)")
+        _local.connection = connection
+    return connection
+
+
+def _session() -> requests.Session:
+    # One session per delivery thread, so the connections to the callbacks are reused
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
+
+def register(subscriber: Subscriber) -> Subscriber:
+    """
+    Register a subscriber, replacing the previous registration with the same ID.
+
+    Args:
+        subscriber (Subscriber): The subscriber and its filters. Its catalog is `CATALOG_ENTITY`
+            for the subscriptions to the catalog list.
+
+    Returns:
+        Subscriber: The registered subscriber.
+    """
+    _connection().execute(
+        "INSERT OR REPLACE INTO subscribers (id, owner, catalog_id, callback_url, entities, owners, tags, types, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (subscriber.id, subscriber.owner, subscriber.catalog_id, subscriber.callback_url,
+         json.dumps(subscriber.entities), json.dumps(subscriber.owners), json.dumps(subscriber.tags),
+         json.dumps(subscriber.types), time.time())
+    )
+    return subscriber
+
+
+def get_subscribers(catalog_id: str) -> List[Subscriber]:
+    """Registered subscribers of a catalog (`CATALOG_ENTITY` for the catalog list)."""
+    rows = _connection().execute(
+        "SELECT id, owner, catalog_id, callback_url, entities, owners, tags, types FROM subscribers WHERE catalog_id = ?",
+        (catalog_id,)
+    ).fetchall()
+    return [
+        Subscriber(id=id, owner=owner, catalog_id=catalog_id, callback_url=callback_url, entities=json.loads(entities),
+                   owners=json.loads(owners), tags=json.loads(tags), types=json.loads(types))
+        for id, owner, catalog_id, callback_url, entities, owners, tags, types in rows
+    ]
+
+
+def get_notified_catalog(entity: Dict[str, Any]) -> Optional[str]:
+    """Catalog of a notified entity, `CATALOG_ENTITY` for the catalogs themselves."""
+    data_catalog = entity.get("data_catalog")
+    if isinstance(data_catalog, dict) and data_catalog.get("object"):
+        return utils.get_id_from_fiware_id(data_catalog["object"])
+    return entity.get("type")
+
+
+def _matches(subscriber: Subscriber, entity: Dict[str, Any], pattern: Optional[re.Pattern]) -> bool:
+    if pattern and not pattern.match(entity.get("id", "")):
+        return False
+    if subscriber.catalog_id == config.CATALOG_ENTITY:
+        owner = utils.get_id_from_fiware_id(entity.get("id", "")).partition(":")[0]
+        # Private catalogs are only notified to their owner
+        if owner != subscriber.owner and utils._get_value(entity.get("public")) is not True:
+            return False
+        catalog_type = utils._get_value(entity.get("catalog_type"))
+        if subscriber.types and catalog_type not in subscriber.types:
+            return False
+    else:
+        # Entity IDs are {prefix}:{catalog_id}:{owner}:{entity}
+        prefix = f"{config.ORION_ENTITY_PREFIX}:{subscriber.catalog_id}:"
+        owner = entity.get("id", "")[len(prefix):].partition(":")[0]
+    if subscriber.owners and owner not in subscriber.owners:
+        return False
+    if subscriber.tags:
+        tags = utils._get_value(entity.get("tags")) or []
+        if not set(subscriber.tags).intersection(tags if isinstance(tags, list) else [tags]):
+            return False
+    return True
+
+
+def dispatch(notification: Dict[str, Any]) -> int:
+    """
+    Queue the entities of an Orion notification for every subscriber they match.
+
+    Args:
+        notification (Dict[str, Any]): The NGSI-LD notification sent by Orion.
+
+    Returns:
+        int: The number of subscribers the notification was queued for.
+    """
+    if not _hub:
+        return 0
+    by_catalog: Dict[str, List[Dict[str, Any]]] = {}
+    for entity in notification.get("data", []):
+        catalog_id = get_notified_catalog(entity)
+        if catalog_id:
+            by_catalog.setdefault(catalog_id, []).append(entity)
+
+    queued = 0
+    for catalog_id, entities in by_catalog.items():
+        for subscriber in get_subscribers(catalog_id):
+            pattern = None
+            if subscriber.entities and catalog_id != config.CATALOG_ENTITY:
+                pattern = re.compile(utils.get_entity_id_pattern(catalog_id, subscriber.entities))
+            matched = [entity for entity in entities if _matches(subscriber, entity, pattern)]
+            if matched:
+                _hub.enqueue(subscriber, matched)
+                queued += 1
+    return queued
+
+
+class _SubscriberQueue:
+    """Entities waiting to be delivered to a subscriber, and the state of its deliveries."""
+
+    def __init__(self, subscriber: Subscriber):
+        self.subscriber = subscriber
+        self.entities: Deque[Dict[str, Any]] = deque(maxlen=config.NOTIFY_QUEUE_SIZE)
+        # Batch whose delivery failed, sent again before any other entity
+        self.batch: Optional[List[Dict[str, Any]]] = None
+        self.retries = 0
+        self.in_flight = False
+        self.not_before = 0.0
+
+    def is_idle(self) -> bool:
+        return not self.in_flight and not self.batch and not self.entities
+
+    def is_due(self, now: float) -> bool:
+        return not self.in_flight and bool(self.batch or self.entities) and self.not_before <= now
+
+
+def _deliver(subscriber: Subscriber, batch: List[Dict[str, Any]]) -> bool:
+    payload = {
+        "id": f"urn:ngsi-ld:Notification:{uuid.uuid4()}",
+        "type": "Notification",
+        "subscriptionId": subscriber.id,
+        "notifiedAt": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+        "data": batch,
+    }
+    try:
+        response = _session().post(subscriber.callback_url, json=payload, timeout=config.NOTIFY_TIMEOUT)
+    except requests.RequestException as ex:
+        logger.warning("Notification to subscriber %s (%s) failed: %s", subscriber.id, subscriber.callback_url, ex)
+        return False
+    if not response.ok:
+        logger.warning("Notification to subscriber %s (%s) failed: HTTP %s", subscriber.id, subscriber.callback_url,
+                       response.status_code)
+    return response.ok
+
+
+class NotificationHub(threading.Thread):
+    """Background thread that delivers the queued entities to each subscriber."""
+
+    def __init__(self):
+        super().__init__(name="notification-hub", daemon=True)
+        self._queues: Dict[str, _SubscriberQueue] = {}
+        self._executor = ThreadPoolExecutor(max_workers=config.NOTIFY_MAX_CONCURRENCY,
+                                            thread_name_prefix="notification-delivery")
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+
+    def enqueue(self, subscriber: Subscriber, entities: List[Dict[str, Any]]):
+        with self._lock:
+            queue = self._queues.get(subscriber.id)
+            if queue is None:
+                queue = self._queues[subscriber.id] = _SubscriberQueue(subscriber)
+            # A registration replaced since the queue was created is delivered to its new callback
+            queue.subscriber = subscriber
+            queue.entities.extend(entities)
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def _on_delivered(self, queue: _SubscriberQueue, batch: List[Dict[str, Any]], delivered: bool):
+        now = time.time()
+        with self._lock:
+            queue.in_flight = False
+            if delivered or queue.retries >= config.NOTIFY_MAX_RETRIES:
+                if not delivered:
+                    logger.error("Dropped %s notified entities for subscriber %s after %s retries", len(batch),
+                                 queue.subscriber.id, queue.retries)
+                queue.batch = None
+                queue.retries = 0
+                queue.not_before = now + config.NOTIFY_MIN_INTERVAL
+            else:
+                queue.batch = batch
+                queue.not_before = now + min(config.NOTIFY_RETRY_INTERVAL * 2 ** queue.retries,
+                                             config.NOTIFY_RETRY_MAX_INTERVAL)
+                queue.retries += 1
+        self._wakeup.set()
+
+    def _run_delivery(self, queue: _SubscriberQueue, batch: List[Dict[str, Any]]):
+        delivered = False
+        try:
+            delivered = _deliver(queue.subscriber, batch)
+        finally:
+            self._on_delivered(queue, batch, delivered)
+
+    def _schedule(self) -> float:
+        # Start the due deliveries, and return the time to wait until the next one is due
+        now = time.time()
+        wait = config.NOTIFY_MIN_INTERVAL
+        with self._lock:
+            for subscriber_id, queue in list(self._queues.items()):
+                if queue.is_idle() and queue.not_before <= now:
+                    del self._queues[subscriber_id]
+                elif queue.is_due(now):
+                    if not queue.batch:
+                        queue.batch = [queue.entities.popleft()
+                                       for _ in range(min(config.NOTIFY_BATCH_SIZE, len(queue.entities)))]
+                    queue.in_flight = True
+                    self._executor.submit(self._run_delivery, queue, queue.batch)
+                elif not queue.in_flight and queue.not_before > now:
+                    wait = min(wait, queue.not_before - now)
+        return wait
+
+    def run(self):
+        while not self._stopped.is_set():
+            wait = self._schedule()
+            self._wakeup.wait(wait)
+            self._wakeup.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def start_hub():
+    global _hub
+    _hub = NotificationHub()
+    _hub.start()
+
+
+def stop_hub():
+    global _hub
+    if _hub:
+        _hub.stop()
+        # The entities still queued are lost, Orion only notifies each change once
+        _hub.join(timeout=5)
+        _hub = None
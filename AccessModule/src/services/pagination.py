@@ -0,0 +1,89 @@
+"""
+pagination.py
+
+This module encodes the cursors used to page through the results of a query. A cursor is an
+opaque token for the client: it holds the catalog and the Orion offset of the next entity to
+retrieve, so each request only reads `limit` entities from Orion whatever its position. It also
+holds the number of matching entities and the change counter of the catalog when they were
+counted, so the following pages are not counted again while the catalog does not change.
+"""
+
+import base64
+import binascii
+import json
+from typing import Any, Dict, Optional
+
+import config
+import exceptions
+from schemas import QueryRequest
+
+
+def encode_cursor(catalog_id: str, offset: int, total: Optional[int] = None, version: Optional[int] = None) -> str:
+    token = json.dumps({"catalog_id": catalog_id, "offset": offset, "total": total, "version": version},
+                       separators=(",", ":"))
+    return base64.urlsafe_b64encode(token.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(query: QueryRequest) -> Dict[str, Any]:
+    try:
+        padding = "=" * (-len(query.cursor) % 4)
+        token = json.loads(base64.urlsafe_b64decode(query.cursor + padding))
+        offset = int(token["offset"])
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise exceptions.ODSException(config.Q400_INVALID_CURSOR)
+    if token.get("catalog_id") != query.catalog_id or offset < 0:
+        raise exceptions.ODSException(config.Q400_INVALID_CURSOR)
+    return token
+
+
+def get_offset(query: QueryRequest) -> int:
+    """
+    Decode the cursor of a query.
+
+    Returns:
+        int: The offset of the first entity to retrieve, 0 if the query has no cursor.
+
+    Raises:
+        exceptions.ODSException: If the cursor is malformed or belongs to another catalog.
+    """
+    if not query.cursor:
+        return 0
+    return int(_decode_cursor(query)["offset"])
+
+
+def get_total(query: QueryRequest, version: int) -> Optional[int]:
+    """
+    Number of matching entities carried by the cursor of a query.
+
+    Args:
+        query (QueryRequest): The query, with its current cursor.
+        version (int): The current change counter of the catalog.
+
+    Returns:
+        Optional[int]: The number of entities, or None if the query has no cursor or the
+        catalog changed since they were counted.
+    """
+    if not query.cursor:
+        return None
+    token = _decode_cursor(query)
+    if token.get("version") != version or not isinstance(token.get("total"), int):
+        return None
+    return token["total"]
+
+
+def get_next_cursor(query: QueryRequest, total: int, version: Optional[int] = None) -> Optional[str]:
+    """
+    Build the cursor of the page following the one requested by a query.
+
+    Args:
+        query (QueryRequest): The query, with its `limit` and current cursor.
+        total (int): The number of entities matching the query.
+        version (Optional[int]): The change counter of the catalog when the entities were counted.
+
+    Returns:
+        Optional[str]: The next cursor, or None if this is the last page.
+    """
+    if not query.limit:
+        return None
+    next_offset = get_offset(query) + query.limit
+    return encode_cursor(query.catalog_id, next_offset, total, version) if next_offset < total else None
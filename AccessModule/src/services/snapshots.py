@@ -0,0 +1,230 @@
+"""
+snapshots.py
+
+This module materializes the full exports of the data catalogs on disk, so downloading a whole
+catalog is served as a static file instead of reading every entity from Orion.
+
+A snapshot is built in the background the first time a full export is requested, and rebuilt
+when the data of the catalog changes. Snapshots are versioned by the change counter of the
+catalog, so a snapshot is only served while the catalog has not changed since it was built.
+Rebuilds wait `SNAPSHOT_DELAY` seconds after the last change, so a burst of inserts triggers
+a single rebuild. After a build, the versions before the previous one are removed: the previous
+version is kept, as a request may have looked up its snapshot and not opened the file yet. The
+snapshots of a deleted catalog are removed with it.
+
+Layout (shared by all the server processes):
+- {catalog_id}/{version}/{variant}: Snapshot of one output format and context option.
+- {catalog_id}/{version}/.{variant}.lock: Held while the snapshot is being built.
+
+Dependencies:
+- Export service: For retrieving and rendering the catalog data.
+- Changes service: For the change counter of the catalogs.
+"""
+
+import fcntl
+import itertools
+import os
+import shutil
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import quote
+
+import config
+import metrics
+import services.changes as service_changes
+import services.datacatalog as service_datacatalog
+import services.export as service_export
+from schemas import QueryRequest
+
+_worker: Optional["SnapshotWorker"] = None
+
+
+def _catalog_path(catalog_id: str) -> str:
+    return os.path.join(config.SNAPSHOT_PATH, quote(catalog_id, safe=""))
+
+
+def _get_variant(query: QueryRequest) -> str:
+    _, filename = service_export.OUTPUT_MEDIA_TYPES[query.output]
+    name, extension = os.path.splitext(filename)
+    options = ("" if query.include_context else "-nocontext") + ("-envelope" if query.envelope else "")
+    return f"{name}{options}{extension}"
+
+
+def _get_query(catalog_id: str, variant: str) -> QueryRequest:
+    name, extension = os.path.splitext(variant)
+    output = next(output for output, (_, filename) in service_export.OUTPUT_MEDIA_TYPES.items() if filename.endswith(extension))
+    return QueryRequest(
+        catalog_id=catalog_id,
+        entities=[],
+        fields=[],
+        output=output,
+        include_context="-nocontext" not in name,
+        envelope="-envelope" in name
+    )
+
+
+def is_full_export(query: QueryRequest) -> bool:
+    """Whether a query retrieves the whole catalog in a streamed format, so it can be materialized."""
+    return (
+        query.output in service_export.OUTPUT_MEDIA_TYPES
+        and not query.entities and not query.fields
+        and not query.time_filter and not query.resample
+        and not query.row_filter and not query.geo_filter
+        and not query.limit and not query.cursor
+    )
+
+
+def get_snapshot(query: QueryRequest) -> Optional[Tuple[str, str, str]]:
+    """
+    Look up the snapshot of a full export. A missing or outdated snapshot is scheduled to be built.
+
+    Returns:
+        Optional[Tuple[str, str, str]]: The path, media type and file name of the snapshot,
+        or None if it is not available for the current version of the catalog.
+    """
+    version, changed_at = service_changes.get_version(query.catalog_id)
+    variant = _get_variant(query)
+    path = os.path.join(_catalog_path(query.catalog_id), str(version), variant)
+    if os.path.exists(path):
+        metrics.count_lookup("snapshot", True)
+        media_type, filename = service_export.OUTPUT_MEDIA_TYPES[query.output]
+        return path, media_type, filename
+    metrics.count_lookup("snapshot", False)
+    if _worker:
+        _worker.schedule(query.catalog_id, variant, changed_at + config.SNAPSHOT_DELAY)
+    return None
+
+
+def _remove_old_versions(catalog_id: str, version: int):
+    old_versions = sorted(
+        (int(entry.name), entry.path) for entry in os.scandir(_catalog_path(catalog_id))
+        if entry.name.isdigit() and int(entry.name) < version
+    )
+    # The previous version is kept, a request may still be about to open one of its snapshots
+    for _, path in old_versions[:-1]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def remove_catalog(catalog_id: str):
+    """Remove the snapshots of a deleted catalog, and cancel the builds scheduled for it."""
+    if _worker:
+        _worker.cancel(catalog_id)
+    shutil.rmtree(_catalog_path(catalog_id), ignore_errors=True)
+
+
+def build_snapshot(catalog_id: str, variant: str):
+    """
+    Build the snapshot of a catalog for its current version. Only one process builds each
+    snapshot, the others skip it while the lock is held.
+    """
+    version, _ = service_changes.get_version(catalog_id)
+    version_path = os.path.join(_catalog_path(catalog_id), str(version))
+    path = os.path.join(version_path, variant)
+    if os.path.exists(path):
+        return
+    query = _get_query(catalog_id, variant)
+    if not service_export.is_available(query.output):
+        return
+    # Retrieved before creating the directory, so a deleted catalog does not leave one behind
+    datacatalog = service_datacatalog.get_catalog(catalog_id)
+    os.makedirs(version_path, exist_ok=True)
+    with open(os.path.join(version_path, f".{variant}.lock"), "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        if os.path.exists(path):
+            return
+        pages = service_export.iter_pages(query, datacatalog)
+        first_page = next(pages, None)
+        if not first_page:
+            # An empty catalog is reported by the query itself
+            return
+        content, _, _ = service_export.render(itertools.chain([first_page], pages), query, datacatalog)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as buffer:
+            for chunk in content:
+                buffer.write(chunk.encode() if isinstance(chunk, str) else chunk)
+        os.replace(tmp_path, path)
+    _remove_old_versions(catalog_id, version)
+
+
+def _on_change(catalog_id: str):
+    # Rebuild the snapshots that were already materialized for the catalog
+    if not _worker or not os.path.isdir(_catalog_path(catalog_id)):
+        return
+    variants = set()
+    for version in os.scandir(_catalog_path(catalog_id)):
+        if version.is_dir():
+            variants.update(entry.name for entry in os.scandir(version.path)
+                            if not entry.name.startswith(".") and not entry.name.endswith(".tmp"))
+    for variant in variants:
+        _worker.schedule(catalog_id, variant, time.time() + config.SNAPSHOT_DELAY)
+
+
+service_changes.add_listener(_on_change)
+
+
+class SnapshotWorker(threading.Thread):
+    """Background thread that builds the scheduled snapshots once they are due."""
+
+    def __init__(self):
+        super().__init__(name="snapshot-worker", daemon=True)
+        self._scheduled: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+
+    def schedule(self, catalog_id: str, variant: str, due: float):
+        with self._lock:
+            # A later change postpones the build, so a burst of inserts triggers a single build
+            self._scheduled[(catalog_id, variant)] = max(due, self._scheduled.get((catalog_id, variant), 0))
+        self._wakeup.set()
+
+    def cancel(self, catalog_id: str):
+        with self._lock:
+            for key in [key for key in self._scheduled if key[0] == catalog_id]:
+                del self._scheduled[key]
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def _next_due(self) -> Tuple[Optional[Tuple[str, str]], float]:
+        with self._lock:
+            if not self._scheduled:
+                return None, config.SNAPSHOT_DELAY
+            key, due = min(self._scheduled.items(), key=lambda item: item[1])
+            if due > time.time():
+                return None, due - time.time()
+            del self._scheduled[key]
+            return key, 0
+
+    def run(self):
+        while not self._stopped.is_set():
+            key, wait = self._next_due()
+            if key:
+                try:
+                    build_snapshot(*key)
+                except Exception as ex:
+                    print(f"Snapshot of {key[0]} failed: {ex}")
+                continue
+            self._wakeup.wait(wait)
+            self._wakeup.clear()
+
+
+def start_worker():
+    global _worker
+    os.makedirs(config.SNAPSHOT_PATH, exist_ok=True)
+    _worker = SnapshotWorker()
+    _worker.start()
+
+
+def stop_worker():
+    global _worker
+    if _worker:
+        _worker.stop()
+        # A snapshot being built is left unfinished, it is built again when requested
+        _worker.join(timeout=5)
+        _worker = None
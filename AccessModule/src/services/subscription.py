@@ -4,15 +4,61 @@ subscription.py
 This module provides a service to create subscriptions to a Fiware-based data catalog.
 It involves retrieving the catalog information, constructing an Orion subscription,
 and sending it to the Fiware repository.
+
+When the AccessModule receives the Orion notifications (`ACCESSMODULE_NOTIFY_URL`), the
+subscriptions are registered in the notification hub instead, which fans out the notifications
+of the internal subscription of each catalog to its subscribers.
+
+The internal subscriptions carry the shared secret `ACCESSMODULE_NOTIFY_TOKEN` in a header of
+their notifications, so forged notifications are rejected before any cache is invalidated or
+any subscriber notified.
 """
 
+import hmac
+
 from schemas import EntitySubscription, OrionSubscriptionCreate, DataCatalogSubscription
-from utils import get_full_user_subscription_id
+from typing import Dict, List, Set
+from utils import get_full_user_subscription_id, get_full_subscription_id, get_full_user_id, get_id_from_fiware_id
 import config
 import repository.fiware as fiware_repository
 import services.datacatalog as services
+import services.changes as service_changes
+import services.notifications as service_notifications
 import exceptions
 
+# Catalogs known to exist in this process, so the notifications don't look them up every time
+_known_catalogs: Set[str] = set()
+# Catalogs whose internal subscription was already sent to Orion by this process
+_subscribed_catalogs: Set[str] = set()
+
+
+def ensure_internal_subscription(catalog_id: str):
+    # Catalogs created before the notifications were enabled lack their internal subscription.
+    # Orion rejects the subscription if it already exists, so it is only sent once per process
+    if catalog_id in _subscribed_catalogs:
+        return
+    subscription = OrionSubscriptionCreate(
+        description=config.INTERNAL_ODS_SUBSCRIPTION_DESC.format(catalog_id),
+        entities_type=[catalog_id],
+        watched_attribute=[],
+        subscription_endpoint=config.ODS_NOTIFY_URL,
+        id=get_full_subscription_id(catalog_id, config.ODS_NAME),
+        receiver_info={config.ODS_NOTIFY_TOKEN_HEADER: config.ODS_NOTIFY_TOKEN} if config.ODS_NOTIFY_TOKEN else None
+    )
+    fiware_repository.subscribe(subscription.subscription_to_fiware())
+    _subscribed_catalogs.add(catalog_id)
+
+
+def _register(orion_subscription: OrionSubscriptionCreate, catalog_id: str, user: str, **filters):
+    ensure_internal_subscription(catalog_id)
+    service_notifications.register(service_notifications.Subscriber(
+        id=orion_subscription.id,
+        owner=user,
+        catalog_id=catalog_id,
+        callback_url=orion_subscription.subscription_endpoint,
+        **filters
+    ))
+
 def create_entity_subscription(subscription: EntitySubscription, user: str) -> OrionSubscriptionCreate:
     """
     Create a subscription to a Fiware data catalog for a specific user.
@@ -26,26 +72,34 @@ def create_entity_subscription(subscription: EntitySubscription, user: str) -> O
 
     Raises:
         exceptions.DataCatalogNotFound: If the specified data catalog does not exist.
+        exceptions.ODSPermissionException: If the catalog is private and owned by another user.
         exceptions.ODSException: For any other errors related to the operation.
     """
     try:
         data_catalog = services.get_catalog(subscription.catalog_id)
         if not data_catalog:
             raise exceptions.DataCatalogNotFound(f"Data catalog {subscription.catalog_id} not found.")
-        print(data_catalog)
-        print(data_catalog.entities_context)
+        # The notifications carry the data of the entities, as the queries do
+        if data_catalog.owner != user and not data_catalog.is_public:
+            raise exceptions.ODSPermissionException(config.C403_DATACATALOG_ACCESS_ERROR)
         orion_subscription = OrionSubscriptionCreate(
             description=config.INTERNAL_QL_SUBSCRIPTION_DESC,
             entities_type=[subscription.catalog_id],
-            watched_attributes=[attribute.context_key for attribute in data_catalog.entities_context],
+            watched_attribute=[attribute.context_key for attribute in data_catalog.entities_context],
             subscription_endpoint=subscription.callback_url,
             id=get_full_user_subscription_id(data_catalog.get_catalog_type_id(), user, subscription.subscription_name)
         )
+        if config.ODS_NOTIFY_URL:
+            _register(orion_subscription, subscription.catalog_id, user, entities=subscription.entities,
+                      owners=subscription.owners, tags=subscription.tags)
+            return orion_subscription
         response = fiware_repository.subscribe(orion_subscription.subscription_to_fiware())
         if not response.ok:
             raise exceptions.ODSException("Failed to create subscription in Fiware.")
 
         return orion_subscription
+    except exceptions.ODSPermissionException:
+        raise
     except Exception as e:
         raise exceptions.ODSException(f"Error creating subscription: {str(e)}")
 
@@ -53,7 +107,8 @@ def create_entity_subscription(subscription: EntitySubscription, user: str) -> O
 
 def create_datacatalog_subscription(subscription: DataCatalogSubscription, user: str) -> OrionSubscriptionCreate:
     """
-    Create a subscription to a Fiware data catalog for a specific user.
+    Create a subscription to a Fiware data catalog for a specific user. Only the public catalogs
+    and the catalogs of the user are notified.
 
     Args:
         subscription (Subscription): The subscription details provided by the user.
@@ -70,12 +125,77 @@ def create_datacatalog_subscription(subscription: DataCatalogSubscription, user:
     orion_subscription = OrionSubscriptionCreate(
         description=config.INTERNAL_QL_SUBSCRIPTION_DESC,
         entities_type=[config.CATALOG_ENTITY],
-        watched_attributes=["name"],
+        watched_attribute=["name"],
         subscription_endpoint=subscription.callback_url,
-        id=get_full_user_subscription_id(config.SUBSCRIPTION_ENTITY, user, subscription.subscription_name)
+        id=get_full_user_subscription_id(config.SUBSCRIPTION_ENTITY, user, subscription.subscription_name),
+        query=f'public==true|owner=="{get_full_user_id(user)}"'
     )
+    if config.ODS_NOTIFY_URL:
+        _register(orion_subscription, config.CATALOG_ENTITY, user, owners=subscription.owners, tags=subscription.tags,
+                  types=[type.value for type in subscription.types] if subscription.types else None)
+        return orion_subscription
     response = fiware_repository.subscribe(orion_subscription.subscription_to_fiware())
     if not response.ok:
         raise exceptions.ODSException("Failed to create subscription in Fiware.")
 
     return orion_subscription
+
+
+def check_notify_token(token: str) -> bool:
+    """Whether a notification carries the shared secret of the internal subscriptions (never if there is none)."""
+    if not config.ODS_NOTIFY_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode(), config.ODS_NOTIFY_TOKEN.encode())
+
+
+def _is_known_catalog(catalog_id: str) -> bool:
+    if catalog_id in _known_catalogs:
+        return True
+    try:
+        services.get_catalog(catalog_id)
+    except exceptions.ODSException:
+        return False
+    _known_catalogs.add(catalog_id)
+    return True
+
+
+def validate_notification(notification: Dict) -> None:
+    """
+    Check that every entity of a notification belongs to an existing catalog, or is a catalog.
+
+    Raises:
+        exceptions.ODSException: If an entity does not belong to a known catalog.
+    """
+    for entity in notification.get("data", []):
+        entity_id = entity.get("id", "") if isinstance(entity, dict) else ""
+        catalog_id = service_notifications.get_notified_catalog(entity) if isinstance(entity, dict) else None
+        if catalog_id == config.CATALOG_ENTITY:
+            known = entity_id.startswith(f"{config.ORION_ENTITY_PREFIX}:{config.CATALOG_ENTITY}:")
+        else:
+            known = bool(catalog_id) and entity.get("type") == catalog_id and \
+                entity_id.startswith(f"{config.ORION_ENTITY_PREFIX}:{catalog_id}:") and _is_known_catalog(catalog_id)
+        if not known:
+            raise exceptions.ODSException(config.S400_UNKNOWN_CATALOG.format(entity_id))
+
+
+def process_change_notification(notification: dict) -> List[str]:
+    """
+    Process a notification sent by Orion to the internal AccessModule subscription of a catalog,
+    marking as changed the catalogs of the notified entities.
+
+    Args:
+        notification (dict): The NGSI-LD notification.
+
+    Returns:
+        List[str]: The IDs of the changed catalogs.
+    """
+    catalog_ids = set()
+    for entity in notification.get("data", []):
+        catalog_id = service_notifications.get_notified_catalog(entity)
+        if catalog_id == config.CATALOG_ENTITY:
+            catalog_ids.update([get_id_from_fiware_id(entity["id"]), service_changes.CATALOG_LIST])
+        elif catalog_id:
+            catalog_ids.add(catalog_id)
+    for catalog_id in catalog_ids:
+        service_changes.mark_changed(catalog_id)
+    return sorted(catalog_ids)
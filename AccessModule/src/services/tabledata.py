@@ -10,35 +10,41 @@ Dependencies:
 - Utils: For utility functions such as generating entity IDs.
 - Services: For interacting with the data catalog.
 - Exceptions: For handling custom errors such as permission or catalog-related issues.
+
+Table entities can also be sliced when queried: the rows are selected with NumPy masks over
+the column lists, so only the matching rows are serialized.
 """
 
 from schemas import (TypeCatalog, GeneralEntityRequest, 
                      FiwareEntity, FiwareProperty, QueryRequest, 
-                     DataCatalogCreate, OutputFormat)
+                     DataCatalogCreate, OutputFormat, RowFilter, RowPredicate,
+                     PredicateOperator, TypeAttribute)
 from repository.fiware import send_entity, get_entity, query_entity
 import utils 
 import services.datacatalog as services
+import services.changes as service_changes
 import exceptions
+import config
+import metrics
+import numpy as np
 from csv import DictReader
-from typing import Dict
+from typing import Any, Dict, List
 
-def insert_data(entrydata: DictReader, catalog_id: str, entity: str, user: str) -> bool:
+def validate_catalog(catalog_id: str, user: str) -> DataCatalogCreate:
     """
-    Inserts data from a CSV file into a specified data catalog in Fiware.
+    Fetches a table data catalog and checks that the user can insert data into it.
 
     Args:
-        entrydata (DictReader): The data to insert, typically parsed from a CSV file.
         catalog_id (str): The ID of the catalog where the data will be inserted.
-        entity (str): The name or ID of the entity in Fiware.
         user (str): The username of the person attempting to insert data.
 
     Returns:
-        bool: True if the data was inserted successfully, False otherwise.
+        DataCatalogCreate: The validated data catalog.
 
     Raises:
         exceptions.DataCatalogNotFound: If the catalog does not exist.
         exceptions.ODSPermissionException: If the user does not have permission to modify the catalog.
-        exceptions.ODSException: If the catalog type is not compatible, or other errors occur during insertion.
+        exceptions.ODSException: If the catalog type is not compatible.
     """
     # Fetch the data catalog
     data_catalog = services.get_catalog(catalog_id)
@@ -53,11 +59,30 @@ def insert_data(entrydata: DictReader, catalog_id: str, entity: str, user: str)
     # Validate the catalog type
     if data_catalog.type != TypeCatalog.TABLE:
         raise exceptions.ODSException(f"Catalog type '{data_catalog.type}' is not compatible with data insertion.")
-    
+
+    return data_catalog
+
+
+def build_entity(entrydata: DictReader, data_catalog: DataCatalogCreate, entity: str, user: str) -> dict:
+    """
+    Builds the Fiware entity of a table from the CSV rows, for an already validated catalog.
+
+    Args:
+        entrydata (DictReader): The data to insert, typically parsed from a CSV file.
+        data_catalog (DataCatalogCreate): The catalog where the data will be inserted.
+        entity (str): The name or ID of the entity in Fiware.
+        user (str): The username of the person inserting data.
+
+    Returns:
+        dict: The Fiware entity holding one list per column.
+
+    Raises:
+        exceptions.ODSException: If any catalog attribute is missing in the CSV data.
+    """
     # Create a new Fiware entity
-    entity = FiwareEntity(
-        id=utils.get_entity_id(catalog_id, user, entity), 
-        type=catalog_id, 
+    fiware_entity = FiwareEntity(
+        id=utils.get_entity_id(data_catalog.id, user, entity), 
+        type=data_catalog.id, 
         tags=[],
         entity_values=[]
     )
@@ -76,15 +101,144 @@ def insert_data(entrydata: DictReader, catalog_id: str, entity: str, user: str)
     
     # Populate the entity with the data collected
     for entry_attribute in data_catalog.entities_context:
-        entity.entity_values.append(FiwareProperty(
+        fiware_entity.entity_values.append(FiwareProperty(
             property_key=entry_attribute.context_key,
             property_value=data[entry_attribute.context_key]
         ))
+
+    return fiware_entity.to_fiware()
+
+
+def count_rows(fiware_entity: dict, data_catalog: DataCatalogCreate) -> int:
+    """Number of rows of the Fiware entity of a table."""
+    return max([len(fiware_entity[attribute.context_key]["value"]) for attribute in data_catalog.entities_context
+                if attribute.context_key in fiware_entity], default=0)
+
+
+def insert_data(entrydata: DictReader, catalog_id: str, entity: str, user: str) -> bool:
+    """
+    Inserts data from a CSV file into a specified data catalog in Fiware.
+
+    Args:
+        entrydata (DictReader): The data to insert, typically parsed from a CSV file.
+        catalog_id (str): The ID of the catalog where the data will be inserted.
+        entity (str): The name or ID of the entity in Fiware.
+        user (str): The username of the person attempting to insert data.
+
+    Returns:
+        bool: True if the data was inserted successfully, False otherwise.
+
+    Raises:
+        exceptions.DataCatalogNotFound: If the catalog does not exist.
+        exceptions.ODSPermissionException: If the user does not have permission to modify the catalog.
+        exceptions.ODSException: If the catalog type is not compatible, or other errors occur during insertion.
+    """
+    data_catalog = validate_catalog(catalog_id, user)
+    fiware_entity = build_entity(entrydata, data_catalog, entity, user)
     
     # Send the entity to Fiware
-    response = send_entity([entity.to_fiware()])
+    response = send_entity([fiware_entity])
     
     if not response or not response.ok:
         raise exceptions.ODSException("Failed to insert data into Fiware.")
+    service_changes.mark_changed(data_catalog.id)
+    metrics.count_ingested(data_catalog.type, "sync", rows=count_rows(fiware_entity, data_catalog))
     
     return True
+
+
+def _to_array(values: list, attribute_type: TypeAttribute) -> np.ndarray:
+    # Table cells are stored as they were read from the CSV file, typed only for the comparison
+    if attribute_type in [TypeAttribute.INTEGER, TypeAttribute.DOUBLE]:
+        try:
+            return np.array(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            return np.array([_to_number(value) for value in values], dtype=np.float64)
+    return np.array(["" if value is None else str(value) for value in values], dtype=str)
+
+
+def _to_number(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _to_operand(value: Any, attribute_type: TypeAttribute):
+    values = value if isinstance(value, list) else [value]
+    if attribute_type in [TypeAttribute.INTEGER, TypeAttribute.DOUBLE]:
+        operand = np.array([_to_number(item) for item in values], dtype=np.float64)
+    else:
+        operand = np.array([str(item) for item in values], dtype=str)
+    return operand if isinstance(value, list) else operand[0]
+
+
+def _get_mask(column: np.ndarray, predicate: RowPredicate, attribute_type: TypeAttribute) -> np.ndarray:
+    operand = _to_operand(predicate.value, attribute_type)
+    if predicate.op == PredicateOperator.IN:
+        return np.isin(column, np.atleast_1d(operand))
+    if isinstance(predicate.value, list):
+        raise exceptions.ODSException(config.Q400_INVALID_PREDICATE.format(predicate.column, predicate.op.value))
+    if predicate.op == PredicateOperator.LT:
+        return column < operand
+    if predicate.op == PredicateOperator.GT:
+        return column > operand
+    return column == operand
+
+
+def get_filter_columns(row_filter: RowFilter, data_catalog: DataCatalogCreate) -> List[str]:
+    """
+    Validates the predicates of a row filter and returns the columns they need.
+
+    Raises:
+        exceptions.ODSException: If a predicate refers to a column not defined in the catalog.
+    """
+    attributes = {attribute.context_key for attribute in data_catalog.entities_context}
+    for predicate in row_filter.predicates:
+        if predicate.column not in attributes:
+            raise exceptions.ODSException(config.Q400_UNKNOWN_COLUMN.format(predicate.column))
+    return list(dict.fromkeys(predicate.column for predicate in row_filter.predicates))
+
+
+def filter_rows(entity: Dict[str, Any], row_filter: RowFilter, data_catalog: DataCatalogCreate, fields: List[str] = None) -> Dict[str, Any]:
+    """
+    Selects the rows of a table entity matching a row filter. The predicates are combined
+    with AND, and the offset and limit are applied to the matching rows of the entity.
+
+    Args:
+        entity (Dict[str, Any]): The table entity, with one list per column.
+        row_filter (RowFilter): The predicates, offset and limit to apply.
+        data_catalog (DataCatalogCreate): The catalog of the entity, to type the columns.
+        fields (List[str]): The requested fields. Columns only fetched to evaluate the predicates are removed.
+
+    Returns:
+        Dict[str, Any]: The entity with the selected rows.
+    """
+    columns = [
+        attribute for attribute in data_catalog.entities_context
+        if isinstance(entity.get(attribute.context_key), list)
+    ]
+    total_rows = max([len(entity[attribute.context_key]) for attribute in columns], default=0)
+
+    mask = np.ones(total_rows, dtype=bool)
+    types = {attribute.context_key: attribute.context_type for attribute in data_catalog.entities_context}
+    for predicate in row_filter.predicates:
+        values = entity.get(predicate.column)
+        values = values if isinstance(values, list) else []
+        # Rows missing in a shorter column never match
+        predicate_mask = np.zeros(total_rows, dtype=bool)
+        predicate_mask[:len(values)] = _get_mask(_to_array(values, types[predicate.column]), predicate, types[predicate.column])
+        mask &= predicate_mask
+
+    rows = np.flatnonzero(mask)
+    end = None if row_filter.limit is None else row_filter.offset + row_filter.limit
+    rows = rows[row_filter.offset:end]
+
+    for attribute in columns:
+        key = attribute.context_key
+        if fields and key not in fields:
+            entity.pop(key)
+            continue
+        values = entity[key]
+        entity[key] = [values[row] for row in rows[rows < len(values)].tolist()]
+    return entity
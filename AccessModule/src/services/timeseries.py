@@ -1,43 +1,53 @@
 """
 timeseries_data_service.py
 
-This module provides functionality to insert time series data into a Fiware data catalog.
+This module provides functionality to insert time series data into a Fiware data catalog
+and to query its history from QuantumLeap.
 It includes validation for user permissions, catalog type verification, and proper structuring
 of the data in accordance with Fiware's expectations.
 
 Dependencies:
-- Fiware repository: For sending data.
+- Fiware repository: For sending data and listing the entities of a catalog.
+- QuantumLeap repository: For retrieving the history of the entities.
 - Utils: For utility functions, such as generating entity IDs.
 - Services: For interacting with data catalogs.
 - Exceptions: For custom errors related to data catalogs.
 """
 
-from schemas import TypeCatalog, TimeSeriesEntry, FiwareEntity, FiwareProperty, DataCatalogCreate, QueryRequest
-from repository.fiware import send_entity
+from schemas import (TypeCatalog, TypeAttribute, TimeSeriesEntry, FiwareEntity, FiwareProperty, DataCatalogCreate,
+                     QueryRequest, TimeFilter, FillPolicy, get_property_type)
+from repository.fiware import send_entity, iter_entity_pages, count_entities
+from repository.quantumleap import get_entity_attrs
+from concurrent.futures import ThreadPoolExecutor
+import config
+import metrics
 import utils
 import json
-from datetime import datetime
-from typing import Optional
+import numpy as np
+from datetime import datetime, timezone
+from typing import Optional, List, Dict, Any, Tuple, Iterator
 import services.datacatalog as services
+import services.changes as service_changes
+import services.pagination as service_pagination
+import services.geoindex as service_geoindex
 import exceptions
 
 
-def insert_data(catalog_name: str, entry: TimeSeriesEntry, user: str) -> Optional[str]:
+def validate_catalog(catalog_name: str, user: str) -> DataCatalogCreate:
     """
-    Inserts a time series entry into a Fiware catalog.
+    Retrieves a time series catalog and checks that the user can insert data into it.
 
     Args:
         catalog_name (str): The name of the catalog to insert data into.
-        entry (TimeSeriesEntry): The data entry to be inserted.
         user (str): The username of the user performing the operation.
 
     Returns:
-        Optional[str]: The entity ID of the inserted data if successful, None otherwise.
+        DataCatalogCreate: The validated data catalog.
 
     Raises:
         exceptions.DataCatalogNotFound: If the catalog does not exist.
         exceptions.ODSPermissionException: If the user lacks permission to modify the catalog.
-        exceptions.ODSException: If the catalog type is incompatible or other errors occur.
+        exceptions.ODSException: If the catalog type is incompatible.
     """
     # Fetch the data catalog
     data_catalog = services.get_catalog(catalog_name)
@@ -52,7 +62,27 @@ def insert_data(catalog_name: str, entry: TimeSeriesEntry, user: str) -> Optiona
     # Ensure the catalog is of the correct type (timeseries)
     if data_catalog.type != TypeCatalog.TIMESERIES:
         raise exceptions.ODSException(f"Catalog type '{data_catalog.type}' is not compatible with time series data insertion.")
-    
+
+    return data_catalog
+
+
+def build_entity(data_catalog: DataCatalogCreate, entry: TimeSeriesEntry, user: str) -> dict:
+    """
+    Builds the Fiware payload for a time series entry of an already validated catalog.
+
+    Args:
+        data_catalog (DataCatalogCreate): The catalog the entry belongs to.
+        entry (TimeSeriesEntry): The data entry to be converted.
+        user (str): The username of the user performing the operation.
+
+    Returns:
+        dict: The JSON serializable Fiware entity.
+
+    Raises:
+        exceptions.ODSException: If the entry is missing any attribute of the catalog.
+    """
+    catalog_name = data_catalog.id
+
     # Create the Fiware entity for this timeseries data
     entity = FiwareEntity(
         id=utils.get_entity_id(catalog_name, user, entry.id), 
@@ -71,32 +101,337 @@ def insert_data(catalog_name: str, entry: TimeSeriesEntry, user: str) -> Optiona
         entity.entity_values.append(FiwareProperty(
             property_key=context_key,
             property_value=getattr(entry, context_key),
+            property_type=get_property_type(entry_attribute.context_type),
             observed_at=datetime.fromtimestamp(entry.timestamp)
         ))
     
+    try:
+        fiware_entity = entity.to_fiware()
+    except ValueError as e:
+        raise exceptions.ODSException(str(e))
+
     # Convert entity to JSON and handle datetime serialization
-    entity_payload = json.loads(json.dumps(
-        entity.to_fiware(), 
+    return json.loads(json.dumps(
+        fiware_entity, 
         default=lambda o: o.isoformat() if isinstance(o, datetime) else None
     ))
+
+
+def insert_data(catalog_name: str, entry: TimeSeriesEntry, user: str) -> Optional[str]:
+    """
+    Inserts a time series entry into a Fiware catalog.
+
+    Args:
+        catalog_name (str): The name of the catalog to insert data into.
+        entry (TimeSeriesEntry): The data entry to be inserted.
+        user (str): The username of the user performing the operation.
+
+    Returns:
+        Optional[str]: The entity ID of the inserted data if successful, None otherwise.
+
+    Raises:
+        exceptions.DataCatalogNotFound: If the catalog does not exist.
+        exceptions.ODSPermissionException: If the user lacks permission to modify the catalog.
+        exceptions.ODSException: If the catalog type is incompatible or other errors occur.
+    """
+    data_catalog = validate_catalog(catalog_name, user)
+    entity_payload = build_entity(data_catalog, entry, user)
     
     # Send the entity to Fiware
     response = send_entity([entity_payload])
     
     if not response or not response.ok:
         raise exceptions.ODSException(f"Failed to insert data into catalog '{catalog_name}'.")
+    service_changes.mark_changed(data_catalog.id)
+    metrics.count_ingested(data_catalog.type, "sync")
     
-    return entity.id
+    return entity_payload["id"]
+
+
+def _to_iso_date(epoch_millis: int) -> str:
+    return datetime.fromtimestamp(epoch_millis / 1000, tz=timezone.utc).isoformat()
+
+
+def _get_ql_params(time_filter: Optional[TimeFilter]) -> Dict[str, Any]:
+    """
+    Translates the time filter of a query into QuantumLeap query parameters, so the
+    time range, the last N values and the downsampling are resolved by QuantumLeap.
+    """
+    params: Dict[str, Any] = {}
+    if not time_filter:
+        return params
+    if time_filter.start_date is not None:
+        params["fromDate"] = _to_iso_date(time_filter.start_date)
+    if time_filter.end_date is not None:
+        params["toDate"] = _to_iso_date(time_filter.end_date)
+    if time_filter.last_n:
+        params["lastN"] = time_filter.last_n
+    if time_filter.aggr_method:
+        params["aggrMethod"] = time_filter.aggr_method.value
+    if time_filter.aggr_period:
+        params["aggrPeriod"] = time_filter.aggr_period.value
+    return params
+
+
+def _iter_entity_ids(query: QueryRequest, datacatalog: DataCatalogCreate, attributes: List[str]) -> Iterator[List[str]]:
+    """
+    Lists, page by page, the Fiware IDs of the catalog entities matching the entity patterns
+    of the query. A pattern can match the entity name or the `owner:entity` ID returned by the queries.
+    """
+    pages = iter_entity_pages(
+        datacatalog.id, fields=attributes, id_pattern=_get_id_pattern(query, datacatalog),
+        offset=service_pagination.get_offset(query), limit=query.limit,
+        geo_query=service_geoindex.get_geo_query(query, datacatalog)
+    )
+    for page in pages:
+        yield [entity["id"] for entity in page]
+
+
+def _get_id_pattern(query: QueryRequest, datacatalog: DataCatalogCreate) -> Optional[str]:
+    return utils.get_entity_id_pattern(datacatalog.id, query.entities)
+
+
+def count_data(query: QueryRequest, datacatalog: DataCatalogCreate) -> int:
+    """
+    Counts the time series entities matching a query request, regardless of its cursor and limit.
+    """
+    attributes = [
+        attribute.context_key for attribute in datacatalog.entities_context
+        if not query.fields or attribute.context_key in query.fields
+    ]
+    return count_entities(
+        datacatalog.id, fields=attributes, id_pattern=_get_id_pattern(query, datacatalog),
+        geo_query=service_geoindex.get_geo_query(query, datacatalog)
+    )
+
+
+def _fetch_series(entity_id: str, attributes: List[str], params: Dict[str, Any]) -> Tuple[list, Dict[str, list]]:
+    """
+    Retrieves the history of an entity from QuantumLeap, following its pagination.
+
+    Returns:
+        Tuple[list, Dict[str, list]]: The timestamps and the values of each attribute, aligned with them.
+
+    Raises:
+        exceptions.ODSException: If QuantumLeap fails to return a page.
+    """
+    index: list = []
+    columns: Dict[str, list] = {attribute: [] for attribute in attributes}
+    offset = 0
+    while True:
+        page_params = dict(params)
+        if "lastN" not in params:
+            page_params["limit"] = config.QL_PAGE_SIZE
+            page_params["offset"] = offset
+        response = get_entity_attrs(entity_id, attributes, page_params)
+        if response.status_code == 404:
+            # QuantumLeap answers 404 when there are no records for the query
+            break
+        if not response.ok:
+            # A failed page would otherwise be taken for the end of the series
+            raise exceptions.ODSException(config.Q502_SERIES_FAILED.format(entity_id, response.status_code))
+        body = response.json()
+        page_index = body.get("index", [])
+        page_values = {attribute["attrName"]: attribute["values"] for attribute in body.get("attributes", [])}
+        page_size = max([len(page_index)] + [len(values) for values in page_values.values()])
+        index.extend(page_index)
+        for attribute in attributes:
+            columns[attribute].extend(page_values.get(attribute, [None] * page_size))
+        if "lastN" in params or len(page_index) < config.QL_PAGE_SIZE:
+            break
+        offset += config.QL_PAGE_SIZE
+    return index, columns
+
+
+def iter_data(query: QueryRequest, datacatalog: DataCatalogCreate) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Retrieves the history of the entities of a time series catalog from QuantumLeap.
+
+    The histories of each page of entities are fetched concurrently. Each entity is returned with
+    its timestamps and attribute values as aligned columns, like the entities of table catalogs.
+
+    Args:
+        query (QueryRequest): The query parameters, including the optional time filter.
+        datacatalog (DataCatalogCreate): The time series catalog to query.
+
+    Yields:
+        List[Dict[str, Any]]: The time series of a page of entities.
+
+    Raises:
+        exceptions.ODSException: If the data could not be retrieved.
+    """
+    try:
+        attributes = [
+            attribute.context_key for attribute in datacatalog.entities_context
+            if not query.fields or attribute.context_key in query.fields
+        ]
+        if not attributes:
+            return
+
+        params = _get_ql_params(query.time_filter)
+        with ThreadPoolExecutor(max_workers=config.QL_MAX_CONCURRENCY) as executor:
+            for entity_ids in _iter_entity_ids(query, datacatalog, attributes):
+                series = executor.map(lambda entity_id: _fetch_series(entity_id, attributes, params), entity_ids)
+
+                data = []
+                for entity_id, (index, columns) in zip(entity_ids, series):
+                    if not index and not any(columns.values()):
+                        continue
+                    entity: Dict[str, Any] = {"id": utils.get_id_from_fiware_id(entity_id), "timestamp": index}
+                    entity.update(columns)
+                    if query.context_per_entity():
+                        for property in datacatalog.catalog_context:
+                            entity[property.context_key] = property.context_value
+                    entity["data_catalog"] = datacatalog.id
+                    data.append(entity)
+                if data:
+                    yield data
+    except Exception as e:
+        raise exceptions.ODSException(f"Error retrieving time series data: {str(e)}")
+
+
+def _to_epoch_millis(index: list) -> np.ndarray:
+    return np.array(
+        [datetime.fromisoformat(str(timestamp).replace("Z", "+00:00")).timestamp() * 1000 for timestamp in index],
+        dtype=np.float64
+    )
+
+
+def _resample(timestamps: np.ndarray, values: list, start: float, step: float, size: int, fill: FillPolicy) -> np.ndarray:
+    """
+    Resamples a series onto a time grid. Each grid point takes the mean of the values observed
+    in [point, point + step), empty points are then filled according to the fill policy.
+    """
+    values = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    buckets = np.floor((timestamps - start) / step).astype(np.int64)
+    observed = (buckets >= 0) & (buckets < size) & ~np.isnan(values)
+    sums = np.bincount(buckets[observed], weights=values[observed], minlength=size)
+    counts = np.bincount(buckets[observed], minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        resampled = np.where(counts > 0, sums / counts, np.nan)
+
+    valid = ~np.isnan(resampled)
+    if fill == FillPolicy.FFILL:
+        # Position of the last valid point at or before each point
+        last_valid = np.maximum.accumulate(np.where(valid, np.arange(size), -1))
+        resampled = np.where(last_valid >= 0, resampled[np.maximum(last_valid, 0)], np.nan)
+    elif fill == FillPolicy.LINEAR and valid.any():
+        positions = np.arange(size)
+        resampled = np.interp(positions, positions[valid], resampled[valid], left=np.nan, right=np.nan)
+    return resampled
+
+
+def _get_grid(start: float, end: float, step: int) -> Tuple[float, int]:
+    # The grid is aligned to multiples of the step
+    start = np.floor(start / step) * step
+    return start, int((end - start) // step) + 1
+
+
+def _check_resample_size(total: int):
+    if total > config.RESAMPLE_MAX_POINTS:
+        raise exceptions.ODSException(config.Q400_RESAMPLE_TOO_LARGE.format(total, config.RESAMPLE_MAX_POINTS))
+
+
+def _estimate_resample_size(query: QueryRequest, datacatalog: DataCatalogCreate, attributes: List[str]):
+    """
+    Checks the size of the resampled table before retrieving any series, from the number of
+    matching entities and the grid of the time filter. Without both time bounds the grid
+    depends on the observed data, and the size is only checked once it is retrieved.
+    """
+    time_filter = query.time_filter
+    if not query.resample or not time_filter or time_filter.start_date is None or time_filter.end_date is None:
+        return
+    _, size = _get_grid(time_filter.start_date, time_filter.end_date, query.resample.step * 1000)
+    if size * len(attributes) <= config.RESAMPLE_MAX_POINTS:
+        entities = count_entities(
+            datacatalog.id, fields=attributes, id_pattern=_get_id_pattern(query, datacatalog),
+            geo_query=service_geoindex.get_geo_query(query, datacatalog)
+        )
+        entities = max(entities - service_pagination.get_offset(query), 0)
+        if query.limit:
+            entities = min(entities, query.limit)
+    else:
+        # Too large with a single entity, the entities are not counted
+        entities = 1
+    _check_resample_size(size * entities * len(attributes))
+
+
+def iter_resampled(query: QueryRequest, datacatalog: DataCatalogCreate) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Retrieves the time series of the queried entities resampled onto a common time grid, and
+    joins them into a single wide table: a `timestamp` column and one `{entity}.{attribute}`
+    column per entity and attribute. The grid spans the time filter, or the observed data
+    if the time filter does not bound it.
+
+    Args:
+        query (QueryRequest): The query parameters, including the resampling step and fill policy.
+        datacatalog (DataCatalogCreate): The time series catalog to query.
+
+    Yields:
+        List[Dict[str, Any]]: A single page with the wide table.
+
+    Raises:
+        exceptions.ODSException: If a requested attribute is not numeric, the grid is too large
+        (checked before retrieving the series when the time filter bounds it), or the data could
+        not be retrieved.
+    """
+    try:
+        attributes = []
+        for attribute in datacatalog.entities_context:
+            if query.fields and attribute.context_key not in query.fields:
+                continue
+            if attribute.context_type in [TypeAttribute.INTEGER, TypeAttribute.DOUBLE]:
+                attributes.append(attribute.context_key)
+            elif query.fields:
+                raise exceptions.ODSException(config.Q400_RESAMPLE_NOT_NUMERIC.format(attribute.context_key))
+        if not attributes:
+            return
+        _estimate_resample_size(query, datacatalog, attributes)
+
+        params = _get_ql_params(query.time_filter)
+        series = []
+        with ThreadPoolExecutor(max_workers=config.QL_MAX_CONCURRENCY) as executor:
+            for entity_ids in _iter_entity_ids(query, datacatalog, attributes):
+                for entity_id, (index, columns) in zip(entity_ids, executor.map(lambda entity_id: _fetch_series(entity_id, attributes, params), entity_ids)):
+                    if index:
+                        series.append((utils.get_id_from_fiware_id(entity_id), _to_epoch_millis(index), columns))
+        if not series:
+            return
+
+        step = query.resample.step * 1000
+        time_filter = query.time_filter or TimeFilter()
+        start = time_filter.start_date if time_filter.start_date is not None else min(timestamps.min() for _, timestamps, _ in series)
+        end = time_filter.end_date if time_filter.end_date is not None else max(timestamps.max() for _, timestamps, _ in series)
+        start, size = _get_grid(start, end, step)
+        _check_resample_size(size * len(series) * len(attributes))
+
+        grid = start + np.arange(size) * step
+        table: Dict[str, Any] = {"timestamp": [_to_iso_date(int(point)) for point in grid]}
+        for entity_id, timestamps, columns in series:
+            for attribute in attributes:
+                resampled = _resample(timestamps, columns[attribute], start, step, size, query.resample.fill)
+                table[f"{entity_id}.{attribute}"] = [None if np.isnan(value) else value for value in resampled.tolist()]
+        if query.context_per_entity():
+            for property in datacatalog.catalog_context:
+                table[property.context_key] = property.context_value
+        table["data_catalog"] = datacatalog.id
+        yield [table]
+    except exceptions.ODSException:
+        raise
+    except Exception as e:
+        raise exceptions.ODSException(f"Error resampling time series data: {str(e)}")
 
 
-def get_data(query: QueryRequest):
+def get_data(query: QueryRequest, datacatalog: DataCatalogCreate) -> Optional[List[Dict[str, Any]]]:
     """
-    Placeholder function for retrieving data from the catalog.
+    Retrieves the history of the entities of a time series catalog from QuantumLeap.
 
     Args:
-        query (QueryRequest): The query parameters for retrieving data.
+        query (QueryRequest): The query parameters, including the optional time filter.
+        datacatalog (DataCatalogCreate): The time series catalog to query.
 
     Returns:
-        None: Function is not implemented yet.
+        Optional[List[Dict[str, Any]]]: The time series of each entity, or None if there is no data.
     """
-    raise NotImplementedError()
+    data = [entity for page in iter_data(query, datacatalog) for entity in page]
+    return data if data else None
@@ -2,12 +2,57 @@ import config
 import re
 import io
 import csv
+import json
+from typing import List
 def get_property(value: object) -> dict:
     return {"type": "Property", "value": value}
 
 def get_relationship(relation_id: str) -> dict:
     return {"type": "Relationship", "object": relation_id}
 
+def check_position(position: object) -> List[float]:
+    """
+    Checks a [longitude, latitude] position, returning it as floats.
+
+    Raises:
+        ValueError: If the longitude is not in [-180, 180] or the latitude in [-90, 90].
+    """
+    lon, lat = float(position[0]), float(position[1])
+    # NaN fails both comparisons
+    if not (-180 <= lon <= 180 and -90 <= lat <= 90):
+        raise ValueError(f"Coordinates out of range (longitude in [-180, 180], latitude in [-90, 90]): {position}")
+    return [lon, lat, *position[2:]]
+
+def _check_positions(coordinates: object):
+    # The positions of a GeoJSON geometry are nested in lists, as deep as the geometry type requires
+    if isinstance(coordinates, (list, tuple)) and coordinates and not isinstance(coordinates[0], (list, tuple)):
+        check_position(coordinates)
+    elif isinstance(coordinates, (list, tuple)):
+        for item in coordinates:
+            _check_positions(item)
+    else:
+        raise ValueError(f"Invalid coordinates: {coordinates}")
+
+def to_geojson(value: object) -> dict:
+    """
+    Converts a coordinate to a GeoJSON geometry. It accepts a GeoJSON geometry, a
+    [longitude, latitude] pair or a "longitude,latitude" string.
+
+    Raises:
+        ValueError: If the value is not a coordinate, or it is out of range.
+    """
+    if isinstance(value, dict) and "type" in value and "coordinates" in value:
+        _check_positions(value["coordinates"])
+        return value
+    if isinstance(value, str):
+        value = value.split(",")
+    if isinstance(value, (list, tuple)) and len(value) == 2:
+        return {"type": "Point", "coordinates": check_position(value)}
+    raise ValueError(f"Invalid coordinates: {value}")
+
+def get_geoproperty(value: object) -> dict:
+    return {"type": "GeoProperty", "value": to_geojson(value)}
+
 def get_internal_catalog_id(catalog_name: str, catalog_owner: str) -> str:
     return "{}:{}".format(catalog_owner, catalog_name)
 
@@ -47,6 +92,16 @@ def get_entity_id(catalog_id: str, data_owner: str = None, entity_id: str = None
 def get_full_user_id(user: str) -> str:
     return "{}:{}:{}".format(config.ORION_ENTITY_PREFIX, config.USER_ENTITY, user)
 
+def get_entity_id_pattern(catalog_id: str, entities: list) -> str:
+    """
+    Builds an Orion idPattern matching the catalog entities named by any of the patterns.
+    A pattern can match the entity name or the `owner:entity` ID returned by the queries.
+    """
+    if not entities:
+        return None
+    alternatives = "|".join(f"(?:[^:]+:)?(?:{entity})" for entity in entities)
+    return f"^{re.escape(config.ORION_ENTITY_PREFIX)}:{re.escape(catalog_id)}:(?:{alternatives})$"
+
 def get_full_subscription_id(catalog: str, service: str) -> str:
     return "{}:{}:{}:{}".format(config.ORION_ENTITY_PREFIX, config.SUBSCRIPTION_ENTITY,catalog, service)
 
@@ -58,47 +113,108 @@ def get_full_user_id(user: str) -> str:
     return "{}:{}:{}".format(config.ORION_ENTITY_PREFIX, config.USER_ENTITY, user)
 
 
-def json_to_csv(data: dict):
-    headers = []
-    values = []
-    for entry in data:
+def _get_value(field: object) -> object:
+    return field["value"] if type(field) == dict and "value" in field else field
+
+def _get_headers(page: list, headers: list = None) -> list:
+    headers = list(headers or [])
+    for entry in page:
         for key in entry:
-            headers.append(key)
-    for entry in data:
-        values.append((entry[key]["value"]
-                            if type(entry[key])==dict else entry[key]
-                        for key in headers))
+            if key not in headers:
+                headers.append(key)
+    return headers
+
+def _flush(output: io.StringIO) -> str:
+    content = output.getvalue()
+    output.seek(0)
+    output.truncate(0)
+    return content
+
+def iter_json_csv(pages, headers: list = None):
+    """
+    Renders pages of entities as CSV, one row per entity. The header is built from the given
+    headers and the keys of the first page, so each page is written as soon as it is available.
+    """
     output = io.StringIO()
     writer = csv.writer(output)
-    writer.writerow(headers)
-    writer.writerows(values)
-    content = output.getvalue()
+    header_written = False
+    for page in pages:
+        if not header_written:
+            headers = _get_headers(page, headers)
+            writer.writerow(headers)
+            header_written = True
+        for entry in page:
+            writer.writerow(_get_value(entry.get(key)) for key in headers)
+        yield _flush(output)
     output.close()
-    return content
+
+def iter_table_csv(pages, headers: list = None, chunk_rows: int = 1000):
+    """
+    Renders pages of table entities as CSV, pivoting the list fields of each entity into rows.
+    As in `iter_json_csv`, the header is the given headers and the keys of the first page: a key
+    that only appears in a later page is not written. The callers pass the columns of the catalog
+    definition, or render a single page (a resampled time series).
+    """
+    output = io.StringIO()
+    writer = csv.writer(output)
+    header_written = False
+    for page in pages:
+        if not header_written:
+            headers = _get_headers(page, headers)
+            writer.writerow(headers)
+            header_written = True
+        for entry in page:
+            values = {key: _get_value(entry[key]) for key in entry}
+            total_rows = max([len(value) for value in values.values() if type(value) == list], default=0)
+            for index in range(0, total_rows):
+                writer.writerow(
+                    (values[key][index] if index < len(values[key]) else None) if type(values.get(key)) == list
+                    else values.get(key)
+                    for key in headers
+                )
+                if (index + 1) % chunk_rows == 0:
+                    yield _flush(output)
+        yield _flush(output)
+    output.close()
+
+def iter_ndjson(pages):
+    """
+    Renders pages of entities as newline delimited JSON, one entity per line.
+    """
+    for page in pages:
+        yield "".join(json.dumps(entry, default=str) + "\n" for entry in page)
+
+def csv_preamble(metadata: dict) -> str:
+    """
+    Renders metadata as commented lines, to be written before the CSV header.
+    """
+    return "".join(f"# {key}: {json.dumps(value, default=str)}\n" for key, value in metadata.items())
+
+def json_to_csv(data: dict):
+    return "".join(iter_json_csv([data]))
 
 def table_to_csv(data: dict):
-    headers = []
-    values = []
-    array_fields = []
-    for entry in data:
-        for key in entry:
-            if type(data[0][key]) == dict and type(data[0][key]["value"]) == list:
-                array_fields.append(key)
-            headers.append(key)
-
-    
-    for entry in data:
-        total_rows = len(entry[array_fields[0]]["value"])
-        for index in range(0, total_rows):
-            values.append((entry[key]["value"]
-                                if type(entry[key])==dict and type(entry[key]["value"])!=list 
-                                else entry[key]["value"][index] if type(entry[key])==dict and type(entry[key]["value"])==list
-                                else entry[key]
-                            for key in headers))
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(headers)
-        writer.writerows(values)
-        content = output.getvalue()
-        output.close()
-        return content
\ No newline at end of file
+    return "".join(iter_table_csv([data]))
+
+class ChunkSink(io.RawIOBase):
+    """Write-only file that keeps the written bytes until they are taken, to stream the output."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
@@ -0,0 +1,150 @@
+"""
+Settings of the unit tests. The services read their configuration from the environment when
+they are imported, so it is set here, before any module of the AccessModule is imported: the
+data of the tests is written to a temporary directory, and Orion and QuantumLeap are never
+reached (the tests replace the repository functions they call, or the `orion` fixture answers
+the requests to Orion from memory).
+
+    python -m pip install -r AccessModule/requirements-dev.txt
+    python -m pytest AccessModule/tests
+"""
+
+import os
+import sys
+import tempfile
+import threading
+
+import pytest
+
+SOURCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+DATA_PATH = tempfile.mkdtemp(prefix="ods-tests-")
+
+os.environ.update({
+    "ODS_DATA_PATH": DATA_PATH,
+    "FIWARE_FILES_PATH": os.path.join(DATA_PATH, "files"),
+    "FIWARE_CONTEXT_PATH": os.path.join(SOURCE_PATH, "..", "context"),
+    "ORION_URL": "http://orion.invalid",
+    "ORION_CONTEXT": "http://orion.invalid/context.json",
+    "QUANTUMLEAP_URL": "http://quantumleap.invalid",
+    "HOSTNAME": "http://accessmodule.invalid",
+})
+os.environ.pop("ACCESSMODULE_NOTIFY_URL", None)
+os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+sys.path.insert(0, SOURCE_PATH)
+
+
+class OrionResponse:
+    """Response of the in-memory Orion, with the attributes of `requests.Response` read by the repository."""
+
+    def __init__(self, status_code: int, body=None, headers: dict = None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.body = body
+        self.headers = headers or {}
+
+    def json(self):
+        return self.body
+
+
+class FakeOrion:
+    """
+    In-memory Orion answering the NGSI-LD requests sent by `repository.fiware`, so the tests run
+    the services and routers unchanged. The entities are stored as they are upserted, and the
+    queries support the filters the AccessModule sends (type, idPattern, attrs, name~= and pagination).
+    """
+
+    def __init__(self):
+        import config
+
+        self.config = config
+        self.entities = {}
+        self.subscriptions = []
+
+    def add(self, *entities: dict):
+        for entity in entities:
+            self.entities[entity["id"]] = {key: value for key, value in entity.items() if key != "@context"}
+
+    def add_catalog(self, catalog):
+        """Store a data catalog (a `DataCatalogCreate`), as `services.datacatalog.create_catalog` does."""
+        self.add(catalog.datacatalog_to_fiware())
+
+    def _path(self, url: str) -> str:
+        from urllib.parse import unquote
+
+        return unquote(url[len(self.config.ORION_URL):])
+
+    @staticmethod
+    def _key_values(entity: dict) -> dict:
+        return {
+            key: value.get("object", value.get("value")) if isinstance(value, dict) and "type" in value else value
+            for key, value in entity.items()
+        }
+
+    @staticmethod
+    def _matches(entity: dict, condition: str) -> bool:
+        import re
+
+        key, _, pattern = condition.partition("~=")
+        value = entity.get(key, {})
+        value = value.get("value") if isinstance(value, dict) else value
+        return value is not None and re.search(pattern, str(value)) is not None
+
+    def get(self, url: str, params=None, headers=None, **kwargs) -> OrionResponse:
+        import re
+
+        path = self._path(url)
+        if path != self.config.ORION_PATH_GET:
+            entity = self.entities.get(path[len(self.config.ORION_PATH_GET) + 1:])
+            return OrionResponse(200, dict(entity)) if entity else OrionResponse(404)
+        params = dict(params or [])
+        found = [entity for entity in self.entities.values() if entity["type"] == params["type"]]
+        if "idPattern" in params:
+            found = [entity for entity in found if re.search(params["idPattern"], entity["id"])]
+        if "q" in params:
+            found = [entity for entity in found if any(self._matches(entity, condition) for condition in params["q"].split("|"))]
+        headers = {"NGSILD-Results-Count": str(len(found))} if params.get("count") == "true" else {}
+        offset = int(params.get("offset", 0))
+        found = found[offset:offset + int(params.get("limit", 20))]
+        if "attrs" in params:
+            attrs = {"id", "type", *params["attrs"].split(",")}
+            found = [{key: value for key, value in entity.items() if key in attrs} for entity in found]
+        if params.get("options") == "keyValues":
+            found = [self._key_values(entity) for entity in found]
+        return OrionResponse(200, found, headers)
+
+    def post(self, url: str, json=None, headers=None, **kwargs) -> OrionResponse:
+        path = self._path(url)
+        if path == self.config.ORION_PATH_SUBSCRIBE:
+            self.subscriptions.append(json)
+            return OrionResponse(201)
+        self.add(*json)
+        return OrionResponse(201, [entity["id"] for entity in json])
+
+    def delete(self, url: str, **kwargs) -> OrionResponse:
+        entity_id = self._path(url)[len(self.config.ORION_PATH_DELETE.format("")):]
+        return OrionResponse(204) if self.entities.pop(entity_id, None) else OrionResponse(404)
+
+
+@pytest.fixture
+def orion(monkeypatch, tmp_path) -> FakeOrion:
+    """
+    Replace Orion with an in-memory one. The local state of the AccessModule (change counters,
+    snapshots, file store and index, query cache) is also isolated in a temporary directory.
+    """
+    import config
+    import repository.fiware as fiware_repository
+    import services.cache as service_cache
+    import services.fileindex as service_fileindex
+
+    fake = FakeOrion()
+    monkeypatch.setattr(fiware_repository, "requests", fake)
+    monkeypatch.setattr(config, "CHANGES_PATH", str(tmp_path / "changes"))
+    monkeypatch.setattr(config, "SNAPSHOT_PATH", str(tmp_path / "snapshots"))
+    monkeypatch.setattr(config, "EVENTS_PATH", str(tmp_path / "events"))
+    monkeypatch.setattr(config, "FIWARE_FILE_PATH", str(tmp_path / "files"))
+    monkeypatch.setattr(config, "FILE_INDEX_PATH", str(tmp_path / "files" / ".index.sqlite"))
+    monkeypatch.setattr(service_fileindex, "_local", threading.local())
+    monkeypatch.setattr(service_cache, "query_cache", service_cache.QueryCache(
+        config.QUERY_CACHE_MAX_BYTES, config.QUERY_CACHE_MAX_ENTRY_BYTES
+    ))
+    return fake
@@ -0,0 +1,60 @@
+import os
+import time
+
+import pytest
+
+import services.changes as service_changes
+
+CATALOG_ID = "owner:catalog"
+
+
+@pytest.fixture(autouse=True)
+def changes_path(monkeypatch, tmp_path):
+    monkeypatch.setattr(service_changes.config, "CHANGES_PATH", str(tmp_path))
+    monkeypatch.setattr(service_changes, "_listeners", [])
+    return tmp_path
+
+
+def test_mark_changed():
+    assert service_changes.mark_changed(CATALOG_ID) == 1
+    assert service_changes.mark_changed(CATALOG_ID) == 2
+    assert service_changes.get_version(CATALOG_ID)[0] == 2
+
+
+def test_untracked_catalog_is_not_stored(changes_path):
+    assert service_changes.get_version("owner:missing") == (0, 0.0)
+    assert os.listdir(changes_path) == []
+
+
+def test_tracked_catalog():
+    service_changes.track(CATALOG_ID)
+    version, changed_at = service_changes.get_version(CATALOG_ID)
+    assert version == 0 and changed_at == pytest.approx(time.time(), abs=5)
+    # Tracking again keeps the counter
+    service_changes.mark_changed(CATALOG_ID)
+    service_changes.track(CATALOG_ID)
+    assert service_changes.get_version(CATALOG_ID)[0] == 1
+
+
+def test_expired_counter_is_increased(monkeypatch):
+    changed = []
+    monkeypatch.setattr(service_changes, "_listeners", [changed.append])
+    service_changes.track(CATALOG_ID)
+    path = service_changes._version_path(CATALOG_ID)
+    stale = time.time() - service_changes.config.CHANGES_MAX_AGE - 10
+    os.utime(path, (stale, stale))
+    version, changed_at = service_changes.get_version(CATALOG_ID)
+    assert version == 1 and changed_at > stale
+    assert changed == [CATALOG_ID]
+    # Not expired again until CHANGES_MAX_AGE
+    assert service_changes.get_version(CATALOG_ID)[0] == 1
+
+
+def test_expired_counter_changes_the_validators(monkeypatch):
+    import services.conditional as service_conditional
+
+    monkeypatch.setattr(service_changes.config, "CHANGES_MAX_AGE", 0.05)
+    service_changes.track(CATALOG_ID)
+    etag, _ = service_conditional.get_query_validators(CATALOG_ID, "query")
+    time.sleep(0.1)
+    assert service_conditional.get_query_validators(CATALOG_ID, "query")[0] != etag
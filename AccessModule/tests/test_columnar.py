@@ -0,0 +1,24 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import services.columnar as service_columnar
+
+EXPECTED = datetime(2023, 11, 14, 22, 13, 20, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize("value", [
+    1700000000, 1700000000.0, 1700000000000, "1700000000", "1700000000000",
+    "2023-11-14T22:13:20Z", "2023-11-14T22:13:20+00:00",
+])
+def test_to_datetime(value):
+    assert service_columnar._to_datetime(value) == EXPECTED
+
+
+def test_to_datetime_before_epoch():
+    assert service_columnar._to_datetime("-86400") == datetime(1969, 12, 31, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize("value", [None, "", "yesterday", "1700000000x", float("nan"), 10 ** 20, "9" * 30])
+def test_to_datetime_invalid(value):
+    assert service_columnar._to_datetime(value) is None
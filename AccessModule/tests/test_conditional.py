@@ -0,0 +1,83 @@
+from email.utils import formatdate
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import config
+import services.conditional as service_conditional
+import services.datacatalog as service_datacatalog
+from exceptions import ODSException
+from routers.datacatalog import datacatalog_router
+from routers.query import query_router
+
+ETAG = '"abc"'
+LAST_MODIFIED = 1700000000.0
+
+
+@pytest.mark.parametrize("if_none_match, expected", [
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"other", "abc"', True),
+    ("*", True),
+    ('"other"', False),
+    ("", False),
+])
+def test_if_none_match(if_none_match, expected):
+    assert service_conditional.is_not_modified(ETAG, LAST_MODIFIED, if_none_match, None) is expected
+
+
+@pytest.mark.parametrize("if_modified_since, expected", [
+    (formatdate(LAST_MODIFIED, usegmt=True), True),
+    (formatdate(LAST_MODIFIED + 60, usegmt=True), True),
+    (formatdate(LAST_MODIFIED - 60, usegmt=True), False),
+    ("not a date", False),
+])
+def test_if_modified_since(if_modified_since, expected):
+    assert service_conditional.is_not_modified(ETAG, LAST_MODIFIED, None, if_modified_since) is expected
+
+
+def test_if_modified_since_ignores_fractions_of_second():
+    # Last-Modified is sent with a precision of seconds
+    date = formatdate(LAST_MODIFIED, usegmt=True)
+    assert service_conditional.is_not_modified(ETAG, LAST_MODIFIED + 0.5, None, date)
+
+
+def test_if_none_match_takes_precedence_over_if_modified_since():
+    date = formatdate(LAST_MODIFIED, usegmt=True)
+    assert not service_conditional.is_not_modified(ETAG, LAST_MODIFIED, '"other"', date)
+
+
+def test_no_conditional_headers():
+    assert not service_conditional.is_not_modified(ETAG, LAST_MODIFIED, None, None)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    def get_catalog(catalog_id):
+        raise ODSException(config.C404_DATACATALOG_NOT_FOUND.format(catalog_id))
+
+    monkeypatch.setattr(service_datacatalog, "get_catalog", get_catalog)
+    app = FastAPI()
+    app.include_router(datacatalog_router, prefix="/datacatalog")
+    app.include_router(query_router, prefix="/query")
+    return TestClient(app)
+
+
+def test_missing_catalog_is_not_reported_as_unchanged(client):
+    response = client.get("/datacatalog/owner:deleted", headers={"If-None-Match": "*"})
+    assert response.status_code == 404
+
+
+def test_query_of_missing_catalog_is_not_reported_as_unchanged(client):
+    response = client.post("/query/", json={"catalog_id": "owner:deleted", "entities": [], "fields": []},
+                           headers={"If-None-Match": "*"})
+    assert response.status_code == 400
+
+
+def test_unchanged_catalog_is_not_modified(client, monkeypatch):
+    from schemas import DataCatalogCreate
+
+    monkeypatch.setattr(service_datacatalog, "get_catalog", lambda catalog_id: DataCatalogCreate.empty_datacatalog())
+    etag = client.get("/datacatalog/owner:catalog").headers["ETag"]
+    assert client.get("/datacatalog/owner:catalog", headers={"If-None-Match": etag}).status_code == 304
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+import services.filemigration as service_filemigration
+import services.files as service_files
+
+CATALOG_ID = "owner:files"
+
+
+@pytest.fixture
+def moves(monkeypatch, tmp_path):
+    moves = []
+    monkeypatch.setattr(service_filemigration.config, "FIWARE_FILE_PATH", str(tmp_path))
+    monkeypatch.setattr(service_filemigration.config, "FILE_LAYOUT", service_files.SHARDED_LAYOUT)
+    monkeypatch.setattr(service_filemigration.service_fileindex, "move", lambda *args: moves.append(args))
+    return moves
+
+
+def _write(path: str, content: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        file.write(content)
+
+
+def _read(path: str) -> str:
+    with open(path) as file:
+        return file.read()
+
+
+def test_flat_file_is_moved(moves):
+    flat = service_files.get_storage_path(CATALOG_ID, "owner", "report.pdf", "flat")
+    _write(flat, "v1")
+    stats = service_filemigration.migrate()
+    assert stats["moved"] == 1 and stats["replaced"] == 0
+    target = service_files.get_storage_path(CATALOG_ID, "owner", "report.pdf")
+    assert _read(target) == "v1" and not os.path.exists(flat)
+    assert moves == [(CATALOG_ID, "owner", "report.pdf", flat, target)]
+
+
+def test_replaced_file_is_not_repointed(moves):
+    flat = service_files.get_storage_path(CATALOG_ID, "owner", "report.pdf", "flat")
+    target = service_files.get_storage_path(CATALOG_ID, "owner", "report.pdf")
+    _write(flat, "v1")
+    _write(target, "v2")
+    stats = service_filemigration.migrate()
+    assert stats["moved"] == 0 and stats["replaced"] == 1
+    assert _read(target) == "v2" and not os.path.exists(flat)
+    assert moves == []
+
+
+def test_old_copy_removed_meanwhile(moves, monkeypatch):
+    flat = service_files.get_storage_path(CATALOG_ID, "owner", "report.pdf", "flat")
+    _write(flat, "v1")
+    link = os.link
+
+    def link_and_remove(source, target):
+        link(source, target)
+        os.remove(source)
+
+    monkeypatch.setattr(service_filemigration.os, "link", link_and_remove)
+    assert service_filemigration.migrate()["moved"] == 1
@@ -0,0 +1,150 @@
+import io
+import os
+import zipfile
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import config
+import services.fileindex as service_fileindex
+import services.files as service_files
+from routers.download import download_router
+from routers.insert import inserdata_router
+from schemas import DataCatalogCreate, TypeCatalog, User
+from services.auth import get_current_active_user
+
+CATALOG_ID = "files"
+OWNER = "owner"
+
+
+@pytest.fixture
+def stored(orion):
+    entity_id = service_files.utils.get_entity_id(CATALOG_ID, OWNER, "report")
+    orion.add({"id": entity_id, "type": CATALOG_ID, config.FIWARE_FILENAME_PROPERTY: {"type": "Property", "value": "report.txt"}})
+    file_path = service_files.resolve_path(CATALOG_ID, OWNER, "report")
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "w") as file:
+        file.write("report")
+    return entity_id, file_path
+
+
+@pytest.fixture
+def client(orion):
+    catalog = DataCatalogCreate.empty_datacatalog()
+    catalog.id, catalog.name, catalog.owner, catalog.type = f"{OWNER}:{CATALOG_ID}", CATALOG_ID, OWNER, TypeCatalog.FILE
+    orion.add_catalog(catalog)
+    app = FastAPI()
+    app.include_router(inserdata_router, prefix="/insert")
+    app.include_router(download_router, prefix="/download")
+    app.dependency_overrides[get_current_active_user] = lambda: User(username=OWNER)
+    return TestClient(app)
+
+
+def _upload(client, entity: str, filename: str, content: bytes):
+    response = client.post("/insert/file", files={"file": (filename, content)},
+                           data={"datacatalog": f"{OWNER}:{CATALOG_ID}", "entity": entity, "metadata": "{}", "tags": ["test"]})
+    assert response.status_code == 200
+
+
+def test_get_file_path_indexes_the_file_of_the_entity(stored):
+    _, file_path = stored
+
+    assert service_files.get_file_path(CATALOG_ID, OWNER, "report") == (file_path, "report.txt", None)
+    record = service_fileindex.get(CATALOG_ID, OWNER, "report")
+    assert (record.path, record.filename) == (file_path, "report.txt")
+
+
+def test_get_file_path_serves_the_indexed_file(stored):
+    _, file_path = stored
+    service_fileindex.put(CATALOG_ID, OWNER, "report", file_path, "indexed.txt")
+
+    assert service_files.get_file_path(CATALOG_ID, OWNER, "report") == (file_path, "indexed.txt", None)
+
+
+def test_get_file_path_drops_the_indexed_file_of_a_deleted_entity(stored, orion):
+    entity_id, file_path = stored
+    service_fileindex.put(CATALOG_ID, OWNER, "report", file_path, "report.txt")
+    del orion.entities[entity_id]
+
+    with pytest.raises(service_files.exceptions.ODSException):
+        service_files.get_file_path(CATALOG_ID, OWNER, "report")
+    assert service_fileindex.get(CATALOG_ID, OWNER, "report") is None
+
+
+def test_download_of_a_deleted_entity_is_not_found(stored, orion, client):
+    entity_id, _ = stored
+    assert client.get(f"/download/{CATALOG_ID}/{OWNER}/report").content == b"report"
+
+    del orion.entities[entity_id]
+    response = client.get(f"/download/{CATALOG_ID}/{OWNER}/report")
+    assert response.status_code == 404
+    assert response.json()["detail"] == config.F404_FILE_NOT_FOUND
+
+
+def test_uploaded_file_is_downloaded_by_ranges(client):
+    _upload(client, "sample", "sample.bin", bytes(range(100)))
+    url = f"/download/{OWNER}:{CATALOG_ID}/{OWNER}/sample"
+
+    whole = client.get(url)
+    assert whole.status_code == 200
+    assert whole.content == bytes(range(100))
+    assert whole.headers["accept-ranges"] == "bytes"
+
+    part = client.get(url, headers={"Range": "bytes=10-19"})
+    assert part.status_code == 206
+    assert part.content == bytes(range(10, 20))
+    assert part.headers["content-range"] == "bytes 10-19/100"
+
+    assert client.get(url, headers={"Range": "bytes=200-"}).status_code == 416
+
+
+def test_ranges_of_a_changed_file_send_the_whole_file(client):
+    _upload(client, "sample", "sample.bin", b"first version")
+    url = f"/download/{OWNER}:{CATALOG_ID}/{OWNER}/sample"
+    etag = client.get(url).headers["etag"]
+
+    assert client.get(url, headers={"Range": "bytes=0-4", "If-Range": etag}).content == b"first"
+    os.utime(service_files.resolve_path(f"{OWNER}:{CATALOG_ID}", OWNER, "sample"), (0, 0))
+    response = client.get(url, headers={"Range": "bytes=0-4", "If-Range": etag})
+    assert response.status_code == 200
+    assert response.content == b"first version"
+
+
+def test_compressible_upload_is_stored_compressed(client, monkeypatch):
+    monkeypatch.setattr(config, "FILE_COMPRESSION", "zstd")
+    content = b"time,value\n" + b"".join(f"{index},{index * 2}\n".encode() for index in range(1000))
+    _upload(client, "series", "series.csv", content)
+    url = f"/download/{OWNER}:{CATALOG_ID}/{OWNER}/series"
+
+    with open(service_files.resolve_path(f"{OWNER}:{CATALOG_ID}", OWNER, "series"), "rb") as file:
+        stored = file.read()
+    assert len(stored) < len(content)
+    assert service_files.service_compression.zstd.ZstdDecompressor().decompressobj().decompress(stored) == content
+
+    encoded = client.get(url, headers={"Accept-Encoding": "zstd"})
+    assert encoded.headers["content-encoding"] == "zstd"
+    assert encoded.headers["vary"] == "Accept-Encoding"
+
+    decoded = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in decoded.headers
+    assert decoded.content == content
+
+
+def test_catalog_files_are_downloaded_as_a_zip_archive(client, monkeypatch):
+    monkeypatch.setattr(config, "FILE_COMPRESSION", "zstd")
+    _upload(client, "report", "report.pdf", b"%PDF report")
+    _upload(client, "series", "series.csv", b"time,value\n0,1\n")
+    _upload(client, "other", "other.txt", b"other")
+
+    response = client.post(f"/download/{OWNER}:{CATALOG_ID}", json={"entities": ["report", "series"], "compression": "deflated"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert {name: archive.read(name) for name in archive.namelist()} == {
+            f"{OWNER}/report/report.pdf": b"%PDF report",
+            f"{OWNER}/series/series.csv": b"time,value\n0,1\n",
+        }
+
+    missing = client.post(f"/download/{OWNER}:{CATALOG_ID}", json={"entities": ["missing"]})
+    assert missing.status_code == 404
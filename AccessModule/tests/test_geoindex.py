@@ -0,0 +1,139 @@
+import pytest
+
+import services.geoindex as service_geoindex
+import utils
+from exceptions import ODSException
+from schemas import GeoFilter, NearFilter
+
+CATALOG_ID = "owner:places"
+
+
+def _point(lon: float, lat: float) -> dict:
+    return {"type": "Point", "coordinates": [lon, lat]}
+
+
+@pytest.fixture
+def index():
+    index = service_geoindex.GridIndex(version=1, cell_size=0.1)
+    # Barcelona, Girona, Madrid and a point on the cell boundary
+    for name, lon, lat in [("bcn", 2.17, 41.38), ("gir", 2.82, 41.98), ("mad", -3.70, 40.42), ("edge", 2.2, 41.4)]:
+        index.add({"id": name, "location": _point(lon, lat)}, lon, lat)
+    return index
+
+
+@pytest.fixture(autouse=True)
+def clean_state(monkeypatch):
+    monkeypatch.setattr(service_geoindex, "_indexes", service_geoindex.OrderedDict())
+    monkeypatch.setattr(service_geoindex, "_unindexable", service_geoindex.OrderedDict())
+    monkeypatch.setattr(service_geoindex, "_building", set())
+    monkeypatch.setattr(service_geoindex.service_changes, "get_version", lambda catalog_id: (7, None))
+
+
+def test_search_bbox(index):
+    found = [entity["id"] for entity in index.search_bbox(2.0, 41.0, 3.0, 42.0)]
+    assert found == ["bcn", "gir", "edge"]
+
+
+def test_search_bbox_includes_the_boundary(index):
+    assert [entity["id"] for entity in index.search_bbox(2.2, 41.4, 2.2, 41.4)] == ["edge"]
+
+
+def test_search_bbox_covering_more_cells_than_occupied(index):
+    found = [entity["id"] for entity in index.search_bbox(-180, -90, 180, 90)]
+    assert found == ["bcn", "gir", "mad", "edge"]
+
+
+def test_search_near(index):
+    # Barcelona to Girona is about 88 km
+    assert [entity["id"] for entity in index.search_near(2.17, 41.38, 5000)] == ["bcn", "edge"]
+    assert [entity["id"] for entity in index.search_near(2.17, 41.38, 100000)] == ["bcn", "gir", "edge"]
+
+
+def test_distance():
+    assert service_geoindex._distance(2.17, 41.38, 2.82, 41.98) == pytest.approx(87500, rel=0.02)
+
+
+@pytest.mark.parametrize("geo_filter", [
+    GeoFilter(bbox=[-181, 0, 10, 10]),
+    GeoFilter(bbox=[0, -91, 10, 10]),
+    GeoFilter(bbox=[0, 0, 10, 91]),
+    GeoFilter(bbox=[10, 0, 0, 10]),
+    GeoFilter(bbox=[0, 10, 10, 0]),
+    GeoFilter(near=NearFilter(point=[200, 0], max_distance=10)),
+    GeoFilter(near=NearFilter(point=[0, float("nan")], max_distance=10)),
+])
+def test_invalid_geo_filter(geo_filter):
+    with pytest.raises(ODSException):
+        service_geoindex.check_geo_filter(geo_filter)
+
+
+def test_valid_geo_filter():
+    service_geoindex.check_geo_filter(GeoFilter(bbox=[-180, -90, 180, 90]))
+    service_geoindex.check_geo_filter(GeoFilter(near=NearFilter(point=[2.17, 41.38], max_distance=10)))
+
+
+@pytest.mark.parametrize("value", ["2.17,41.38", [2.17, 41.38], (2.17, 41.38), _point(2.17, 41.38)])
+def test_to_geojson(value):
+    assert utils.to_geojson(value)["coordinates"] == [2.17, 41.38]
+
+
+@pytest.mark.parametrize("value", [
+    "181,0", [0, 91], [0, -90.5], "a,b", [1, 2, 3], _point(0, 100),
+    {"type": "Polygon", "coordinates": [[[0, 0], [0, 1], [200, 1], [0, 0]]]},
+])
+def test_to_geojson_rejects_invalid_coordinates(value):
+    with pytest.raises(ValueError):
+        utils.to_geojson(value)
+
+
+def test_unindexable_catalog_is_not_scanned_again(monkeypatch):
+    scans = []
+
+    def iter_entity_pages(catalog_id):
+        scans.append(catalog_id)
+        yield [{"id": "area", "location": {"type": "Polygon", "coordinates": [[[0, 0], [0, 1], [1, 1], [0, 0]]]}}]
+
+    monkeypatch.setattr(service_geoindex, "iter_entity_pages", iter_entity_pages)
+    service_geoindex._build_index(CATALOG_ID, "location")
+    assert scans == [CATALOG_ID]
+
+    started = []
+    monkeypatch.setattr(service_geoindex, "_build_index", lambda *key: started.append(key))
+    for _ in range(3):
+        assert service_geoindex._get_index(CATALOG_ID, "location") is None
+    assert started == []
+
+    # Indexed again once the catalog changes
+    monkeypatch.setattr(service_geoindex.service_changes, "get_version", lambda catalog_id: (8, None))
+    service_geoindex._get_index(CATALOG_ID, "location")
+    assert started == [(CATALOG_ID, "location")]
+
+
+def test_failed_index_is_not_built_again(monkeypatch):
+    def iter_entity_pages(catalog_id):
+        raise RuntimeError("Orion is down")
+        yield
+
+    monkeypatch.setattr(service_geoindex, "iter_entity_pages", iter_entity_pages)
+    service_geoindex._build_index(CATALOG_ID, "location")
+    assert service_geoindex._unindexable[(CATALOG_ID, "location")] == 7
+    assert (CATALOG_ID, "location") not in service_geoindex._building
+
+
+def test_too_many_entities_are_not_indexed(monkeypatch):
+    monkeypatch.setattr(service_geoindex.config, "GEOINDEX_MAX_ENTITIES", 2)
+    monkeypatch.setattr(service_geoindex, "iter_entity_pages", lambda catalog_id: iter([[
+        {"id": f"e{index}", "location": _point(0, 0)} for index in range(3)
+    ]]))
+    service_geoindex._build_index(CATALOG_ID, "location")
+    assert not service_geoindex._indexes
+    assert service_geoindex._unindexable[(CATALOG_ID, "location")] == 7
+
+
+def test_points_are_indexed(monkeypatch):
+    monkeypatch.setattr(service_geoindex, "iter_entity_pages", lambda catalog_id: iter([[
+        {"id": "bcn", "location": _point(2.17, 41.38)}
+    ]]))
+    service_geoindex._build_index(CATALOG_ID, "location")
+    index = service_geoindex._get_index(CATALOG_ID, "location")
+    assert [entity["id"] for entity in index.search_bbox(2, 41, 3, 42)] == ["bcn"]
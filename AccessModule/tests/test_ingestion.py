@@ -0,0 +1,86 @@
+import os
+import time
+
+import pytest
+import requests
+
+import services.ingestion as service_ingestion
+from schemas import IngestionItemError, JobStatus
+
+CATALOG_ID = "owner:catalog"
+
+
+class _Response:
+    def __init__(self, status_code: int, content: dict = None):
+        self.status_code = status_code
+        self.content = content or {}
+
+    def json(self) -> dict:
+        return self.content
+
+
+@pytest.fixture(autouse=True)
+def spool(monkeypatch, tmp_path):
+    monkeypatch.setattr(service_ingestion.config, "INGESTION_SPOOL_PATH", str(tmp_path))
+    for directory in (service_ingestion._JOBS, service_ingestion._PENDING, service_ingestion._PROCESSING):
+        os.makedirs(tmp_path / directory)
+
+
+def _entity(name: str) -> dict:
+    return {"id": f"urn:ngsi-ld:{CATALOG_ID}:owner:{name}", "type": CATALOG_ID}
+
+
+def _run(monkeypatch, response: _Response, errors: list = ()) -> JobStatus:
+    monkeypatch.setattr(service_ingestion, "send_entity", lambda entities: response)
+    job = service_ingestion.submit_job(CATALOG_ID, "owner", [(0, _entity("e0")), (1, _entity("e1"))], list(errors))
+    service_ingestion._process_batch(service_ingestion._claim_batch())
+    return service_ingestion.get_job(job.id).status
+
+
+def test_stored_job_is_completed(monkeypatch):
+    assert _run(monkeypatch, _Response(204)) == JobStatus.COMPLETED
+
+
+def test_job_with_rejected_entities_is_partial(monkeypatch):
+    response = _Response(207, {"errors": [{"entityId": _entity("e1")["id"], "error": {"title": "Rejected"}}]})
+    assert _run(monkeypatch, response) == JobStatus.PARTIAL
+
+
+def test_job_with_invalid_items_is_partial(monkeypatch):
+    errors = [IngestionItemError(index=2, detail="Invalid entity")]
+    assert _run(monkeypatch, _Response(204), errors) == JobStatus.PARTIAL
+
+
+def test_rejected_job_is_failed(monkeypatch):
+    assert _run(monkeypatch, None) == JobStatus.FAILED
+
+
+def test_job_without_valid_entities_is_failed():
+    job = service_ingestion.submit_job(CATALOG_ID, "owner", [], [IngestionItemError(index=0, detail="Invalid entity")])
+    assert job.status == JobStatus.FAILED
+
+
+def test_worker_requeues_the_jobs_while_orion_is_unreachable(monkeypatch, caplog):
+    responses = [requests.ConnectionError("Orion is down"), _Response(204)]
+
+    def send_entity(entities):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr(service_ingestion, "send_entity", send_entity)
+    monkeypatch.setattr(service_ingestion.config, "INGESTION_RETRY_INTERVAL", 0)
+    job = service_ingestion.submit_job(CATALOG_ID, "owner", [(0, _entity("e0"))], [])
+    worker = service_ingestion.IngestionWorker()
+    worker.start()
+    try:
+        deadline = time.time() + 5
+        while service_ingestion.get_job(job.id).status != JobStatus.COMPLETED and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        worker.stop()
+        worker.join()
+
+    assert service_ingestion.get_job(job.id).status == JobStatus.COMPLETED
+    assert f"Ingestion batch of jobs {job.id} requeued" in caplog.text
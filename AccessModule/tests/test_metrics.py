@@ -0,0 +1,29 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import config
+import routers.metrics as router_metrics
+from routers.metrics import metrics_router
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(metrics_router, prefix="/metrics")
+    return TestClient(app)
+
+
+def test_metrics_are_rendered(client):
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+
+
+def test_metrics_are_not_found_without_prometheus_client(client, monkeypatch):
+    monkeypatch.setattr(router_metrics.metrics, "is_available", lambda: False)
+
+    response = client.get("/metrics")
+    assert response.status_code == 404
+    assert response.json()["detail"] == config.M404_METRICS_NOT_AVAILABLE
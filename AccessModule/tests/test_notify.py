@@ -0,0 +1,286 @@
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import config
+import services.datacatalog as service_datacatalog
+import services.events as service_events
+import services.notifications as service_notifications
+import services.subscription as service_subscription
+from exceptions import ODSException
+from routers.subscription import subscription_router
+from schemas import UserDB
+from services.auth import create_access_token
+
+TOKEN = "secret"
+
+
+def _entity(catalog_id: str, name: str = "e1") -> dict:
+    return {
+        "id": f"urn:ngsi-ld:{catalog_id}:owner:{name}",
+        "type": catalog_id,
+        "data_catalog": {"type": "Relationship", "object": f"urn:ngsi-ld:datacatalog:{catalog_id}"},
+        "a": {"type": "Property", "value": 1},
+    }
+
+
+@pytest.fixture
+def client(monkeypatch):
+    def get_catalog(catalog_id):
+        if catalog_id != "owner:known":
+            raise ODSException(config.C404_DATACATALOG_NOT_FOUND.format(catalog_id))
+
+    published, dispatched = [], []
+    monkeypatch.setattr(config, "ODS_NOTIFY_TOKEN", TOKEN)
+    monkeypatch.setattr(service_datacatalog, "get_catalog", get_catalog)
+    monkeypatch.setattr(service_subscription, "_known_catalogs", set())
+    monkeypatch.setattr(service_events, "publish", published.append)
+    monkeypatch.setattr(service_notifications, "dispatch", lambda notification: dispatched.append(notification) or 0)
+    app = FastAPI()
+    app.include_router(subscription_router, prefix="/subscription")
+    client = TestClient(app)
+    client.published, client.dispatched = published, dispatched
+    return client
+
+
+def test_notification_without_token_is_rejected(client):
+    response = client.post("/subscription/notify", json={"data": [_entity("owner:known")]})
+    assert response.status_code == 403
+    assert not client.published and not client.dispatched
+
+
+def test_notification_with_wrong_token_is_rejected(client):
+    response = client.post("/subscription/notify", json={"data": [_entity("owner:known")]},
+                           headers={config.ODS_NOTIFY_TOKEN_HEADER: "forged"})
+    assert response.status_code == 403
+
+
+def test_notifications_are_rejected_without_configured_token(client, monkeypatch):
+    monkeypatch.setattr(config, "ODS_NOTIFY_TOKEN", None)
+    response = client.post("/subscription/notify", json={"data": []}, headers={config.ODS_NOTIFY_TOKEN_HEADER: ""})
+    assert response.status_code == 403
+
+
+def test_notification_of_unknown_catalog_is_rejected(client):
+    response = client.post("/subscription/notify", json={"data": [_entity("owner:unknown")]},
+                           headers={config.ODS_NOTIFY_TOKEN_HEADER: TOKEN})
+    assert response.status_code == 400
+    assert not client.published and not client.dispatched
+
+
+def test_notification_with_mismatched_type_is_rejected(client):
+    entity = {**_entity("owner:known"), "type": "owner:other"}
+    response = client.post("/subscription/notify", json={"data": [entity]},
+                           headers={config.ODS_NOTIFY_TOKEN_HEADER: TOKEN})
+    assert response.status_code == 400
+
+
+def test_authenticated_notification_is_processed(client):
+    notification = {"data": [_entity("owner:known")]}
+    response = client.post("/subscription/notify", json=notification, headers={config.ODS_NOTIFY_TOKEN_HEADER: TOKEN})
+    assert response.status_code == 200
+    assert response.json()["changed"] == ["owner:known"]
+    assert client.published == [notification]
+    assert client.dispatched == [notification]
+
+
+def test_internal_subscription_carries_token(monkeypatch):
+    sent = []
+    monkeypatch.setattr(config, "ODS_NOTIFY_TOKEN", TOKEN)
+    monkeypatch.setattr(config, "ODS_NOTIFY_URL", "http://accessmodule/subscription/notify")
+    monkeypatch.setattr(service_subscription.fiware_repository, "subscribe", sent.append)
+    monkeypatch.setattr(service_subscription, "_subscribed_catalogs", set())
+    service_subscription.ensure_internal_subscription("owner:known")
+    assert sent[0]["notification"]["endpoint"]["receiverInfo"] == [
+        {"key": config.ODS_NOTIFY_TOKEN_HEADER, "value": TOKEN}
+    ]
+
+
+def test_internal_subscription_is_sent_once_per_process(monkeypatch):
+    sent = []
+    monkeypatch.setattr(config, "ODS_NOTIFY_URL", "http://accessmodule/subscription/notify")
+    monkeypatch.setattr(service_subscription.fiware_repository, "subscribe", sent.append)
+    monkeypatch.setattr(service_subscription, "_subscribed_catalogs", set())
+    for _ in range(3):
+        service_subscription.ensure_internal_subscription("owner:known")
+    service_subscription.ensure_internal_subscription("owner:other")
+    assert [subscription["entities"] for subscription in sent] == [[{"type": "owner:known"}], [{"type": "owner:other"}]]
+
+
+class _OrionResponse:
+    ok = True
+    status_code = 201
+
+    def __init__(self, content=None):
+        self.content = content
+
+    def json(self):
+        return self.content
+
+
+def test_created_catalog_receives_notifications(monkeypatch):
+    from routers.datacatalog import datacatalog_router
+    from services.auth import get_current_active_user
+    from schemas import User
+
+    # Orion, as seen by the AccessModule: the stored catalogs and subscriptions
+    catalogs, subscriptions, published = {}, [], []
+
+    def send_entity(entities):
+        catalogs.update({entity["id"]: entity for entity in entities})
+        return _OrionResponse({})
+
+    def get_datacatalog(catalog_id):
+        return _OrionResponse(catalogs[catalog_id]) if catalog_id in catalogs else None
+
+    def subscribe(subscription):
+        subscriptions.append(subscription)
+        return _OrionResponse()
+
+    monkeypatch.setattr(config, "ODS_NOTIFY_TOKEN", TOKEN)
+    monkeypatch.setattr(config, "ODS_NOTIFY_URL", "http://accessmodule/subscription/notify")
+    monkeypatch.setattr(service_datacatalog.fiware_repository, "send_entity", send_entity)
+    monkeypatch.setattr(service_datacatalog.fiware_repository, "get_datacatalog", get_datacatalog)
+    monkeypatch.setattr(service_datacatalog.fiware_repository, "subscribe", subscribe)
+    monkeypatch.setattr(service_subscription, "_known_catalogs", set())
+    monkeypatch.setattr(service_subscription, "_subscribed_catalogs", set())
+    monkeypatch.setattr(service_events, "publish", published.append)
+    monkeypatch.setattr(service_notifications, "dispatch", lambda notification: 0)
+    app = FastAPI()
+    app.include_router(datacatalog_router, prefix="/datacatalog")
+    app.include_router(subscription_router, prefix="/subscription")
+    app.dependency_overrides[get_current_active_user] = lambda: User(username="owner")
+    client = TestClient(app)
+
+    response = client.post("/datacatalog/", json={
+        "name": "sensors", "description": "Sensors", "is_public": False, "type": "GENERIC",
+        "tags": [], "catalog_context": [], "entities_context": []
+    })
+    assert response.status_code == 200
+    catalog_id = response.json()["id"]
+
+    # Orion sends the receiverInfo of the subscription as headers of its notifications
+    [subscription] = subscriptions
+    headers = {info["key"]: info["value"] for info in subscription["notification"]["endpoint"]["receiverInfo"]}
+    notification = {"data": [_entity(catalog_id)]}
+    response = client.post("/subscription/notify", json=notification, headers=headers)
+    assert response.status_code == 200
+    assert published == [notification]
+
+
+@pytest.fixture
+def subscriptions(monkeypatch):
+    from services.auth import get_current_active_user
+    from schemas import DataCatalogCreate, User
+
+    def get_catalog(catalog_id):
+        owner, _, name = catalog_id.partition(":")
+        return DataCatalogCreate(**{**DataCatalogCreate.empty_datacatalog().model_dump(), "id": catalog_id,
+                                    "owner": owner, "name": name, "is_public": name == "public"})
+
+    sent = []
+    monkeypatch.setattr(config, "ODS_NOTIFY_URL", None)
+    monkeypatch.setattr(service_datacatalog, "get_catalog", get_catalog)
+    monkeypatch.setattr(service_subscription.fiware_repository, "subscribe", lambda subscription: sent.append(subscription) or _OrionResponse())
+    app = FastAPI()
+    app.include_router(subscription_router, prefix="/subscription")
+    app.dependency_overrides[get_current_active_user] = lambda: User(username="user")
+    client = TestClient(app)
+    client.sent = sent
+    return client
+
+
+def _subscription(catalog_id: str) -> dict:
+    return {"subscription_name": "s1", "callback_url": "http://client/notify", "owners": None, "tags": None,
+            "catalog_id": catalog_id, "entities": None}
+
+
+def test_subscription_to_private_catalog_of_another_user_is_rejected(subscriptions):
+    response = subscriptions.post("/subscription/", json=_subscription("other:private"))
+    assert response.status_code == 403
+    assert subscriptions.sent == []
+
+
+@pytest.mark.parametrize("catalog_id", ["other:public", "user:private"])
+def test_subscription_to_accessible_catalog(subscriptions, catalog_id):
+    assert subscriptions.post("/subscription/", json=_subscription(catalog_id)).status_code == 200
+    assert len(subscriptions.sent) == 1
+
+
+def test_catalog_subscription_only_notifies_accessible_catalogs(subscriptions):
+    subscription = {"subscription_name": "s1", "callback_url": "http://client/notify", "owners": None, "tags": None,
+                    "types": None}
+    assert subscriptions.post("/subscription/", json=subscription).status_code == 200
+    assert subscriptions.sent[0]["q"] == f'public==true|owner=="{service_subscription.get_full_user_id("user")}"'
+
+
+def test_private_catalogs_are_only_dispatched_to_their_owner():
+    subscriber = service_notifications.Subscriber(id="s1", owner="user", catalog_id=config.CATALOG_ENTITY,
+                                                  callback_url="http://client/notify")
+
+    def catalog(catalog_id: str, public: bool) -> dict:
+        return {"id": f"urn:ngsi-ld:{config.CATALOG_ENTITY}:{catalog_id}", "public": {"type": "Property", "value": public}}
+
+    assert service_notifications._matches(subscriber, catalog("other:public", True), None)
+    assert service_notifications._matches(subscriber, catalog("user:private", False), None)
+    assert not service_notifications._matches(subscriber, catalog("other:private", False), None)
+
+
+def test_failed_delivery_is_logged_with_the_subscriber(monkeypatch, caplog):
+    class Response:
+        ok = False
+        status_code = 503
+
+    class Session:
+        def post(self, url, json, timeout):
+            return Response()
+
+    subscriber = service_notifications.Subscriber(id="s1", owner="user", catalog_id="owner:known",
+                                                  callback_url="http://client/notify")
+    monkeypatch.setattr(service_notifications, "_session", Session)
+
+    assert not service_notifications._deliver(subscriber, [_entity("owner:known")])
+    assert "Notification to subscriber s1 (http://client/notify) failed: HTTP 503" in caplog.text
+
+
+@pytest.fixture
+def streams(orion, monkeypatch):
+    for catalog_id, public in (("owner:live", False), ("other:private", False)):
+        catalog = service_datacatalog.DataCatalogCreate.empty_datacatalog()
+        catalog.id, catalog.owner, catalog.is_public = catalog_id, catalog_id.partition(":")[0], public
+        orion.add_catalog(catalog)
+    orion.add(UserDB(username="owner", company="company", hashed_password="hash").user_to_fiware())
+    monkeypatch.setattr(config, "ODS_NOTIFY_TOKEN", TOKEN)
+    monkeypatch.setattr(service_subscription, "_known_catalogs", set())
+    app = FastAPI()
+    app.include_router(subscription_router, prefix="/subscription")
+    return TestClient(app)
+
+
+def test_notified_changes_are_streamed_through_the_websocket(streams):
+    token = create_access_token({"sub": "owner"})
+    # The stream is resumed from the start of the log, so the notification can't be sent before it is followed
+    log_path = service_events._log_path("owner:live")
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    open(log_path, "ab").close()
+    last_event_id = f"{os.stat(log_path).st_ino}-0"
+
+    with streams.websocket_connect(f"/subscription/ws/owner:live?token={token}&last_event_id={last_event_id}") as websocket:
+        notification = {"type": "Notification", "data": [_entity("owner:live"), _entity("owner:live", "e2")]}
+        response = streams.post("/subscription/notify", json=notification, headers={"X-ODS-Notify-Token": TOKEN})
+        assert response.json()["changed"] == ["owner:live"]
+
+        message = websocket.receive_json()
+        assert message["id"]
+        assert [entity["id"] for entity in message["data"]] == ["urn:ngsi-ld:owner:live:owner:e1", "urn:ngsi-ld:owner:live:owner:e2"]
+
+
+def test_stream_of_a_private_catalog_of_another_user_is_closed(streams):
+    token = create_access_token({"sub": "owner"})
+
+    with pytest.raises(WebSocketDisconnect):
+        with streams.websocket_connect(f"/subscription/ws/other:private?token={token}"):
+            pass
@@ -0,0 +1,107 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import config
+import services.cache as service_cache
+import services.datacatalog as service_datacatalog
+import services.genericdata as service_genericdata
+import services.pagination as service_pagination
+from exceptions import ODSException
+from routers.query import query_router
+from schemas import DataCatalogCreate, QueryRequest
+
+CATALOG_ID = "owner:catalog"
+
+
+def _query(**kwargs) -> QueryRequest:
+    return QueryRequest(**{"catalog_id": CATALOG_ID, "entities": [], "fields": [], **kwargs})
+
+
+def test_query_without_cursor_starts_at_the_first_entity():
+    assert service_pagination.get_offset(_query(limit=10)) == 0
+    assert service_pagination.get_total(_query(limit=10), 1) is None
+
+
+def test_cursor_round_trip():
+    cursor = service_pagination.encode_cursor(CATALOG_ID, 20, 45, 3)
+    query = _query(limit=10, cursor=cursor)
+    assert service_pagination.get_offset(query) == 20
+    assert service_pagination.get_total(query, 3) == 45
+
+
+def test_total_is_not_reused_after_a_change():
+    query = _query(limit=10, cursor=service_pagination.encode_cursor(CATALOG_ID, 20, 45, 3))
+    assert service_pagination.get_total(query, 4) is None
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor", "e30", service_pagination.encode_cursor("owner:other", 10), service_pagination.encode_cursor(CATALOG_ID, -1),
+])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ODSException):
+        service_pagination.get_offset(_query(limit=10, cursor=cursor))
+
+
+def test_next_cursor():
+    cursor = service_pagination.get_next_cursor(_query(limit=10), 25, 3)
+    assert service_pagination.get_offset(_query(cursor=cursor)) == 10
+    assert service_pagination.get_next_cursor(_query(limit=10, cursor=cursor), 25, 3) is not None
+    last = _query(limit=10, cursor=service_pagination.encode_cursor(CATALOG_ID, 20, 25, 3))
+    assert service_pagination.get_next_cursor(last, 25, 3) is None
+    assert service_pagination.get_next_cursor(_query(), 25, 3) is None
+
+
+@pytest.fixture
+def client(monkeypatch):
+    entities = [{"id": f"urn:ngsi-ld:{CATALOG_ID}:owner:e{index}", "type": CATALOG_ID} for index in range(25)]
+    counts = []
+
+    def iter_entity_pages(type_id, offset=0, limit=None, **kwargs):
+        yield entities[offset:offset + limit]
+
+    def count_data(query, datacatalog):
+        counts.append(query.cursor)
+        return len(entities)
+
+    monkeypatch.setattr(service_datacatalog, "get_catalog", lambda catalog_id: DataCatalogCreate.empty_datacatalog())
+    monkeypatch.setattr(service_genericdata, "iter_entity_pages", iter_entity_pages)
+    monkeypatch.setattr(service_genericdata, "count_data", count_data)
+    monkeypatch.setattr(service_cache, "get", lambda query: (None, 0, None))
+    app = FastAPI()
+    app.include_router(query_router, prefix="/query")
+    client = TestClient(app)
+    client.counts = counts
+    return client
+
+
+def test_pages_are_counted_once(client):
+    query = {"catalog_id": CATALOG_ID, "entities": [], "fields": [], "output": "JSON", "limit": 10}
+    pages = []
+    while True:
+        response = client.post("/query/", json=query)
+        assert response.status_code == 200
+        pages.append(len(response.json()["data"]))
+        if not response.json()["next_cursor"]:
+            break
+        query["cursor"] = response.json()["next_cursor"]
+    assert pages == [10, 10, 5]
+    assert client.counts == [None]
+
+
+def test_next_cursor_header(client):
+    query = {"catalog_id": CATALOG_ID, "entities": [], "fields": [], "output": "CSV", "limit": 10}
+    response = client.post("/query/", json=query)
+    assert response.status_code == 200
+    cursor = response.headers[config.NEXT_CURSOR_HEADER]
+    assert "Link" not in response.headers
+    response = client.post("/query/", json={**query, "cursor": cursor})
+    assert len(response.text.splitlines()) == 11
+
+
+def test_cursor_past_the_end_returns_an_empty_page(client):
+    cursor = service_pagination.encode_cursor(CATALOG_ID, 30)
+    query = {"catalog_id": CATALOG_ID, "entities": [], "fields": [], "output": "JSON", "limit": 10, "cursor": cursor}
+    response = client.post("/query/", json=query)
+    assert response.status_code == 200
+    assert response.json()["data"] == [] and response.json()["next_cursor"] is None
@@ -0,0 +1,57 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import config
+import profiling
+import services.auth as service_auth
+from routers.admin import admin_router
+from schemas import UserDB
+
+
+def _headers(username: str, **headers) -> dict:
+    return {"Authorization": f"Bearer {service_auth.create_access_token({'sub': username})}", **headers}
+
+
+@pytest.fixture
+def client(orion, monkeypatch, tmp_path):
+    for username in ("admin", "user"):
+        orion.add(UserDB(username=username, company="company", hashed_password="hash").user_to_fiware())
+    monkeypatch.setattr(config, "ADMIN_USERS", ["admin"])
+    monkeypatch.setattr(config, "PROFILES_PATH", str(tmp_path / "profiles"))
+    app = FastAPI()
+    app.include_router(admin_router, prefix="/admin")
+    app.add_middleware(profiling.ProfilingMiddleware)
+    return TestClient(app)
+
+
+def test_flagged_request_of_an_admin_is_profiled(client):
+    profiled = client.get("/admin/profiles", headers=_headers("admin", **{"X-ODS-Profile": "1"}))
+    assert profiled.status_code == 200
+    profile_id = profiled.headers[profiling.PROFILE_ID_HEADER]
+
+    [profile] = client.get("/admin/profiles", headers=_headers("admin")).json()
+    assert (profile["id"], profile["method"], profile["path"], profile["user"], profile["status"]) == (
+        profile_id, "GET", "/admin/profiles", "admin", 200
+    )
+    stacks = client.get(f"/admin/profiles/{profile_id}", headers=_headers("admin"))
+    assert stacks.status_code == 200
+    assert stacks.headers["content-type"].startswith("text/plain")
+
+
+def test_profile_flag_in_the_query_string(client):
+    response = client.get("/admin/profiles?profile=1", headers=_headers("admin"))
+
+    assert profiling.PROFILE_ID_HEADER in response.headers
+
+
+def test_requests_are_not_profiled_without_the_flag_or_an_admin(client):
+    assert profiling.PROFILE_ID_HEADER not in client.get("/admin/profiles", headers=_headers("admin")).headers
+    other = client.get("/admin/profiles", headers=_headers("user", **{"X-ODS-Profile": "1"}))
+    assert other.status_code == 403
+    assert profiling.PROFILE_ID_HEADER not in other.headers
+    assert client.get("/admin/profiles", headers=_headers("admin")).json() == []
+
+
+def test_unknown_profile_is_not_found(client):
+    assert client.get("/admin/profiles/" + "0" * 32, headers=_headers("admin")).status_code == 404
@@ -0,0 +1,146 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from routers.insert import inserdata_router
+from routers.query import query_router
+from schemas import ContextDefinition, ContextValue, DataCatalogCreate, TypeAttribute, TypeCatalog, User
+from services.auth import get_current_active_user
+
+OWNER = "owner"
+CATALOG_ID = "owner:sensors"
+
+
+def _catalog(catalog_id: str, catalog_type: TypeCatalog, attributes: dict) -> DataCatalogCreate:
+    catalog = DataCatalogCreate.empty_datacatalog()
+    catalog.id, catalog.owner, catalog.type = catalog_id, OWNER, catalog_type
+    catalog.name = catalog_id.partition(":")[2]
+    catalog.catalog_context = [ContextValue(context_key="source", context_description="", context_value="station")]
+    catalog.entities_context = [
+        ContextDefinition(context_key=key, context_description="", context_type=attribute_type)
+        for key, attribute_type in attributes.items()
+    ]
+    return catalog
+
+
+@pytest.fixture
+def client(orion):
+    orion.add_catalog(_catalog(CATALOG_ID, TypeCatalog.GENERIC, {"temperature": TypeAttribute.INTEGER}))
+    app = FastAPI()
+    app.include_router(inserdata_router, prefix="/insert")
+    app.include_router(query_router, prefix="/query")
+    app.dependency_overrides[get_current_active_user] = lambda: User(username=OWNER)
+    client = TestClient(app)
+    for name, temperature in [("s1", 21), ("s2", 23), ("s3", 19)]:
+        entity = {"datacatalog_id": CATALOG_ID, "id": name, "tags": [], "temperature": temperature}
+        assert client.post("/insert/generic", json=entity).status_code == 200
+    return client
+
+
+def _query(client, **query):
+    return client.post("/query/", json={"catalog_id": CATALOG_ID, "entities": [], "fields": [], **query})
+
+
+def test_query_is_streamed_as_ndjson(client):
+    response = _query(client, output="NDJSON")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [(line["id"], line["temperature"], line["source"]) for line in lines] == [
+        ("owner:s1", 21, "station"), ("owner:s2", 23, "station"), ("owner:s3", 19, "station"),
+    ]
+    assert {line["data_catalog"] for line in lines} == {CATALOG_ID}
+
+
+def test_envelope_sends_the_catalog_context_once(client):
+    response = _query(client, output="JSON", envelope=True)
+
+    body = response.json()
+    assert body["catalog_id"] == CATALOG_ID
+    assert body["catalog_context"] == {"source": "station"}
+    assert [entity["id"] for entity in body["data"]] == ["owner:s1", "owner:s2", "owner:s3"]
+    assert all("source" not in entity for entity in body["data"])
+
+
+def test_envelope_is_the_first_ndjson_line(client):
+    lines = [json.loads(line) for line in _query(client, output="NDJSON", envelope=True).text.splitlines()]
+
+    assert lines[0] == {"catalog_id": CATALOG_ID, "catalog_context": {"source": "station"}}
+    assert [line["temperature"] for line in lines[1:]] == [21, 23, 19]
+    assert all("source" not in line for line in lines[1:])
+
+
+def test_envelope_is_a_csv_preamble(client):
+    lines = _query(client, output="CSV", envelope=True).text.splitlines()
+
+    assert lines[:2] == [f'# catalog_id: "{CATALOG_ID}"', '# catalog_context: {"source": "station"}']
+    assert "source" not in lines[2]
+    assert len(lines) == 6
+
+
+@pytest.fixture
+def table(client, orion):
+    catalog = _catalog("owner:readings", TypeCatalog.TABLE, {"city": TypeAttribute.STRING, "temperature": TypeAttribute.DOUBLE})
+    orion.add_catalog(catalog)
+    rows = "city,temperature\nBarcelona,21.5\nGirona,18\nLleida,24\nTarragona,22\n"
+    response = client.post("/insert/table", files={"file": ("readings.csv", rows.encode())},
+                           data={"datacatalog": catalog.id, "entity": "day1", "tags": ["test"]})
+    assert response.status_code == 200
+    return catalog.id
+
+
+def test_table_rows_are_filtered_and_sliced(client, table):
+    row_filter = {"predicates": [{"column": "temperature", "op": ">", "value": 20}], "offset": 1, "limit": 2}
+    response = _query(client, catalog_id=table, fields=["city"], row_filter=row_filter, output="JSON")
+
+    assert response.status_code == 200
+    [entity] = response.json()
+    assert entity["city"] == ["Lleida", "Tarragona"]
+    assert "temperature" not in entity
+
+
+def test_table_rows_are_filtered_with_a_list_of_values(client, table):
+    row_filter = {"predicates": [{"column": "city", "op": "in", "value": ["Girona", "Lleida"]}]}
+    [entity] = _query(client, catalog_id=table, row_filter=row_filter, output="JSON").json()
+
+    assert entity["city"] == ["Girona", "Lleida"]
+    assert entity["temperature"] == ["18", "24"]
+
+
+def test_table_predicate_on_an_unknown_column_is_rejected(client, table):
+    row_filter = {"predicates": [{"column": "humidity", "op": "=", "value": 1}]}
+
+    assert _query(client, catalog_id=table, row_filter=row_filter, output="JSON").status_code == 400
+
+
+def test_multi_query_merges_the_catalogs(client, table):
+    catalogs = [{"catalog_id": CATALOG_ID, "fields": ["temperature"]}, {"catalog_id": table, "fields": ["city"]}]
+    response = client.post("/query/multi", json={"catalogs": catalogs, "output": "JSON"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["errors"] == []
+    assert sorted((entity["data_catalog"], entity["id"]) for entity in body["data"]) == [
+        (table, "owner:day1"), (CATALOG_ID, "owner:s1"), (CATALOG_ID, "owner:s2"), (CATALOG_ID, "owner:s3"),
+    ]
+
+
+def test_multi_query_reports_a_failed_catalog_and_keeps_the_others(client, table):
+    row_filter = {"predicates": [{"column": "humidity", "op": "=", "value": 1}]}
+    catalogs = [{"catalog_id": CATALOG_ID}, {"catalog_id": table, "row_filter": row_filter}]
+    response = client.post("/query/multi", json={"catalogs": catalogs, "output": "NDJSON"})
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(line["id"] for line in lines if "error" not in line) == ["owner:s1", "owner:s2", "owner:s3"]
+    [error] = [line for line in lines if "error" in line]
+    assert error["data_catalog"] == table
+    assert "humidity" in error["error"]
+
+
+def test_multi_query_of_an_unknown_catalog_is_rejected(client):
+    catalogs = [{"catalog_id": CATALOG_ID}, {"catalog_id": "owner:missing"}]
+
+    assert client.post("/query/multi", json={"catalogs": catalogs}).status_code == 400
@@ -0,0 +1,94 @@
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+import responses
+
+SIZE = 1000
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", [(0, 99)]),
+    ("bytes=900-", [(900, 999)]),
+    ("bytes=-100", [(900, 999)]),
+    ("bytes=-2000", [(0, 999)]),
+    ("bytes=990-2000", [(990, 999)]),
+    ("bytes=0-0, 500-599", [(0, 0), (500, 599)]),
+    ("bytes=500-599, 0-9", [(0, 9), (500, 599)]),
+    ("bytes=0-99, 50-149, 150-199", [(0, 199)]),
+    ("BYTES = 0-9", [(0, 9)]),
+])
+def test_parse_range(header, expected):
+    assert responses.parse_range(header, SIZE) == expected
+
+
+@pytest.mark.parametrize("header", [
+    None, "", "items=0-9", "bytes=", "bytes=9-0", "bytes=a-9", "bytes=-", "bytes=0-9,", "bytes=5",
+])
+def test_parse_range_ignores_invalid_headers(header):
+    assert responses.parse_range(header, SIZE) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=2000-3000", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    assert responses.parse_range(header, SIZE) == []
+
+
+def test_parse_range_of_empty_file():
+    assert responses.parse_range("bytes=-10", 0) == []
+
+
+def test_parse_range_too_many_ranges(monkeypatch):
+    monkeypatch.setattr(responses.config, "DOWNLOAD_MAX_RANGES", 2)
+    assert responses.parse_range("bytes=0-1,3-4,6-7", SIZE) is None
+
+
+def test_content_disposition():
+    assert responses.content_disposition("data.csv") == 'attachment; filename="data.csv"'
+    assert responses.content_disposition("dades é.csv") == "attachment; filename*=utf-8''dades%20%C3%A9.csv"
+
+
+@pytest.fixture
+def client(tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(bytes(range(256)) * 4)
+    app = FastAPI()
+
+    @app.get("/file")
+    def get_file(request: Request):
+        return responses.RangeFileResponse(str(path), request.headers, filename="data.bin")
+
+    return TestClient(app)
+
+
+def test_whole_file(client):
+    response = client.get("/file")
+    assert response.status_code == 200
+    assert len(response.content) == 1024 and response.headers["accept-ranges"] == "bytes"
+
+
+def test_single_range(client):
+    response = client.get("/file", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.content == bytes(range(10, 20))
+    assert response.headers["content-range"] == "bytes 10-19/1024"
+
+
+def test_multiple_ranges(client):
+    response = client.get("/file", headers={"Range": "bytes=0-1, 10-11"})
+    assert response.status_code == 206
+    assert response.headers["content-type"].startswith("multipart/byteranges")
+    assert b"Content-Range: bytes 0-1/1024" in response.content and b"Content-Range: bytes 10-11/1024" in response.content
+
+
+def test_unsatisfiable_range(client):
+    response = client.get("/file", headers={"Range": "bytes=5000-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */1024"
+
+
+def test_if_range(client):
+    etag = client.get("/file").headers["etag"]
+    assert client.get("/file", headers={"Range": "bytes=0-9", "If-Range": etag}).status_code == 206
+    response = client.get("/file", headers={"Range": "bytes=0-9", "If-Range": '"changed"'})
+    assert response.status_code == 200 and len(response.content) == 1024
@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+import services.snapshots as service_snapshots
+from exceptions import ODSException
+
+CATALOG_ID = "owner:catalog"
+
+
+@pytest.fixture(autouse=True)
+def snapshot_path(monkeypatch, tmp_path):
+    monkeypatch.setattr(service_snapshots.config, "SNAPSHOT_PATH", str(tmp_path))
+    return tmp_path
+
+
+def _make_version(version: int, variant: str = "data.csv") -> str:
+    path = os.path.join(service_snapshots._catalog_path(CATALOG_ID), str(version))
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, variant), "w") as snapshot:
+        snapshot.write("id\n")
+    return path
+
+
+def _versions() -> list:
+    return sorted(int(entry.name) for entry in os.scandir(service_snapshots._catalog_path(CATALOG_ID)))
+
+
+def test_previous_version_is_kept():
+    for version in (3, 4, 5, 6):
+        _make_version(version)
+    service_snapshots._remove_old_versions(CATALOG_ID, 6)
+    assert _versions() == [5, 6]
+
+
+def test_only_version_is_kept():
+    _make_version(1)
+    service_snapshots._remove_old_versions(CATALOG_ID, 1)
+    assert _versions() == [1]
+
+
+def test_deleted_catalog_is_removed(monkeypatch):
+    worker = service_snapshots.SnapshotWorker()
+    monkeypatch.setattr(service_snapshots, "_worker", worker)
+    _make_version(2)
+    worker.schedule(CATALOG_ID, "data.csv", 0)
+    worker.schedule("owner:other", "data.csv", 0)
+    service_snapshots.remove_catalog(CATALOG_ID)
+    assert not os.path.exists(service_snapshots._catalog_path(CATALOG_ID))
+    assert list(worker._scheduled) == [("owner:other", "data.csv")]
+
+
+def test_build_of_deleted_catalog_leaves_no_directory(monkeypatch):
+    def get_catalog(catalog_id):
+        raise ODSException("Not found")
+
+    monkeypatch.setattr(service_snapshots.service_changes, "get_version", lambda catalog_id: (3, 0.0))
+    monkeypatch.setattr(service_snapshots.service_datacatalog, "get_catalog", get_catalog)
+    with pytest.raises(ODSException):
+        service_snapshots.build_snapshot(CATALOG_ID, "data.csv")
+    assert not os.path.exists(service_snapshots._catalog_path(CATALOG_ID))
@@ -0,0 +1,117 @@
+import pytest
+from pydantic import ValidationError
+
+import services.timeseries as service_timeseries
+from exceptions import ODSException
+from schemas import (ContextDefinition, DataCatalogCreate, QueryRequest, Resample, TimeFilter, TypeAttribute,
+                     TypeCatalog)
+
+DAY = 24 * 3600 * 1000
+CATALOG = DataCatalogCreate(
+    id="owner:sensors", owner="owner", name="sensors", description="Sensors", is_public=True,
+    type=TypeCatalog.TIMESERIES, tags=[], catalog_context=[],
+    entities_context=[ContextDefinition(context_key="temperature", context_description="", context_type=TypeAttribute.DOUBLE)]
+)
+
+
+def test_time_filter_bounds():
+    params = service_timeseries._get_ql_params(TimeFilter(start_date=1700000000000, end_date=1700003600000))
+    assert params == {"fromDate": "2023-11-14T22:13:20+00:00", "toDate": "2023-11-14T23:13:20+00:00"}
+
+
+def test_zero_bounds_are_open():
+    time_filter = TimeFilter(start_date=0, end_date=0, aggr_method="avg", aggr_period="hour")
+    assert time_filter.start_date is None and time_filter.end_date is None
+    assert service_timeseries._get_ql_params(time_filter) == {"aggrMethod": "avg", "aggrPeriod": "hour"}
+
+
+def test_aggr_period_requires_aggr_method():
+    with pytest.raises(ValidationError):
+        TimeFilter(aggr_period="hour")
+    assert TimeFilter(aggr_method="max").aggr_period is None
+
+
+def _resample_query(start_date, end_date, **kwargs) -> QueryRequest:
+    return QueryRequest(catalog_id=CATALOG.id, entities=[], fields=[], resample=Resample(step=60),
+                        time_filter=TimeFilter(start_date=start_date, end_date=end_date), **kwargs)
+
+
+@pytest.fixture
+def fetched(monkeypatch):
+    fetched = []
+    monkeypatch.setattr(service_timeseries, "count_entities", lambda *args, **kwargs: 1000)
+    monkeypatch.setattr(service_timeseries, "_iter_entity_ids", lambda *args: fetched.append(args) or iter([]))
+    monkeypatch.setattr(service_timeseries.config, "RESAMPLE_MAX_POINTS", 100000)
+    return fetched
+
+
+def test_too_large_resample_fails_before_fetching(fetched):
+    # A day of minutes (1441 points) of 1000 entities
+    with pytest.raises(ODSException):
+        next(service_timeseries.iter_resampled(_resample_query(1, DAY), CATALOG))
+    assert fetched == []
+
+
+def test_resample_estimate_counts_the_requested_page(fetched):
+    list(service_timeseries.iter_resampled(_resample_query(1, DAY, limit=50), CATALOG))
+    assert len(fetched) == 1
+
+
+def test_resample_without_bounds_is_checked_after_fetching(fetched):
+    list(service_timeseries.iter_resampled(_resample_query(None, None), CATALOG))
+    assert len(fetched) == 1
+
+
+class _QLResponse:
+    def __init__(self, body: dict = None, status_code: int = 200):
+        self.body = body
+        self.status_code = status_code
+        self.ok = status_code < 400
+
+    def json(self) -> dict:
+        return self.body
+
+
+def test_bounded_query_without_resample(monkeypatch):
+    # A year of data of a sensor, retrieved without resampling
+    entity_id = f"urn:ngsi-ld:{CATALOG.id}:owner:s1"
+    requests = []
+
+    def get_entity_attrs(entity_id, attributes, params):
+        requests.append(params)
+        return _QLResponse({"index": ["2023-01-01T00:00:00+00:00"], "attributes": [{"attrName": "temperature", "values": [21.5]}]})
+
+    monkeypatch.setattr(service_timeseries, "iter_entity_pages", lambda *args, **kwargs: iter([[{"id": entity_id}]]))
+    monkeypatch.setattr(service_timeseries, "get_entity_attrs", get_entity_attrs)
+    query = QueryRequest(catalog_id=CATALOG.id, entities=[], fields=[],
+                         time_filter=TimeFilter(start_date=1672531200000, end_date=1704067200000))
+    pages = list(service_timeseries.iter_data(query, CATALOG))
+    assert pages[0][0]["temperature"] == [21.5]
+    assert requests[0]["fromDate"] == "2023-01-01T00:00:00+00:00"
+
+
+def _page(start: int, size: int) -> _QLResponse:
+    return _QLResponse({"index": list(range(start, start + size)),
+                        "attributes": [{"attrName": "temperature", "values": [1.0] * size}]})
+
+
+def test_fetch_series_follows_the_pagination(monkeypatch):
+    monkeypatch.setattr(service_timeseries.config, "QL_PAGE_SIZE", 2)
+    pages = [_page(0, 2), _page(2, 1)]
+    monkeypatch.setattr(service_timeseries, "get_entity_attrs", lambda entity_id, attributes, params: pages.pop(0))
+    index, columns = service_timeseries._fetch_series("e1", ["temperature"], {})
+    assert index == [0, 1, 2] and columns["temperature"] == [1.0, 1.0, 1.0]
+
+
+def test_fetch_series_without_records(monkeypatch):
+    monkeypatch.setattr(service_timeseries, "get_entity_attrs", lambda *args: _QLResponse(status_code=404))
+    assert service_timeseries._fetch_series("e1", ["temperature"], {}) == ([], {"temperature": []})
+
+
+def test_fetch_series_fails_on_quantumleap_errors(monkeypatch):
+    # The second page fails, the series must not be returned truncated
+    monkeypatch.setattr(service_timeseries.config, "QL_PAGE_SIZE", 2)
+    pages = [_page(0, 2), _QLResponse(status_code=503)]
+    monkeypatch.setattr(service_timeseries, "get_entity_attrs", lambda entity_id, attributes, params: pages.pop(0))
+    with pytest.raises(ODSException):
+        service_timeseries._fetch_series("e1", ["temperature"], {})
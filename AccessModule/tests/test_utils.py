@@ -0,0 +1,52 @@
+import pytest
+
+import repository.fiware as fiware_repository
+import utils
+from exceptions import FiwareException
+
+
+class _Response:
+    def __init__(self, page: list):
+        self.page = page
+
+    def json(self) -> list:
+        return self.page
+
+
+def test_iter_entity_pages_follows_the_offset(monkeypatch):
+    entities = [{"id": f"e{index}"} for index in range(5)]
+
+    def get_entity_full(*args, limit=None, offset=None, **kwargs):
+        return _Response(entities[offset:offset + limit])
+
+    monkeypatch.setattr(fiware_repository, "get_entity_full", get_entity_full)
+    pages = list(fiware_repository.iter_entity_pages("owner:catalog", page_size=2))
+    assert pages == [entities[0:2], entities[2:4], entities[4:5]]
+
+
+def test_iter_entity_pages_raises_when_orion_fails(monkeypatch):
+    def get_entity_full(*args, limit=None, offset=None, **kwargs):
+        # Orion answers the first page and fails on the second one
+        return _Response([{"id": "e0"}, {"id": "e1"}]) if not offset else None
+
+    monkeypatch.setattr(fiware_repository, "get_entity_full", get_entity_full)
+    pages = fiware_repository.iter_entity_pages("owner:catalog", page_size=2)
+    assert next(pages) == [{"id": "e0"}, {"id": "e1"}]
+    with pytest.raises(FiwareException):
+        next(pages)
+
+
+def test_iter_table_csv_pivots_the_columns():
+    pages = [[{"id": "t1", "a": [1, 2], "b": [3]}]]
+    assert "".join(utils.iter_table_csv(pages)).splitlines() == ["id,a,b", "t1,1,3", "t1,2,"]
+
+
+def test_iter_table_csv_header_is_the_columns_and_first_page():
+    # A key that only appears in a later page is not written, the columns of the catalog are
+    pages = [[{"id": "t1", "a": [1]}], [{"id": "t2", "a": [2], "b": [5], "extra": [9]}]]
+    assert "".join(utils.iter_table_csv(pages, ["id", "a", "b"])).splitlines() == ["id,a,b", "t1,1,", "t2,2,5"]
+
+
+def test_iter_json_csv_keeps_the_given_columns():
+    pages = [[{"id": "e1", "a": 1}], [{"id": "e2", "b": 2}]]
+    assert "".join(utils.iter_json_csv(pages, ["id", "a", "b"])).splitlines() == ["id,a,b", "e1,1,", "e2,,2"]